@@ -1,150 +1,16 @@
 import asyncio
-import pandas as pd
-from asyncua import Client, ua
-import datetime
-import csv
+import os
+import threading
 import tkinter as tk
+from collections import deque
 from tkinter import ttk, messagebox
+from log_store import ParquetSink, export_csv
+from opcua_client import OPCUAClient
 
-class OPCUAClient:
-    def __init__(self, excel_file):
-        self.servers = []
-        self.subscriptions = []
-        self.csv_file = 'opcua_data_log.csv'
-        self.node_info = self.load_node_info(excel_file)
-        self.logged_data = []
-
-    def load_node_info(self, file_path):
-        """
-        Load node information from the Excel file.
-        """
-        df = pd.read_excel(file_path, sheet_name='default', engine='openpyxl')
-        nodes = []
-        for _, row in df.iterrows():
-            nodes.append({
-                "Name": row["Name"],
-                "ns": int(row["ns"]),
-                "i": int(row["i"]),
-                "Value": row.get("Value", None)
-            })
-        return nodes
-
-    async def connect_to_server(self, server_url):
-        """
-        Connects to the given OPC UA server and returns the client object.
-        """
-        try:
-            client = Client(server_url)
-            await client.connect()
-            print(f"Connected to server: {server_url}")
-            return client
-        except Exception as e:
-            print(f"Failed to connect to {server_url}. Error: {e}")
-            return None
-
-    async def disconnect_from_server(self):
-        """
-        Disconnects from all connected servers.
-        """
-        for client in self.servers:
-            try:
-                await client.disconnect()
-                print(f"Disconnected from server: {client.server_url}")
-            except Exception as e:
-                print(f"Failed to disconnect from server: {e}")
-        self.servers.clear()
-        messagebox.showinfo("Disconnected", "Successfully disconnected from all servers.")
-
-    async def add_server(self, server_url):
-        """
-        Adds a server to the list of servers and connects to it.
-        """
-        client = await self.connect_to_server(server_url)
-        if client:
-            self.servers.append(client)
-            await self.recognize_and_summarize_namespaces(client)
-
-    async def recognize_and_summarize_namespaces(self, client):
-        """
-        Scans and summarizes namespaces across the connected servers.
-        """
-        try:
-            namespaces = await client.get_namespace_array()
-            print(f"Namespaces for {client.server_url}:")
-            for index, ns in enumerate(namespaces):
-                print(f"Namespace Index {index} (URI: {ns})")
-            return namespaces
-        except Exception as e:
-            print(f"Error summarizing namespaces for {client.server_url}: {e}")
-
-    async def subscribe_and_monitor_nodes(self):
-        """
-        Subscribes to nodes for each connected server and monitors them in real-time.
-        """
-        tasks = [self.monitor_nodes(client) for client in self.servers]
-        await asyncio.gather(*tasks)
-
-    async def monitor_nodes(self, client):
-        """
-        Subscribes to nodes based on the information loaded from the Excel file.
-        """
-        try:
-            handler = self.SubscriptionHandler(self)
-            subscription = await client.create_subscription(500, handler)
-            self.subscriptions.append(subscription)
-
-            for node_info in self.node_info:
-                node = client.get_node(ua.NodeId(node_info["i"], node_info["ns"]))
-                try:
-                    node_class = await node.read_node_class()
-                    if node_class == ua.NodeClass.Variable:
-                        print(f"Subscribed to node: {node_info['Name']} (NodeId: ns={node_info['ns']};i={node_info['i']})")
-                        await subscription.subscribe_data_change(node)
-                except Exception as e:
-                    print(f"Failed to subscribe to node {node_info['Name']}: {e}")
-        except Exception as e:
-            print(f"Error setting up subscription for {client.server_url}: {e}")
-
-    def log_data(self, node, val):
-        """
-        Logs node value changes to a CSV file in real-time with a timestamp.
-        """
-        timestamp = datetime.datetime.now()
-        node_info = next((info for info in self.node_info if info['i'] == node.nodeid.Identifier and info['ns'] == node.nodeid.NamespaceIndex), {"Name": "Unknown", "Node": str(node)})
-
-        data_entry = {
-            "timestamp": timestamp,
-            "Name": node_info["Name"],
-            "Node": f"ns={node.nodeid.NamespaceIndex};i={node.nodeid.Identifier}",
-            "value": val
-        }
-        self.logged_data.append(data_entry)
-        print(f"Logged data: {data_entry}")
-
-        # Append to CSV file
-        with open(self.csv_file, mode='a', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow([timestamp, node_info["Name"], data_entry["Node"], val])
-
-        # Update the GUI with the latest logged data
-        app.update_log_display(data_entry)
-
-    class SubscriptionHandler:
-        def __init__(self, client_obj):
-            self.client_obj = client_obj
-
-        def datachange_notification(self, node, val, data):
-            """
-            Handles data change notifications.
-            """
-            print(f"Data change detected for node: {node}")
-            self.client_obj.log_data(node, val)
-
-        def event_notification(self, event):
-            """
-            Handles events.
-            """
-            print(f"New event: {event}")
+# The log display is refreshed every UI_REFRESH_MS with at most UI_MAX_ENTRIES new entries
+UI_REFRESH_MS = int(os.getenv("OPCUA_UI_REFRESH_MS", 250))
+UI_MAX_ENTRIES = int(os.getenv("OPCUA_UI_MAX_ENTRIES", 200))
+UI_MAX_LINES = int(os.getenv("OPCUA_UI_MAX_LINES", 1000))
 
 class OPCUAGUI(tk.Tk):
     def __init__(self, client):
@@ -156,12 +22,20 @@ class OPCUAGUI(tk.Tk):
         # Create GUI components
         self.create_widgets()
 
-        # Create an asyncio loop for running async tasks
-        self.loop = asyncio.get_event_loop()
+        # Latest entries waiting to be displayed; older ones are coalesced into a count
+        self.pending = deque(maxlen=UI_MAX_ENTRIES)
+        self.received = 0
+        self.displayed = 0
+        # Coroutines submitted to the asyncio loop and what to do in the GUI when they finish
+        self.tasks = []
+
+        # Run the asyncio loop on its own thread so collection never waits for Tk
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever, name="opcua-loop", daemon=True)
+        self.loop_thread.start()
 
-        # Run the loop in the background
         self.protocol("WM_DELETE_WINDOW", self.on_closing)
-        self.periodic_async_call()
+        self.refresh()
 
     def create_widgets(self):
         # Server Entry Field and Button
@@ -193,15 +67,27 @@ class OPCUAGUI(tk.Tk):
         self.export_button = tk.Button(self, text="Save Data to CSV", command=self.export_to_csv)
         self.export_button.pack(pady=5)
 
+    def run_async(self, coroutine, on_done=None):
+        """
+        Runs a coroutine on the asyncio thread and calls on_done(future) in the GUI when it finishes.
+        """
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        self.tasks.append((future, on_done))
+
     def add_server(self):
         server_url = self.server_entry.get().strip()
         if server_url:
-            self.loop.create_task(self.client.add_server(server_url))
+            self.run_async(self.client.add_server(server_url), lambda future: self.show_server_added(server_url, future))
+
+    def show_server_added(self, server_url, future):
+        if future.exception() is None and future.result() is not None:
             messagebox.showinfo("Server Added", f"Successfully connected to {server_url}")
+        else:
+            messagebox.showerror("Server Not Added", f"Could not connect to {server_url}")
 
     def start_monitoring(self):
         # Start monitoring for 60 seconds, then disconnect
-        self.loop.create_task(self.monitor_for_interval())
+        self.run_async(self.monitor_for_interval(), self.show_disconnected)
 
     async def monitor_for_interval(self):
         await self.client.subscribe_and_monitor_nodes()
@@ -209,46 +95,101 @@ class OPCUAGUI(tk.Tk):
         await self.client.disconnect_from_server()
 
     def disconnect_from_server(self):
-        self.loop.create_task(self.client.disconnect_from_server())
+        self.run_async(self.client.disconnect_from_server(), self.show_disconnected)
+
+    def show_disconnected(self, future):
+        messagebox.showinfo("Disconnected", "Successfully disconnected from all servers.")
 
     def update_log_display(self, data_entry):
         """
-        Updates the log display in the GUI with new data.
-        """
-        self.log_display.insert(tk.END, f"{data_entry['timestamp']} - {data_entry['Name']} - {data_entry['Node']} - {data_entry['value']}\n")
-        self.log_display.see(tk.END)  # Scroll to the latest entry
+        Queues a logged entry for the next display refresh; called on the asyncio thread.
+        """
+        self.pending.append(data_entry)
+        self.received += 1
+
+    def refresh(self):
+        """
+        Shows the queued entries in one insert, caps the display and finishes completed tasks.
+        """
+        entries = []
+        while self.pending:
+            entries.append(self.pending.popleft())
+        if entries:
+            lines = []
+            coalesced = self.received - self.displayed - len(entries)
+            if coalesced > 0:
+                lines.append(f"... {coalesced} entries not shown ...\n")
+            lines.extend(f"{data_entry['timestamp']} - {data_entry['Name']} - {data_entry['Node']} - {data_entry['value']}\n"
+                         for data_entry in entries)
+            self.displayed = self.received
+            self.log_display.insert(tk.END, "".join(lines))
+            line_count = int(self.log_display.index("end-1c").split(".")[0])
+            if line_count > UI_MAX_LINES:
+                self.log_display.delete("1.0", f"{line_count - UI_MAX_LINES + 1}.0")
+            self.log_display.see(tk.END)  # Scroll to the latest entry
+
+        running = []
+        for future, on_done in self.tasks:
+            if not future.done():
+                running.append((future, on_done))
+            elif on_done is not None:
+                on_done(future)
+        self.tasks = running
+
+        self.after(UI_REFRESH_MS, self.refresh)
 
     def export_to_csv(self):
         """
         Export the logged data to a CSV file.
         """
-        messagebox.showinfo("Export", "Data saved to opcua_data_log.csv")
+        self.run_async(self.export_log(), self.show_exported)
 
-    def periodic_async_call(self):
+    async def export_log(self):
         """
-        Periodically runs the asyncio event loop while the Tkinter main loop is running.
+        Finish the current log file, export the log to CSV and resume logging.
+
+        Returns the export file and its row count, or None if the log already is a CSV file.
         """
-        self.loop.call_soon(self.loop.stop)
-        self.loop.run_forever()
-        self.after(100, self.periodic_async_call)  # Adjust the timing as needed
+        sink = self.client.sink
+        if not isinstance(sink, ParquetSink):
+            return None
+        export_file = "opcua_data_log_export.csv"
+        # close() joins the writer thread; run it off the loop so subscriptions and keep-alives continue
+        await self.loop.run_in_executor(None, sink.close)
+        try:
+            rows = await self.loop.run_in_executor(None, export_csv, sink.path, export_file)
+        finally:
+            sink.start()
+        return export_file, rows
+
+    def show_exported(self, future):
+        if future.exception() is not None:
+            messagebox.showerror("Export", f"Export failed: {future.exception()}")
+        elif future.result() is None:
+            messagebox.showinfo("Export", f"Data saved to {self.client.csv_file}")
+        else:
+            export_file, rows = future.result()
+            messagebox.showinfo("Export", f"{rows} rows saved to {export_file}")
 
     def on_closing(self):
         """
         Clean up when the GUI window is closed.
         """
-        self.loop.stop()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join(timeout=5)
+        self.client.sink.close()
         self.destroy()
 
 if __name__ == "__main__":
     # Update the path to your Excel file here
     excel_file = r'BL4R3-rev01-Diagnostic_NodeID_List-scenario.xlsx'
-    client = OPCUAClient(excel_file)
+    # The GUI shows the samples, so they are not printed as well
+    client = OPCUAClient(excel_file, verbose=False)
 
-    # Create the CSV file with headers
-    with open(client.csv_file, mode='w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(["timestamp", "Name", "Node", "value"])
+    # Create the CSV file with headers and start its writer thread
+    client.sink.start(truncate=True)
 
     # Create and start the GUI
     app = OPCUAGUI(client)
+    client.display = app.update_log_display
     app.mainloop()
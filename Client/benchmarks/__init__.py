@@ -0,0 +1,2 @@
+# Benchmarks for the OPC UA client. Run them from the Client directory, e.g.
+#     python -m benchmarks.bench_analytics
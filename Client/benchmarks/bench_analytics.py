@@ -0,0 +1,187 @@
+import argparse
+import glob
+import json
+import os
+import pickle
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+# The Client directory, where the benchmark runs and its modules live
+CLIENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Rows per row group of the generated log, like the batches of the client's log sink
+ROW_GROUP_ROWS = 500
+# Position values of the generated point machines
+POSITIONS = ["0", "1", "2", "3"]
+
+# Write a synthetic Parquet log in the layout of the client's ParquetSink
+def generate_log(log_dir, days, rows_per_day, nodes, positions, seed):
+    """
+    Write days of samples of a number of nodes, one file per hour in date partitions.
+
+    The first positions nodes are named "position" and walk between four
+    values; the others log a numeric measurement.
+
+    Returns:
+        int: The number of rows written.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from log_store import LOG_SCHEMA
+
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp("2024-09-01").value
+    names = np.array(["position" if node < positions else f"measurement{node}" for node in range(nodes)])
+    state = rng.integers(0, 4, nodes)
+    rows = 0
+    for day in range(days):
+        for hour in range(24):
+            count = rows_per_day // 24
+            hour_start = start + (day * 24 + hour) * 3600 * 10**9
+            t = np.sort(rng.integers(hour_start, hour_start + 3600 * 10**9, count))
+            node = rng.integers(0, nodes, count)
+            # Positions move to a neighbouring value, measurements are noise around 50
+            step = rng.choice([-1, 0, 1], count)
+            values = np.where(node < positions, 0, np.round(rng.normal(50, 10, count), 2)).astype(object)
+            for index in np.flatnonzero(node < positions):
+                state[node[index]] = (state[node[index]] + step[index]) % 4
+                values[index] = POSITIONS[state[node[index]]]
+            text = np.array([str(value) for value in values], dtype=object)
+            number = np.array([float(value) for value in values])
+            table = pa.Table.from_arrays([
+                pa.array(t.astype("datetime64[ns]").astype("datetime64[us]"), pa.timestamp("us")),
+                pa.array(names[node], pa.string()).dictionary_encode(),
+                pa.array(np.full(count, 4), pa.uint16()),
+                pa.array(6000 + node, pa.int64()),
+                pa.array(text, pa.string()),
+                pa.array(number, pa.float64()),
+            ], schema=LOG_SCHEMA)
+            date = pd.Timestamp(hour_start)
+            partition = os.path.join(log_dir, f"date={date:%Y-%m-%d}")
+            os.makedirs(partition, exist_ok=True)
+            pq.write_table(table, os.path.join(partition, f"part-{date:%H%M%S}-000000.parquet"),
+                           row_group_size=ROW_GROUP_ROWS, compression="zstd")
+            rows += count
+    return rows
+
+# Answer the queries by loading the whole log into pandas
+def query_full(log_dir, start, end):
+    files = sorted(glob.glob(os.path.join(log_dir, "date=*", "part-*.parquet")))
+    df = pd.concat([pd.read_parquet(path) for path in files], ignore_index=True)
+    df["node"] = "ns=" + df["ns"].astype(str) + ";i=" + df["i"].astype(str)
+    df = df.sort_values(["node", "timestamp"], kind="stable")
+    previous = df.groupby("node")["value"].shift()
+    df["change"] = previous.notna() & (df["value"] != previous)
+    window = df[(df["timestamp"] >= start) & (df["timestamp"] < end)]
+    aggregate = window.groupby("node").agg(count=("value", "size"), min=("value_num", "min"),
+                                           max=("value_num", "max"), last=("value", "last"),
+                                           changes=("change", "sum")).reset_index()
+    positions = df[df["Name"] == "position"].copy()
+    following = positions.groupby("node")["timestamp"].shift(-1).fillna(df["timestamp"].max())
+    positions["seconds"] = (following - positions["timestamp"]).dt.total_seconds()
+    dwell = positions.groupby(["node", "value"], as_index=False)["seconds"].sum()
+    return aggregate, dwell
+
+# Answer the queries with the indexed analytics
+def query_indexed(log_dir, start, end):
+    from log_analytics import LogAnalytics
+
+    analytics = LogAnalytics(log_dir)
+    started = time.perf_counter()
+    indexed = analytics.refresh()
+    timings = {"index_seconds": time.perf_counter() - started, "blocks_indexed": indexed}
+    started = time.perf_counter()
+    aggregate = analytics.aggregate(start, end)
+    timings["aggregate_seconds"] = time.perf_counter() - started
+    timings["aggregate_blocks_read"] = analytics.counters["blocks_read"]
+    started = time.perf_counter()
+    dwell = analytics.dwell()
+    timings["dwell_seconds"] = time.perf_counter() - started
+    timings["blocks"] = len(analytics.blocks)
+    return aggregate, dwell[["node", "value", "seconds"]], timings
+
+# Run one mode in this process and report its timings and peak memory
+def run_mode(mode, log_dir, start, end, output):
+    started = time.perf_counter()
+    timings = {}
+    if mode == "full":
+        aggregate, dwell = query_full(log_dir, start, end)
+    else:
+        aggregate, dwell, timings = query_indexed(log_dir, start, end)
+    timings["total_seconds"] = time.perf_counter() - started
+    timings["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    with open(output, "wb") as file:
+        pickle.dump((aggregate, dwell, timings), file)
+
+# Compare the results of two modes
+def compare(reference, result):
+    aggregate = reference[0].merge(result[0], on="node", suffixes=("_full", ""))
+    dwell = reference[1].merge(result[1], on=["node", "value"], suffixes=("_full", ""))
+    return {
+        "aggregate_rows": (len(reference[0]), len(result[0])),
+        "aggregate_equal": bool(len(aggregate) == len(reference[0])
+                                and (aggregate["count_full"] == aggregate["count"]).all()
+                                and np.allclose(aggregate["min_full"], aggregate["min"])
+                                and np.allclose(aggregate["max_full"], aggregate["max"])
+                                and (aggregate["last_full"] == aggregate["last"]).all()
+                                and (aggregate["changes_full"] == aggregate["changes"]).all()),
+        "dwell_equal": bool(len(dwell) == len(reference[1])
+                            and np.allclose(dwell["seconds_full"], dwell["seconds"], atol=1e-6)),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare indexed log analytics with loading the whole log.")
+    parser.add_argument("--days", type=int, default=28)
+    parser.add_argument("--rows-per-day", type=int, default=240000)
+    parser.add_argument("--nodes", type=int, default=800)
+    parser.add_argument("--positions", type=int, default=240)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mode", choices=["full", "indexed"], help=argparse.SUPPRESS)
+    parser.add_argument("--log-dir", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    # One day in the middle of the log
+    start = pd.Timestamp("2024-09-01") + pd.Timedelta(days=args.days // 2)
+    end = start + pd.Timedelta(days=1)
+    if args.mode:
+        run_mode(args.mode, args.log_dir, start, end, args.output)
+        return
+
+    work_dir = tempfile.mkdtemp(prefix="bench_analytics_")
+    try:
+        log_dir = os.path.join(work_dir, "log")
+        started = time.perf_counter()
+        rows = generate_log(log_dir, args.days, args.rows_per_day, args.nodes, args.positions, args.seed)
+        size = sum(os.path.getsize(path) for path in glob.glob(os.path.join(log_dir, "date=*", "*.parquet")))
+        print(f"Log: {rows} rows of {args.nodes} nodes over {args.days} days, {size / 2**20:.0f} MB Parquet "
+              f"(generated in {time.perf_counter() - started:.0f} s)")
+        print(f"Queries: aggregate of all nodes on {start:%Y-%m-%d}, dwell of the position nodes over the whole log")
+
+        results = {}
+        for label, mode in (("load everything", "full"), ("indexed, cold", "indexed"), ("indexed, warm", "indexed")):
+            output = os.path.join(work_dir, f"{label}.pickle")
+            subprocess.run([sys.executable, "-m", "benchmarks.bench_analytics", "--mode", mode, "--log-dir", log_dir,
+                            "--output", output, "--days", str(args.days)], check=True, cwd=CLIENT_DIR)
+            with open(output, "rb") as file:
+                results[label] = pickle.load(file)
+
+        print(f"  {'':<16} {'total s':>8} {'index s':>8} {'aggregate s':>12} {'blocks read':>12} {'dwell s':>8} "
+              f"{'peak RSS MB':>12}")
+        for label, (_, _, timings) in results.items():
+            print(f"  {label:<16} {timings['total_seconds']:>8.2f} {timings.get('index_seconds', 0):>8.2f} "
+                  f"{timings.get('aggregate_seconds', float('nan')):>12.2f} "
+                  f"{str(timings.get('aggregate_blocks_read', '-')) + ' / ' + str(timings.get('blocks', '-')):>12} "
+                  f"{timings.get('dwell_seconds', float('nan')):>8.2f} {timings['peak_rss_mb']:>12.0f}")
+        print(f"  Same results as loading everything: {json.dumps(compare(results['load everything'], results['indexed, warm']))}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import abc
+import csv
+import os
+import queue
+import threading
+import time
+
+# Batching of the CSV log; a batch is written when it is full or the interval has passed
+FLUSH_SIZE = int(os.getenv("OPCUA_CSV_FLUSH_SIZE", 500))
+FLUSH_INTERVAL = float(os.getenv("OPCUA_CSV_FLUSH_INTERVAL", 1.0))
+QUEUE_SIZE = int(os.getenv("OPCUA_CSV_QUEUE_SIZE", 100000))
+
+CSV_HEADER = ["timestamp", "Name", "Node", "value"]
+
+class BatchSink(abc.ABC):
+    """
+    Writes log rows from a background thread in batches.
+
+    write() only puts the row on a bounded queue, so it can be called from
+    the subscription handler without touching the file. The writer thread
+    takes rows off the queue and hands them to write_rows() in batches of up
+    to flush_size rows, at least every flush_interval seconds. Rows that
+    arrive while the queue is full are dropped and counted. When the sink is
+    closed, the writer thread writes the last batch and calls finish(), so
+    only that thread ever touches the file.
+    """
+
+    def __init__(self, path, flush_size=FLUSH_SIZE, flush_interval=FLUSH_INTERVAL, queue_size=QUEUE_SIZE):
+        self.path = path
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.counters = {"written": 0, "dropped": 0, "batches": 0}
+        self.thread = None
+
+    def start(self, truncate=False):
+        """
+        Start the writer thread.
+
+        Parameters:
+            truncate (bool): Start a new log instead of appending to the existing one.
+
+        Returns:
+            None
+        """
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self.run, name="csv-sink", daemon=True)
+            self.thread.start()
+
+    def write(self, row):
+        """
+        Queue a row for the writer thread without blocking.
+
+        Parameters:
+            row (list): The CSV row.
+
+        Returns:
+            bool: False if the queue was full and the row was dropped.
+        """
+        try:
+            self.queue.put_nowait(row)
+            return True
+        except queue.Full:
+            self.counters["dropped"] += 1
+            return False
+
+    def run(self):
+        """
+        Writer thread: collect rows into batches and append them to the file.
+        """
+        batch = []
+        deadline = None
+        while True:
+            timeout = self.flush_interval if deadline is None else max(deadline - time.monotonic(), 0.0)
+            try:
+                row = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                self.flush(batch)
+                batch, deadline = [], None
+                continue
+            if row is None:
+                self.flush(batch)
+                self.finish()
+                return
+            batch.append(row)
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+            if len(batch) >= self.flush_size or time.monotonic() >= deadline:
+                self.flush(batch)
+                batch, deadline = [], None
+
+    def flush(self, batch):
+        """
+        Write a batch of rows, counting them as written or dropped.
+
+        Parameters:
+            batch (list[list]): The rows to write, possibly none.
+
+        Returns:
+            None
+        """
+        if not batch:
+            return
+        try:
+            self.write_rows(batch)
+            self.counters["written"] += len(batch)
+            self.counters["batches"] += 1
+        except OSError as e:
+            self.counters["dropped"] += len(batch)
+            print(f"Failed to write {len(batch)} rows to {self.path}: {e}")
+
+    @abc.abstractmethod
+    def write_rows(self, batch):
+        """
+        Write a non-empty batch of rows; implemented by the concrete sinks.
+        """
+
+    def finish(self):
+        """
+        Finish the log after the last batch, on the writer thread; nothing to do by default.
+        """
+
+    def close(self, timeout=5.0):
+        """
+        Write the queued rows and stop the writer thread.
+
+        If the thread is still writing after the timeout, it finishes the
+        log in the background; the sink is not touched from this thread.
+
+        Parameters:
+            timeout (float): How long to wait for the queued rows to be written.
+
+        Returns:
+            None
+        """
+        if self.thread is None or not self.thread.is_alive():
+            # No writer thread is running, so the log can be finished here
+            self.finish()
+            return
+        self.queue.put(None)
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            print(f"Still writing to {self.path} after {timeout:g} s; the rest is written in the background")
+            return
+        self.thread = None
+
+class CsvSink(BatchSink):
+    """
+    Appends log rows to a CSV file from a background thread.
+    """
+
+    def start(self, truncate=False):
+        """
+        Start the writer thread, optionally starting a new file with the header.
+
+        Parameters:
+            truncate (bool): Replace the file with one holding only the header.
+
+        Returns:
+            None
+        """
+        if truncate:
+            with open(self.path, mode='w', newline='') as file:
+                csv.writer(file).writerow(CSV_HEADER)
+        super().start()
+
+    def write_rows(self, batch):
+        """
+        Append a batch of rows to the file.
+        """
+        with open(self.path, mode='a', newline='') as file:
+            csv.writer(file).writerows(batch)
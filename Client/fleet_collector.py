@@ -0,0 +1,269 @@
+import asyncio
+import os
+import random
+import sys
+import time
+
+from asyncua import Client, ua
+
+from opcua_client import OPCUAClient
+
+# Endpoints to collect from, comma separated or "@file" with one URL per line
+ENDPOINTS = os.getenv("OPCUA_ENDPOINTS", "opc.tcp://localhost:4840/EULYNX")
+
+# Connection handling of the collector
+MAX_CONCURRENCY = int(os.getenv("OPCUA_MAX_CONCURRENCY", 20))
+CONNECT_TIMEOUT = float(os.getenv("OPCUA_CONNECT_TIMEOUT", 10))
+BACKOFF_INITIAL = float(os.getenv("OPCUA_BACKOFF_INITIAL", 1))
+BACKOFF_MAX = float(os.getenv("OPCUA_BACKOFF_MAX", 60))
+WATCHDOG_INTERVAL = float(os.getenv("OPCUA_WATCHDOG_INTERVAL", 5))
+HEALTH_INTERVAL = float(os.getenv("OPCUA_HEALTH_INTERVAL", 30))
+
+# Parse the endpoint specification
+def parse_endpoints(spec=ENDPOINTS):
+    """
+    Parse an endpoint specification into a list of URLs.
+
+    Parameters:
+        spec (str): URLs separated by commas, or "@path" to read one URL per line.
+
+    Returns:
+        list[str]: The endpoint URLs, without duplicates.
+    """
+    if spec.startswith("@"):
+        with open(spec[1:]) as file:
+            urls = [line.strip() for line in file if line.strip() and not line.startswith("#")]
+    else:
+        urls = [url.strip() for url in spec.split(",") if url.strip()]
+    return list(dict.fromkeys(urls))
+
+class Endpoint:
+    """
+    Connection state and health of one field element endpoint.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.client = None
+        self.subscriptions = []
+        self.handler = None
+        self.notifications = 0
+        self.status = "pending"
+        self.connects = 0
+        self.failures = 0
+        self.last_error = None
+        self.connected_since = None
+        self.backoff = BACKOFF_INITIAL
+
+    def health(self):
+        """
+        Summarize the state of the endpoint.
+
+        Returns:
+            dict: Status, connection counts, notification counts and last error.
+        """
+        last = self.handler.last_notification if self.handler else None
+        return {
+            "url": self.url,
+            "status": self.status,
+            "connects": self.connects,
+            "failures": self.failures,
+            "uptime": time.monotonic() - self.connected_since if self.connected_since else 0.0,
+            "notifications": self.notifications + (self.handler.notifications if self.handler else 0),
+            "idle": time.monotonic() - last if last else None,
+            "last_error": self.last_error,
+        }
+
+class FleetCollector:
+    """
+    Collects datachanges from many endpoints through one OPCUAClient.
+
+    Every endpoint is supervised by its own task. Connecting and setting up
+    subscriptions is limited to max_concurrency endpoints at a time. A
+    watchdog reads the server state of every connected endpoint; when the
+    read fails the connection is dropped and re-established with exponential
+    backoff and jitter, and the subscriptions are recreated on the new
+    session.
+    """
+
+    def __init__(self, opcua_client, urls, max_concurrency=MAX_CONCURRENCY, backoff_max=BACKOFF_MAX,
+                 watchdog_interval=WATCHDOG_INTERVAL):
+        self.opcua_client = opcua_client
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.backoff_max = backoff_max
+        self.watchdog_interval = watchdog_interval
+        self.last_report = (time.monotonic(), 0)
+
+    async def connect(self, endpoint):
+        """
+        Connect to an endpoint and subscribe to its nodes.
+
+        Parameters:
+            endpoint (Endpoint): The endpoint to connect.
+
+        Returns:
+            bool: True if the endpoint is connected and subscribed.
+        """
+        async with self.semaphore:
+            endpoint.status = "connecting"
+            client = Client(endpoint.url, timeout=CONNECT_TIMEOUT)
+            try:
+                await asyncio.wait_for(client.connect(), CONNECT_TIMEOUT)
+            except Exception as e:
+                endpoint.last_error = f"connect: {e or type(e).__name__}"
+                return False
+            endpoint.client = client
+            result = await self.opcua_client.monitor_nodes(client)
+            if result is None:
+                endpoint.last_error = "subscription setup failed"
+                await self.disconnect(endpoint)
+                return False
+            endpoint.subscriptions, endpoint.handler = result
+            self.opcua_client.servers.append(client)
+            endpoint.status = "connected"
+            endpoint.connects += 1
+            endpoint.connected_since = time.monotonic()
+            endpoint.backoff = BACKOFF_INITIAL
+            return True
+
+    async def disconnect(self, endpoint):
+        """
+        Drop the connection of an endpoint, ignoring errors of a dead session.
+
+        Parameters:
+            endpoint (Endpoint): The endpoint to disconnect.
+
+        Returns:
+            None
+        """
+        client, endpoint.client = endpoint.client, None
+        endpoint.connected_since = None
+        if endpoint.handler is not None:
+            endpoint.notifications += endpoint.handler.notifications
+            endpoint.handler = None
+        for subscription in endpoint.subscriptions:
+            if subscription in self.opcua_client.subscriptions:
+                self.opcua_client.subscriptions.remove(subscription)
+        endpoint.subscriptions = []
+        if client is None:
+            return
+        if client in self.opcua_client.servers:
+            self.opcua_client.servers.remove(client)
+        try:
+            await asyncio.wait_for(client.disconnect(), CONNECT_TIMEOUT)
+        except Exception:
+            pass
+
+    async def watch(self, endpoint):
+        """
+        Wait until the connection of an endpoint stops responding.
+
+        Parameters:
+            endpoint (Endpoint): The connected endpoint.
+
+        Returns:
+            None
+        """
+        state = endpoint.client.get_node(ua.ObjectIds.Server_ServerStatus_State)
+        while True:
+            await asyncio.sleep(self.watchdog_interval)
+            try:
+                await asyncio.wait_for(state.read_value(), CONNECT_TIMEOUT)
+            except Exception as e:
+                endpoint.last_error = f"watchdog: {e or type(e).__name__}"
+                return
+
+    async def supervise(self, endpoint):
+        """
+        Keep an endpoint connected for as long as the collector runs.
+
+        Parameters:
+            endpoint (Endpoint): The endpoint to supervise.
+
+        Returns:
+            None
+        """
+        while True:
+            if await self.connect(endpoint):
+                print(f"Collecting from {endpoint.url}")
+                await self.watch(endpoint)
+                print(f"Lost connection to {endpoint.url}: {endpoint.last_error}")
+                await self.disconnect(endpoint)
+            endpoint.failures += 1
+            endpoint.status = "backoff"
+            delay = endpoint.backoff * random.uniform(0.5, 1.0)
+            endpoint.backoff = min(endpoint.backoff * 2, self.backoff_max)
+            await asyncio.sleep(delay)
+
+    def health(self):
+        """
+        Summarize the state of every endpoint.
+
+        Returns:
+            list[dict]: One health entry per endpoint.
+        """
+        return [endpoint.health() for endpoint in self.endpoints]
+
+    def report_health(self):
+        """
+        Print the health of every endpoint and a fleet summary.
+
+        Returns:
+            None
+        """
+        health = self.health()
+        connected = sum(1 for entry in health if entry["status"] == "connected")
+        notifications = sum(entry["notifications"] for entry in health)
+        now = time.monotonic()
+        rate = (notifications - self.last_report[1]) / max(now - self.last_report[0], 1e-9)
+        self.last_report = (now, notifications)
+        sink = self.opcua_client.sink
+        print(f"Fleet health: {connected}/{len(health)} endpoints connected, {notifications} notifications "
+              f"({rate:.0f}/s), log backlog {sink.queue.qsize()}/{sink.queue.maxsize}, "
+              f"{sink.counters['written']} written, {sink.counters['dropped']} dropped")
+        for entry in health:
+            idle = f"{entry['idle']:.1f} s" if entry["idle"] is not None else "-"
+            print(f"  {entry['url']}: {entry['status']}, {entry['connects']} connects, {entry['failures']} failures, "
+                  f"{entry['notifications']} notifications, idle {idle}"
+                  + (f", last error: {entry['last_error']}" if entry["status"] != "connected" and entry["last_error"] else ""))
+
+    async def run(self, health_interval=HEALTH_INTERVAL):
+        """
+        Supervise all endpoints and report their health periodically.
+
+        Parameters:
+            health_interval (float): Seconds between health reports.
+
+        Returns:
+            None
+        """
+        tasks = [asyncio.create_task(self.supervise(endpoint)) for endpoint in self.endpoints]
+        try:
+            while True:
+                await asyncio.sleep(health_interval)
+                self.report_health()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await asyncio.gather(*(self.disconnect(endpoint) for endpoint in self.endpoints))
+
+async def main(urls):
+    # Headless: nothing is printed per sample, the health report shows the throughput
+    client = OPCUAClient(r'BL4R3-rev01-Diagnostic_NodeID_List-scenario.xlsx', verbose=False)
+    client.sink.start(truncate=True)
+    collector = FleetCollector(client, urls)
+    print(f"Collecting from {len(urls)} endpoints, at most {MAX_CONCURRENCY} connecting at a time")
+    try:
+        await collector.run()
+    finally:
+        client.sink.close()
+
+if __name__ == "__main__":
+    # Collect from a fleet: python fleet_collector.py [url ...] (or OPCUA_ENDPOINTS)
+    urls = sys.argv[1:] or parse_endpoints()
+    try:
+        asyncio.run(main(urls))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,658 @@
+import argparse
+import io
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from csv_sink import CSV_HEADER
+from log_store import LOG_DIR, LOG_FORMAT, log_files
+
+try:
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pc = None
+    pq = None
+
+# Rows of the Parquet log per index block; a block is what the index prunes and what a query reads at once
+BLOCK_ROWS = int(os.getenv("OPCUA_ANALYTICS_BLOCK_ROWS", 200000))
+# Bytes of the CSV log per index block
+BLOCK_BYTES = int(os.getenv("OPCUA_ANALYTICS_BLOCK_BYTES", 16 * 1024 * 1024))
+# Partial results of a query are merged after this many blocks
+MERGE_BLOCKS = 32
+
+INDEX_VERSION = 1
+
+# Node ids of the Parquet log are packed into one integer per row as ns << 48 | i
+NODE_SHIFT = 48
+NODE_MASK = (1 << NODE_SHIFT) - 1
+
+def name_key(name):
+    """
+    Normalize a node name for matching; the node list has trailing spaces and mixed case.
+    """
+    return str(name).strip().lower()
+
+# Numeric form of logged value strings, for min, max and mean
+def numeric_text(values):
+    """
+    Convert the text form of logged values to floats.
+
+    Parameters:
+        values (np.ndarray): The logged values as strings or None.
+
+    Returns:
+        np.ndarray: The numbers, 1.0 or 0.0 for booleans, or NaN where a value is not numeric.
+    """
+    numbers = pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(np.float64)
+    numbers[values == "True"] = 1.0
+    numbers[values == "False"] = 0.0
+    return numbers
+
+# Convert a query bound to nanoseconds of the log's timestamps
+def timestamp_ns(value):
+    return None if value is None else pd.Timestamp(value).value
+
+class LogAnalytics:
+    """
+    Time-window queries over the client log without loading it.
+
+    The log is either the Parquet directory of ParquetSink or the CSV file of
+    NodeCsvSink. It is split into blocks of about BLOCK_ROWS rows (row groups
+    of one Parquet file) or BLOCK_BYTES bytes (whole lines of the CSV file).
+    The index records, for every block and node, the number of samples and
+    the first and last timestamp. It is pickled next to the log and only
+    extended on refresh: new Parquet files are indexed, files that are gone
+    are dropped, and the appended end of the CSV file is indexed.
+
+    A query reads only the blocks whose timestamps overlap its window for the
+    requested nodes, one block at a time. Parquet files are memory-mapped and
+    only the needed row groups are read. Nodes and values become integer ids,
+    so every block is reduced with NumPy operations on sorted arrays. The
+    partial results are merged as the query goes. Memory therefore depends on
+    the block size and the number of nodes and buckets, not on the log size.
+    Values are only coded within a block, so continuous measurements do not
+    build up a table of every value ever logged.
+
+    The last sample of each node carries over to the next block and into the
+    window. That is what state changes and dwell times are measured from.
+    The log only records changes, so a value holds until the node's next
+    sample, or until the end of the window or of the log.
+    """
+
+    def __init__(self, path=None, block_rows=BLOCK_ROWS, block_bytes=BLOCK_BYTES):
+        if path is None:
+            path = LOG_DIR if LOG_FORMAT == "parquet" else "opcua_data_log.csv"
+        self.path = path
+        self.csv = not os.path.isdir(path) and path.endswith(".csv")
+        if not self.csv and pq is None:
+            raise RuntimeError("pyarrow is required to query a Parquet log")
+        self.block_rows = block_rows
+        self.block_bytes = block_bytes
+        self.index_path = f"{path}.index.pickle" if self.csv else os.path.join(path, "log_index.pickle")
+        self.counters = {"blocks_indexed": 0, "blocks_read": 0, "rows_read": 0, "rows_skipped": 0}
+        # Node table; nodes are handled as positions in it
+        self.node_keys = []
+        self.node_names = []
+        self.node_ids = {}
+        # Node ids by ns << NODE_SHIFT | i, for the Parquet log
+        self.packed_ids = {}
+        self.sources = {}
+        self.blocks = pd.DataFrame({
+            "block": pd.Series(dtype="int64"), "source": pd.Series(dtype="object"),
+            "start": pd.Series(dtype="int64"), "stop": pd.Series(dtype="int64"), "rows": pd.Series(dtype="int64"),
+            "t_min": pd.Series(dtype="int64"), "t_max": pd.Series(dtype="int64")})
+        self.entries = pd.DataFrame({
+            "block": pd.Series(dtype="int64"), "node": pd.Series(dtype="int32"), "rows": pd.Series(dtype="int64"),
+            "t_min": pd.Series(dtype="int64"), "t_max": pd.Series(dtype="int64")})
+        self.load_index()
+
+    def node_id(self, key, name):
+        node = self.node_ids.get(key)
+        if node is None:
+            node = self.node_ids[key] = len(self.node_keys)
+            self.node_keys.append(key)
+            self.node_names.append(name)
+        return node
+
+    def load_index(self):
+        """
+        Load the pickled index of the log, if there is one of this version.
+        """
+        try:
+            with open(self.index_path, "rb") as file:
+                index = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return
+        if index.get("version") != INDEX_VERSION or index.get("block_size") != self.block_size():
+            return
+        self.sources = index["sources"]
+        self.blocks = index["blocks"]
+        self.entries = index["entries"]
+        for key, name in zip(index["node_keys"], index["node_names"]):
+            self.node_id(key, name)
+
+    def save_index(self):
+        """
+        Pickle the index next to the log.
+        """
+        index = {"version": INDEX_VERSION, "block_size": self.block_size(), "sources": self.sources,
+                 "blocks": self.blocks, "entries": self.entries,
+                 "node_keys": self.node_keys, "node_names": self.node_names}
+        with open(f"{self.index_path}.tmp", "wb") as file:
+            pickle.dump(index, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f"{self.index_path}.tmp", self.index_path)
+
+    def block_size(self):
+        return ("bytes", self.block_bytes) if self.csv else ("rows", self.block_rows)
+
+    def refresh(self):
+        """
+        Bring the index up to date with the log.
+
+        Returns:
+            int: The number of blocks indexed.
+        """
+        indexed = self.counters["blocks_indexed"]
+        blocks = len(self.blocks)
+        if self.csv:
+            self.refresh_csv()
+        else:
+            files = log_files(self.path)
+            current = set(files)
+            for path in list(self.sources):
+                stat = os.stat(path) if path in current else None
+                if stat is None or self.sources[path] != (stat.st_size, stat.st_mtime_ns):
+                    self.drop_source(path)
+            for path in files:
+                if path not in self.sources:
+                    self.index_parquet(path)
+        if self.counters["blocks_indexed"] > indexed or len(self.blocks) != blocks:
+            self.save_index()
+        return self.counters["blocks_indexed"] - indexed
+
+    def drop_source(self, path):
+        dropped = self.blocks.loc[self.blocks["source"] == path, "block"]
+        self.blocks = self.blocks[self.blocks["source"] != path]
+        self.entries = self.entries[~self.entries["block"].isin(dropped)]
+        self.sources.pop(path, None)
+
+    def add_block(self, source, start, stop, node, timestamps):
+        """
+        Record one block and the samples of each node in it.
+        """
+        if len(timestamps) == 0:
+            return
+        block = int(self.blocks["block"].max()) + 1 if len(self.blocks) else 0
+        self.blocks = pd.concat([self.blocks, pd.DataFrame({
+            "block": [block], "source": [source], "start": [start], "stop": [stop], "rows": [len(timestamps)],
+            "t_min": [int(timestamps.min())], "t_max": [int(timestamps.max())]})], ignore_index=True)
+        per_node = pd.DataFrame({"node": node, "t": timestamps}).groupby("node")["t"].agg(["size", "min", "max"])
+        self.entries = pd.concat([self.entries, pd.DataFrame({
+            "block": block, "node": per_node.index.to_numpy(np.int32), "rows": per_node["size"].to_numpy(np.int64),
+            "t_min": per_node["min"].to_numpy(np.int64), "t_max": per_node["max"].to_numpy(np.int64)})],
+            ignore_index=True)
+        self.counters["blocks_indexed"] += 1
+
+    def index_parquet(self, path):
+        """
+        Index one finished Parquet file in blocks of whole row groups.
+        """
+        with pq.ParquetFile(path, memory_map=True) as file:
+            row_groups = [file.metadata.row_group(index).num_rows for index in range(file.metadata.num_row_groups)]
+        start = 0
+        rows = 0
+        for index, group_rows in enumerate(row_groups):
+            rows += group_rows
+            if rows >= self.block_rows or index == len(row_groups) - 1:
+                data = self.read_parquet(path, start, index + 1, values=False)
+                self.add_block(path, start, index + 1, data["node"], data["t"])
+                start, rows = index + 1, 0
+        stat = os.stat(path)
+        self.sources[path] = (stat.st_size, stat.st_mtime_ns)
+
+    def refresh_csv(self):
+        """
+        Index the part of the CSV file appended since the last refresh.
+
+        The last block is indexed again together with the appended lines
+        while it is smaller than BLOCK_BYTES, so frequent refreshes of a
+        growing file do not leave many small blocks. A file that shrank or
+        starts with other lines was rewritten and is indexed from scratch.
+        """
+        try:
+            size = os.path.getsize(self.path)
+            with open(self.path, "rb") as file:
+                header = file.readline()
+                signature = file.readline()
+        except OSError:
+            if self.sources:
+                self.drop_source(self.path)
+            return
+        known = self.sources.get(self.path)
+        if known is not None and (size < known["end"] or signature != known["signature"]):
+            self.drop_source(self.path)
+            known = None
+        offset = len(header) if known is None else known["end"]
+        if known is not None:
+            own = self.blocks[self.blocks["source"] == self.path]
+            last = own.loc[own["start"].idxmax()] if len(own) else None
+            if last is not None and last["stop"] - last["start"] < self.block_bytes and size > known["end"]:
+                offset = int(last["start"])
+                self.blocks = self.blocks[self.blocks["block"] != last["block"]]
+                self.entries = self.entries[self.entries["block"] != last["block"]]
+        with open(self.path, "rb") as file:
+            file.seek(offset)
+            while True:
+                data = file.read(self.block_bytes)
+                # Lines are cut at the last newline; a line still being written waits for the next refresh
+                cut = data.rfind(b"\n") + 1
+                if cut == 0:
+                    break
+                block = self.read_csv(data[:cut], values=False)
+                self.add_block(self.path, offset, offset + cut, block["node"], block["t"])
+                offset += cut
+                file.seek(offset)
+        self.sources[self.path] = {"end": offset, "signature": signature}
+
+    def read_parquet(self, path, start, stop, values=True):
+        """
+        Read row groups [start, stop) of a Parquet file of the log.
+
+        Returns:
+            dict: The arrays "t" (ns), "node" and, with values, "value" (codes
+            into "strings", the value texts of the block) and "number".
+        """
+        columns = ["timestamp", "Name", "ns", "i"] + (["value", "value_num"] if values else [])
+        with pq.ParquetFile(path, memory_map=True) as file:
+            table = file.read_row_groups(list(range(start, stop)), columns=columns)
+        identifiers = pc.fill_null(table.column("i"), -1).to_numpy()
+        # String node ids are logged without their identifier and cannot be told apart
+        known = identifiers >= 0
+        if not known.all():
+            self.counters["rows_skipped"] += int((~known).sum())
+            table = table.filter(known)
+            identifiers = identifiers[known]
+        keys = (table.column("ns").to_numpy().astype(np.int64) << NODE_SHIFT) | identifiers
+        uniques, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        lookup = np.array([self.packed_ids.get(key, -1) for key in uniques.tolist()], dtype=np.int32)
+        missing = np.flatnonzero(lookup < 0)
+        if len(missing):
+            names = table.column("Name").take(first[missing]).to_pylist()
+            for index, name in zip(missing.tolist(), names):
+                key = int(uniques[index])
+                lookup[index] = self.packed_ids[key] = self.node_id(f"ns={key >> NODE_SHIFT};i={key & NODE_MASK}", name)
+        data = {
+            "t": table.column("timestamp").to_numpy().astype("datetime64[ns]").view(np.int64),
+            "node": lookup[inverse.reshape(-1)],
+        }
+        if values:
+            encoded = table.column("value").combine_chunks().dictionary_encode()
+            # Missing values get the code behind the dictionary
+            data["strings"] = np.array(encoded.dictionary.to_pylist() + [None], dtype=object)
+            data["value"] = pc.fill_null(encoded.indices, len(encoded.dictionary)).to_numpy().astype(np.int32)
+            data["number"] = table.column("value_num").to_numpy(zero_copy_only=False)
+        self.counters["rows_read"] += len(data["t"])
+        return data
+
+    def read_csv(self, data, values=True):
+        """
+        Parse whole lines of the CSV log.
+
+        Returns:
+            dict: The arrays of read_parquet().
+        """
+        df = pd.read_csv(io.BytesIO(data), header=None, names=CSV_HEADER, dtype=str,
+                         keep_default_na=False, na_values=[""])
+        timestamps = pd.to_datetime(df["timestamp"], format="ISO8601", errors="coerce")
+        valid = timestamps.notna().to_numpy() & df["Node"].notna().to_numpy()
+        if not valid.all():
+            self.counters["rows_skipped"] += int((~valid).sum())
+            df, timestamps = df[valid], timestamps[valid]
+        codes, uniques = pd.factorize(df["Node"])
+        first = np.unique(codes, return_index=True)[1]
+        names = df["Name"].to_numpy()[first]
+        lookup = np.array([self.node_id(key, name) for key, name in zip(uniques, names)], dtype=np.int32)
+        data = {"t": timestamps.to_numpy("datetime64[ns]").view(np.int64), "node": lookup[codes]}
+        if values:
+            codes, uniques = pd.factorize(df["value"])
+            data["strings"] = np.append(np.asarray(uniques, dtype=object), None)
+            data["value"] = np.where(codes < 0, len(uniques), codes).astype(np.int32)
+            data["number"] = numeric_text(data["strings"])[data["value"]]
+        self.counters["rows_read"] += len(data["t"])
+        return data
+
+    def read_block(self, block):
+        """
+        Read the samples of one block of the index.
+        """
+        self.counters["blocks_read"] += 1
+        if not self.csv:
+            return self.read_parquet(block.source, int(block.start), int(block.stop))
+        with open(block.source, "rb") as file:
+            file.seek(int(block.start))
+            return self.read_csv(file.read(int(block.stop - block.start)))
+
+    def resolve(self, nodes=None):
+        """
+        Resolve node names and NodeIds to node ids.
+
+        Parameters:
+            nodes: None for all nodes, or a name or NodeId string
+                ("ns=4;i=6073"), an (ns, i) pair, or a list of them. A
+                name matches every node of that name.
+
+        Returns:
+            np.ndarray: The node ids.
+        """
+        if nodes is None:
+            return np.arange(len(self.node_keys), dtype=np.int32)
+        if isinstance(nodes, (str, tuple)):
+            nodes = [nodes]
+        names = np.array([name_key(name) for name in self.node_names], dtype=object)
+        ids = set()
+        for node in nodes:
+            if isinstance(node, tuple):
+                node = f"ns={node[0]};i={node[1]}"
+            if node in self.node_ids:
+                ids.add(self.node_ids[node])
+            else:
+                ids.update(np.flatnonzero(names == name_key(node)).tolist())
+        return np.array(sorted(ids), dtype=np.int32)
+
+    def carry_in(self, start, ids):
+        """
+        Find the last sample before start of every node.
+
+        Returns:
+            dict: The arrays "t", "node" and "value" (the value texts) of the samples.
+        """
+        entries = self.entries[self.entries["node"].isin(ids) & (self.entries["t_min"] < start)]
+        carried = {"t": np.empty(0, np.int64), "node": np.empty(0, np.int32), "value": np.empty(0, object)}
+        if entries.empty:
+            return carried
+        # The last sample before start is in the node's latest block starting before start
+        latest = entries.loc[entries.groupby("node")["t_min"].idxmax()]
+        parts = []
+        for block, group in latest.groupby("block"):
+            data = self.read_block(self.blocks[self.blocks["block"] == block].iloc[0])
+            keep = (data["t"] < start) & np.isin(data["node"], group["node"].to_numpy())
+            parts.append({"t": data["t"][keep], "node": data["node"][keep], "value": data["strings"][data["value"][keep]]})
+        for key in carried:
+            carried[key] = np.concatenate([part[key] for part in parts])
+        order = np.lexsort((carried["t"], carried["node"]))
+        last = np.r_[carried["node"][order][1:] != carried["node"][order][:-1], True]
+        return {key: values[order][last] for key, values in carried.items()}
+
+    def scan(self, start=None, end=None, nodes=None, freq=None, dwell=False):
+        """
+        Aggregate the samples of a time window per node, and per bucket of freq.
+
+        Parameters:
+            start: The start of the window (inclusive), anything pd.Timestamp
+                accepts; None for the start of the log.
+            end: The end of the window (exclusive); None for the end of the log.
+            nodes: The nodes, see resolve(); None for all.
+            freq (str, optional): A fixed bucket length, e.g. "1h" or "1D".
+                Buckets are aligned to multiples of freq.
+            dwell (bool): Also measure the time spent in each value.
+
+        Returns:
+            tuple[pd.DataFrame, pd.DataFrame | None]: The aggregates and the dwell times.
+        """
+        self.refresh()
+        ids = self.resolve(nodes)
+        if self.blocks.empty or len(ids) == 0:
+            window = _Window(0, 1, 0, pd.Timedelta(freq).value if freq else None)
+            return aggregate_frame(self, window, []), dwell_frame(self, window, []) if dwell else None
+        log_end = int(self.blocks["t_max"].max())
+        t_start = timestamp_ns(start) if start is not None else int(self.blocks["t_min"].min())
+        t_end = timestamp_ns(end) if end is not None else log_end + 1
+        window = _Window(t_start, t_end, pd.Timestamp(t_start).floor(freq).value if freq else t_start,
+                         pd.Timedelta(freq).value if freq else None)
+        state = _ScanState(window, dwell)
+        if start is not None:
+            state.pending = self.carry_in(t_start, ids)
+
+        entries = self.entries[self.entries["node"].isin(ids) & (self.entries["t_max"] >= t_start)
+                               & (self.entries["t_min"] < t_end)]
+        blocks = self.blocks[self.blocks["block"].isin(entries["block"].unique())].sort_values(["t_min", "block"])
+        for block in blocks.itertuples(index=False):
+            data = self.read_block(block)
+            selected = np.zeros(len(self.node_keys), dtype=bool)
+            selected[ids] = True
+            keep = (data["t"] >= t_start) & (data["t"] < t_end) & selected[data["node"]]
+            state.add(*(data[key][keep] for key in ("t", "node", "value", "number")), data["strings"])
+            if len(state.aggregates) >= MERGE_BLOCKS:
+                state.merge()
+        # A value holds until the end of the window, but not beyond the last sample of the log
+        state.finish(min(t_end, log_end))
+        return aggregate_frame(self, window, state.aggregates), dwell_frame(self, window, state.dwells) if dwell else None
+
+    def aggregate(self, start=None, end=None, nodes=None, freq=None):
+        """
+        Count, numeric min/max/mean, first and last value and state changes per node (and bucket).
+
+        A state change is a sample whose value differs from the node's
+        previous sample, which may lie before the window.
+
+        Returns:
+            pd.DataFrame: One row per node (and bucket) with samples.
+        """
+        return self.scan(start, end, nodes, freq)[0]
+
+    def dwell(self, start=None, end=None, nodes="position", freq=None):
+        """
+        Time spent in each value per node (and bucket), by default of the position nodes.
+
+        Returns:
+            pd.DataFrame: Seconds and share of the covered time per node (and bucket) and value.
+        """
+        return self.scan(start, end, nodes, freq, dwell=True)[1]
+
+class _Window:
+    """
+    The bounds and buckets of a query, in nanoseconds.
+    """
+
+    def __init__(self, start, end, origin, step):
+        self.start = start
+        self.end = end
+        self.origin = origin
+        self.step = step
+        self.buckets = max(1, -(-(end - origin) // step)) if step else 1
+
+    def bucket(self, timestamps):
+        return (timestamps - self.origin) // self.step if self.step else np.zeros(len(timestamps), np.int64)
+
+class _ScanState:
+    """
+    The running state of a scan: the last sample of every node and the partial results.
+
+    Values are codes into the strings of the block being reduced. The pending
+    samples carry their value texts from block to block, and get codes behind
+    the strings of the next block.
+    """
+
+    def __init__(self, window, dwell):
+        self.window = window
+        self.dwell = dwell
+        self.pending = {"t": np.empty(0, np.int64), "node": np.empty(0, np.int32), "value": np.empty(0, object)}
+        self.aggregates = []
+        self.dwells = []
+
+    def add(self, t, node, value, number, strings):
+        """
+        Reduce the samples of one block, sorted per node behind the node's pending sample.
+        """
+        pending = self.pending
+        count = len(pending["t"])
+        strings = np.concatenate([strings, pending["value"]])
+        is_pending = np.r_[np.ones(count, bool), np.zeros(len(t), bool)]
+        t = np.concatenate([pending["t"], t])
+        node = np.concatenate([pending["node"], node])
+        value = np.concatenate([np.arange(len(strings) - count, len(strings), dtype=np.int32), value])
+        number = np.concatenate([np.full(count, np.nan), number])
+        order = np.lexsort((t, ~is_pending, node))
+        t, node, value, number, is_pending = t[order], node[order], value[order], number[order], is_pending[order]
+
+        same_node = node[1:] == node[:-1]
+        changed = np.r_[False, same_node & (value[1:] != value[:-1])]
+        # A pending sample has a code of its own; compare its text with the sample after it
+        after = np.flatnonzero(np.r_[False, same_node & is_pending[:-1]])
+        changed[after] = strings[value[after]] != strings[value[after - 1]]
+        has_next = np.r_[same_node, False]
+        if self.dwell:
+            intervals = np.flatnonzero(has_next)
+            self.add_intervals(node[intervals], value[intervals], t[intervals], t[intervals + 1], strings)
+        self.pending = {"t": t[~has_next], "node": node[~has_next], "value": strings[value[~has_next]]}
+
+        rows = ~is_pending
+        if not rows.any():
+            return
+        t, node, value, number, changed = t[rows], node[rows], value[rows], number[rows], changed[rows]
+        key = node.astype(np.int64) * self.window.buckets + self.window.bucket(t)
+        starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+        ends = np.r_[starts[1:], len(key)] - 1
+        numeric = ~np.isnan(number)
+        self.aggregates.append(pd.DataFrame({
+            "key": key[starts],
+            "count": np.diff(np.r_[starts, len(key)]),
+            "min": np.fmin.reduceat(number, starts),
+            "max": np.fmax.reduceat(number, starts),
+            "sum": np.add.reduceat(np.where(numeric, number, 0.0), starts),
+            "numeric": np.add.reduceat(numeric.astype(np.int64), starts),
+            "changes": np.add.reduceat(changed.astype(np.int64), starts),
+            "first_t": t[starts], "first": strings[value[starts]],
+            "last_t": t[ends], "last": strings[value[ends]],
+        }))
+
+    def add_intervals(self, node, value, t0, t1, strings):
+        """
+        Add the time from t0 to t1 that each node spent in a value, split at bucket boundaries.
+        """
+        window = self.window
+        t0 = np.maximum(t0, window.start)
+        t1 = np.minimum(t1, window.end)
+        keep = t1 > t0
+        node, value, t0, t1 = node[keep], value[keep], t0[keep], t1[keep]
+        if len(t0) == 0:
+            return
+        if window.step:
+            first = window.bucket(t0)
+            repeats = window.bucket(t1 - 1) - first + 1
+            row = np.repeat(np.arange(len(t0)), repeats)
+            bucket = first[row] + np.arange(len(row)) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+            bucket_start = window.origin + bucket * window.step
+            seconds = (np.minimum(t1[row], bucket_start + window.step) - np.maximum(t0[row], bucket_start)) / 1e9
+            node, value = node[row], value[row]
+        else:
+            bucket = np.zeros(len(t0), np.int64)
+            seconds = (t1 - t0) / 1e9
+        combined = (node.astype(np.int64) * window.buckets + bucket) * len(strings) + value
+        uniques, inverse = np.unique(combined, return_inverse=True)
+        self.dwells.append(pd.DataFrame({
+            "key": uniques // len(strings), "value": strings[uniques % len(strings)],
+            "seconds": np.bincount(inverse.reshape(-1), weights=seconds),
+        }))
+
+    def merge(self):
+        """
+        Merge the partial results into one frame each.
+        """
+        if len(self.aggregates) > 1:
+            self.aggregates = [merge_aggregates(self.aggregates)]
+        if len(self.dwells) > 1:
+            self.dwells = [merge_dwells(self.dwells)]
+
+    def finish(self, end):
+        """
+        Close the intervals of the last values at the end of the window.
+        """
+        if self.dwell:
+            pending = self.pending
+            self.add_intervals(pending["node"], np.arange(len(pending["t"]), dtype=np.int32), pending["t"],
+                               np.full(len(pending["t"]), end), pending["value"])
+        self.merge()
+
+# Merge the partial aggregates of several blocks
+def merge_aggregates(parts):
+    df = pd.concat(parts, ignore_index=True)
+    grouped = df.groupby("key")
+    merged = grouped.agg(count=("count", "sum"), min=("min", "min"), max=("max", "max"), sum=("sum", "sum"),
+                         numeric=("numeric", "sum"), changes=("changes", "sum"))
+    first = df.sort_values("first_t", kind="stable").groupby("key")[["first_t", "first"]].first()
+    last = df.sort_values("last_t", kind="stable").groupby("key")[["last_t", "last"]].last()
+    return merged.join(first).join(last).reset_index()
+
+# Merge the partial dwell times of several blocks
+def merge_dwells(parts):
+    return pd.concat(parts, ignore_index=True).groupby(["key", "value"], as_index=False, dropna=False)["seconds"].sum()
+
+# Label the node and bucket of query results
+def label_frame(analytics, window, df):
+    node = (df["key"] // window.buckets).to_numpy()
+    labels = pd.DataFrame({
+        "node": np.asarray(analytics.node_keys, dtype=object)[node],
+        "name": np.asarray(analytics.node_names, dtype=object)[node],
+    })
+    if window.step:
+        labels["start"] = pd.to_datetime(window.origin + (df["key"] % window.buckets).to_numpy() * window.step)
+    return labels
+
+# Build the aggregate result of a scan
+def aggregate_frame(analytics, window, parts):
+    columns = ["node", "name"] + (["start"] if window.step else []) + [
+        "count", "min", "max", "mean", "first", "last", "last_time", "changes"]
+    if not parts:
+        return pd.DataFrame(columns=columns)
+    df = merge_aggregates(parts) if len(parts) > 1 else parts[0]
+    result = label_frame(analytics, window, df)
+    result["count"] = df["count"].to_numpy()
+    result["min"] = df["min"].to_numpy()
+    result["max"] = df["max"].to_numpy()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        result["mean"] = df["sum"].to_numpy() / df["numeric"].to_numpy()
+    result["first"] = df["first"].to_numpy()
+    result["last"] = df["last"].to_numpy()
+    result["last_time"] = pd.to_datetime(df["last_t"].to_numpy())
+    result["changes"] = df["changes"].to_numpy()
+    return result[columns]
+
+# Build the dwell time result of a scan
+def dwell_frame(analytics, window, parts):
+    columns = ["node", "name"] + (["start"] if window.step else []) + ["value", "seconds", "share"]
+    if not parts:
+        return pd.DataFrame(columns=columns)
+    df = merge_dwells(parts).sort_values(["key", "value"], ignore_index=True)
+    result = label_frame(analytics, window, df)
+    result["value"] = df["value"].to_numpy()
+    result["seconds"] = df["seconds"].to_numpy()
+    result["share"] = (df["seconds"] / df.groupby("key")["seconds"].transform("sum")).to_numpy()
+    return result[columns]
+
+if __name__ == "__main__":
+    # Query the client log: python log_analytics.py aggregate|dwell [--log path] [--start] [--end] [--freq] [--node ...]
+    parser = argparse.ArgumentParser(description="Time-window aggregations over the client log.")
+    parser.add_argument("query", choices=["aggregate", "dwell"])
+    parser.add_argument("--log", default=None, help="Parquet log directory or CSV file")
+    parser.add_argument("--start", default=None)
+    parser.add_argument("--end", default=None)
+    parser.add_argument("--freq", default=None, help="bucket length, e.g. 1h or 1D")
+    parser.add_argument("--node", action="append", default=None, help="node name or NodeId, repeatable")
+    parser.add_argument("--out", default=None, help="write the result to this CSV file")
+    args = parser.parse_args()
+    analytics = LogAnalytics(args.log)
+    if args.query == "aggregate":
+        result = analytics.aggregate(args.start, args.end, args.node, args.freq)
+    else:
+        result = analytics.dwell(args.start, args.end, args.node or "position", args.freq)
+    if args.out:
+        result.to_csv(args.out, index=False)
+        print(f"Wrote {len(result)} rows to {args.out}")
+    else:
+        print(result.to_string(index=False))
+    print(f"Read {analytics.counters['blocks_read']} of {len(analytics.blocks)} blocks, "
+          f"{analytics.counters['rows_read']} rows")
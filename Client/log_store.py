@@ -0,0 +1,221 @@
+import datetime
+import glob
+import os
+import sys
+
+import pandas as pd
+
+from csv_sink import CSV_HEADER, BatchSink, CsvSink
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Storage backend of the client log: "parquet" (time-partitioned files) or "csv" (one file)
+LOG_FORMAT = os.getenv("OPCUA_LOG_FORMAT", "parquet")
+LOG_DIR = os.getenv("OPCUA_LOG_DIR", "opcua_data_log")
+LOG_COMPRESSION = os.getenv("OPCUA_LOG_COMPRESSION", "zstd")
+
+# A Parquet file is closed and a new one started after this many rows, bytes or seconds
+ROTATE_ROWS = int(os.getenv("OPCUA_LOG_ROTATE_ROWS", 1000000))
+ROTATE_BYTES = int(os.getenv("OPCUA_LOG_ROTATE_BYTES", 64 * 1024 * 1024))
+ROTATE_SECONDS = float(os.getenv("OPCUA_LOG_ROTATE_SECONDS", 3600))
+
+# Columns of the Parquet log; value keeps the text form, value_num the numeric form if there is one
+LOG_SCHEMA = pa.schema([
+    ("timestamp", pa.timestamp("us")),
+    ("Name", pa.dictionary(pa.int32(), pa.string())),
+    ("ns", pa.uint16()),
+    ("i", pa.int64()),
+    ("value", pa.string()),
+    ("value_num", pa.float64()),
+]) if pa is not None else None
+
+# Numeric form of a logged value
+def numeric_value(value):
+    """
+    Convert a logged value to a float for analysis.
+
+    Parameters:
+        value: The value of the datachange notification.
+
+    Returns:
+        float | None: The value as a float, or None if it is not numeric.
+    """
+    if isinstance(value, (bool, int, float)):
+        return float(value)
+    return None
+
+class ParquetSink(BatchSink):
+    """
+    Writes log rows to time-partitioned, compressed Parquet files.
+
+    Every batch becomes one row group of the current file, which lives under
+    <log_dir>/date=YYYY-MM-DD/. The file is written with a .tmp suffix and
+    renamed when it is closed, so readers only ever see complete files. It is
+    closed after rotate_rows rows, rotate_bytes bytes or rotate_seconds
+    seconds, whichever comes first.
+    """
+
+    def __init__(self, log_dir=LOG_DIR, compression=LOG_COMPRESSION, rotate_rows=ROTATE_ROWS,
+                 rotate_bytes=ROTATE_BYTES, rotate_seconds=ROTATE_SECONDS, **kwargs):
+        super().__init__(log_dir, **kwargs)
+        self.compression = compression
+        self.rotate_rows = rotate_rows
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.writer = None
+        self.file_path = None
+        self.file_opened = None
+        self.file_rows = 0
+        self.counters["files"] = 0
+
+    def open_file(self):
+        """
+        Start a new Parquet file in the partition of the current date.
+        """
+        now = datetime.datetime.now()
+        partition = os.path.join(self.path, f"date={now:%Y-%m-%d}")
+        os.makedirs(partition, exist_ok=True)
+        self.file_path = os.path.join(partition, f"part-{now:%H%M%S-%f}.parquet")
+        self.writer = pq.ParquetWriter(f"{self.file_path}.tmp", LOG_SCHEMA, compression=self.compression)
+        self.file_opened = now
+        self.file_rows = 0
+
+    def close_file(self):
+        """
+        Finish the current Parquet file and make it visible to readers.
+        """
+        if self.writer is None:
+            return
+        self.writer.close()
+        os.replace(f"{self.file_path}.tmp", self.file_path)
+        self.writer = None
+        self.counters["files"] += 1
+
+    def rotation_due(self):
+        """
+        Whether the current file has reached its row, size or age limit.
+        """
+        if self.writer is None:
+            return False
+        if self.file_rows >= self.rotate_rows:
+            return True
+        if (datetime.datetime.now() - self.file_opened).total_seconds() >= self.rotate_seconds:
+            return True
+        return os.path.getsize(f"{self.file_path}.tmp") >= self.rotate_bytes
+
+    def flush(self, batch):
+        """
+        Rotate the file if it is due, then write the batch.
+
+        Also called with an empty batch when the queue is idle, so files are
+        rotated on time even without new rows.
+        """
+        if self.rotation_due():
+            self.close_file()
+        super().flush(batch)
+
+    def write_rows(self, batch):
+        """
+        Write a batch of (timestamp, Name, ns, i, value) rows as one row group.
+        """
+        if self.writer is None:
+            self.open_file()
+        timestamps, names, namespaces, identifiers, values = zip(*batch)
+        table = pa.Table.from_arrays([
+            pa.array(timestamps, pa.timestamp("us")),
+            pa.array(names, pa.string()).dictionary_encode(),
+            pa.array(namespaces, pa.uint16()),
+            pa.array([i if isinstance(i, int) else None for i in identifiers], pa.int64()),
+            pa.array([None if value is None else str(value) for value in values], pa.string()),
+            pa.array([numeric_value(value) for value in values], pa.float64()),
+        ], schema=LOG_SCHEMA)
+        self.writer.write_table(table)
+        self.file_rows += len(batch)
+
+    def finish(self):
+        """
+        Finish the current file after the last batch.
+        """
+        self.close_file()
+
+class NodeCsvSink(CsvSink):
+    """
+    CSV sink taking the same (timestamp, Name, ns, i, value) rows as ParquetSink.
+    """
+
+    def write_rows(self, batch):
+        """
+        Append a batch of rows to the file in the timestamp, Name, Node, value layout.
+        """
+        super().write_rows([
+            (timestamp, name, f"ns={ns};i={i}", value) for timestamp, name, ns, i, value in batch
+        ])
+
+# Create the sink of the configured storage backend
+def open_log_sink(log_format=LOG_FORMAT, csv_file="opcua_data_log.csv", log_dir=LOG_DIR):
+    """
+    Create the log sink for a storage backend.
+
+    Falls back to CSV if Parquet is requested but pyarrow is not installed.
+
+    Parameters:
+        log_format (str): "parquet" or "csv".
+        csv_file (str): The CSV file of the CSV backend.
+        log_dir (str): The directory of the Parquet backend.
+
+    Returns:
+        BatchSink: The sink, not yet started.
+    """
+    if log_format == "parquet":
+        if pq is not None:
+            return ParquetSink(log_dir)
+        print("pyarrow is not installed, logging to CSV instead of Parquet")
+    return NodeCsvSink(csv_file)
+
+# List the finished Parquet files of a log directory
+def log_files(log_dir=LOG_DIR):
+    """
+    List the finished Parquet files of a log directory in time order.
+
+    Parameters:
+        log_dir (str): The directory of the Parquet backend.
+
+    Returns:
+        list[str]: The file paths.
+    """
+    return sorted(glob.glob(os.path.join(log_dir, "date=*", "part-*.parquet")))
+
+# Export a Parquet log to the CSV layout
+def export_csv(log_dir=LOG_DIR, csv_file="opcua_data_log.csv"):
+    """
+    Export the finished Parquet files of a log directory to one CSV file.
+
+    Files are converted one at a time, so the whole log never has to fit
+    in memory.
+
+    Parameters:
+        log_dir (str): The directory of the Parquet backend.
+        csv_file (str): The CSV file to write.
+
+    Returns:
+        int: The number of rows exported.
+    """
+    rows = 0
+    pd.DataFrame(columns=CSV_HEADER).to_csv(csv_file, index=False)
+    for path in log_files(log_dir):
+        df = pd.read_parquet(path, columns=["timestamp", "Name", "ns", "i", "value"])
+        df["Node"] = "ns=" + df["ns"].astype(str) + ";i=" + df["i"].astype("Int64").astype(str)
+        df[CSV_HEADER].to_csv(csv_file, mode="a", header=False, index=False)
+        rows += len(df)
+    return rows
+
+if __name__ == "__main__":
+    # Export a Parquet log to CSV: python log_store.py [log_dir] [csv_file]
+    log_dir = sys.argv[1] if len(sys.argv) > 1 else LOG_DIR
+    csv_file = sys.argv[2] if len(sys.argv) > 2 else "opcua_data_log_export.csv"
+    print(f"Exported {export_csv(log_dir, csv_file)} rows from {log_dir} to {csv_file}")
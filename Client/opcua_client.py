@@ -0,0 +1,285 @@
+import asyncio
+import pandas as pd
+from asyncua import Client, ua
+import datetime
+import os
+import time
+from collections import deque
+from log_store import LOG_DIR, LOG_FORMAT, open_log_sink
+from subscription_profiles import (FILTER_REJECTED, SUBSCRIPTION_PROFILES, assign_profiles, data_change_filter,
+                                   is_analog, load_profiles, monitored_item_request)
+
+# Number of recent samples kept in memory for display
+HISTORY_SIZE = int(os.getenv("OPCUA_LOG_HISTORY", 10000))
+
+# Nodes per read and per create-monitored-items call when the server does not announce a limit
+SUBSCRIBE_CHUNK_SIZE = int(os.getenv("OPCUA_SUBSCRIBE_CHUNK_SIZE", 1000))
+
+# Print every notification; slows collection down at high rates
+VERBOSE = os.getenv("OPCUA_VERBOSE", "1") == "1"
+
+class OPCUAClient:
+    def __init__(self, excel_file, verbose=VERBOSE, profiles=SUBSCRIPTION_PROFILES):
+        self.verbose = verbose
+        self.servers = []
+        self.subscriptions = []
+        self.csv_file = 'opcua_data_log.csv'
+        self.node_info = self.load_node_info(excel_file)
+        # Subscription profile (publishing and sampling interval, queue size, deadband) of every node
+        self.profiles, profile_rules, default_profile = load_profiles(profiles)
+        self.node_profiles = assign_profiles(self.node_info, self.profiles, profile_rules, default_profile)
+        # NodeId -> node information, so a notification is matched without scanning node_info
+        self.node_index = {(info["ns"], info["i"]): info for info in self.node_info}
+        self.sink = open_log_sink(LOG_FORMAT, self.csv_file, LOG_DIR)
+        self.logged_data = deque(maxlen=HISTORY_SIZE)
+        # Called with every logged entry, e.g. to update the GUI
+        self.display = None
+
+    def load_node_info(self, file_path):
+        """
+        Load node information from the Excel file.
+        """
+        df = pd.read_excel(file_path, sheet_name='default', engine='openpyxl')
+        nodes = []
+        for _, row in df.iterrows():
+            profile = row.get("Profile", None)
+            nodes.append({
+                "Name": row["Name"],
+                "ns": int(row["ns"]),
+                "i": int(row["i"]),
+                "Value": row.get("Value", None),
+                "Parent": row.get("Parent", None),
+                "Group": row.get("Group", None),
+                "DataType": row.get("DataType", None),
+                # Optional Profile column naming the subscription profile of the node
+                "Profile": profile.strip() if isinstance(profile, str) and profile.strip() else None,
+            })
+        return nodes
+
+    async def connect_to_server(self, server_url):
+        """
+        Connects to the given OPC UA server and returns the client object.
+        """
+        try:
+            client = Client(server_url)
+            await client.connect()
+            print(f"Connected to server: {server_url}")
+            return client
+        except Exception as e:
+            print(f"Failed to connect to {server_url}. Error: {e}")
+            return None
+
+    async def disconnect_from_server(self):
+        """
+        Disconnects from all connected servers.
+        """
+        for client in self.servers:
+            try:
+                await client.disconnect()
+                print(f"Disconnected from server: {client.server_url}")
+            except Exception as e:
+                print(f"Failed to disconnect from server: {e}")
+        self.servers.clear()
+        print(f"Data log: {self.sink.counters['written']} rows written in {self.sink.counters['batches']} batches, "
+              f"{self.sink.counters['dropped']} dropped")
+
+    async def add_server(self, server_url):
+        """
+        Adds a server to the list of servers and connects to it.
+        """
+        client = await self.connect_to_server(server_url)
+        if client:
+            self.servers.append(client)
+            await self.recognize_and_summarize_namespaces(client)
+        return client
+
+    async def recognize_and_summarize_namespaces(self, client):
+        """
+        Scans and summarizes namespaces across the connected servers.
+        """
+        try:
+            namespaces = await client.get_namespace_array()
+            print(f"Namespaces for {client.server_url}:")
+            for index, ns in enumerate(namespaces):
+                print(f"Namespace Index {index} (URI: {ns})")
+            return namespaces
+        except Exception as e:
+            print(f"Error summarizing namespaces for {client.server_url}: {e}")
+
+    async def subscribe_and_monitor_nodes(self):
+        """
+        Subscribes to nodes for each connected server and monitors them in real-time.
+        """
+        tasks = [self.monitor_nodes(client) for client in self.servers]
+        await asyncio.gather(*tasks)
+
+    async def operation_limit(self, client, limit_id, default=SUBSCRIBE_CHUNK_SIZE):
+        """
+        Reads one of the server's operation limits, e.g. MaxNodesPerRead.
+
+        Servers announce 0 for "no limit" and may not expose the node at all,
+        in both cases the default chunk size is used.
+        """
+        try:
+            limit = await client.get_node(limit_id).read_value()
+        except Exception:
+            return default
+        return min(limit, default) if limit else default
+
+    async def read_node_classes(self, client, nodeids, chunk_size):
+        """
+        Reads the NodeClass of many nodes with one read call per chunk.
+
+        Returns the NodeClass of each node, or None if the node could not be read.
+        """
+        node_classes = []
+        for start in range(0, len(nodeids), chunk_size):
+            params = ua.ReadParameters()
+            for nodeid in nodeids[start:start + chunk_size]:
+                read_value = ua.ReadValueId()
+                read_value.NodeId = nodeid
+                read_value.AttributeId = ua.AttributeIds.NodeClass
+                params.NodesToRead.append(read_value)
+            results = await client.uaclient.read(params)
+            node_classes.extend(
+                ua.NodeClass(result.Value.Value) if result.StatusCode.is_good() else None for result in results
+            )
+        return node_classes
+
+    async def create_monitored_items(self, subscription, variables, chunk_size):
+        """
+        Creates the monitored items of one subscription in chunks, with the parameters of each node's profile.
+
+        Deadbands only apply to analog nodes. Nodes for which the server
+        refuses the deadband filter are monitored without it.
+
+        Returns the number of nodes subscribed.
+        """
+        subscribed = 0
+        for start in range(0, len(variables), chunk_size):
+            chunk = variables[start:start + chunk_size]
+            filters = [
+                data_change_filter(self.profiles[profile]) if is_analog(node_info["DataType"]) else None
+                for node_info, _, profile in chunk
+            ]
+            while chunk:
+                try:
+                    handles = await subscription.create_monitored_items([
+                        monitored_item_request(subscription, nodeid, self.profiles[profile], mfilter)
+                        for (_, nodeid, profile), mfilter in zip(chunk, filters)
+                    ])
+                except Exception as e:
+                    print(f"Failed to subscribe to {len(chunk)} nodes: {e}")
+                    break
+                retry = []
+                for (node_info, nodeid, profile), mfilter, handle in zip(chunk, filters, handles):
+                    if not isinstance(handle, ua.StatusCode):
+                        subscribed += 1
+                    elif mfilter is not None and handle.value in FILTER_REJECTED:
+                        retry.append((node_info, nodeid, profile))
+                    else:
+                        print(f"Failed to subscribe to node {node_info['Name']}: {handle}")
+                chunk, filters = retry, [None] * len(retry)
+        return subscribed
+
+    async def monitor_nodes(self, client):
+        """
+        Subscribes to nodes based on the information loaded from the Excel file.
+
+        The node classes are read in bulk to keep only Variables. The
+        Variables are grouped by the publishing interval of their profile
+        into one subscription per interval, fastest first, and their
+        monitored items are created in bulk with the sampling interval,
+        queue size and deadband of their profile. Reads and item creation
+        come in chunks that respect the server's operation limits.
+
+        Returns the subscriptions and their shared handler, or None if setup failed.
+        """
+        try:
+            started = time.perf_counter()
+            handler = self.SubscriptionHandler(self, client.server_url, started)
+
+            read_chunk = await self.operation_limit(
+                client, ua.ObjectIds.Server_ServerCapabilities_OperationLimits_MaxNodesPerRead)
+            monitor_chunk = await self.operation_limit(
+                client, ua.ObjectIds.Server_ServerCapabilities_OperationLimits_MaxMonitoredItemsPerCall)
+
+            nodeids = [ua.NodeId(node_info["i"], node_info["ns"]) for node_info in self.node_info]
+            node_classes = await self.read_node_classes(client, nodeids, read_chunk)
+            groups = {}
+            for node_info, nodeid, node_class, profile in zip(self.node_info, nodeids, node_classes, self.node_profiles):
+                if node_class == ua.NodeClass.Variable:
+                    interval = self.profiles[profile]["publishing_interval"]
+                    groups.setdefault(interval, []).append((node_info, nodeid, profile))
+            variables = sum(len(group) for group in groups.values())
+
+            subscriptions = []
+            subscribed = 0
+            # Without any Variable there is still one subscription, e.g. for events
+            for interval in sorted(groups) or [min(profile["publishing_interval"] for profile in self.profiles.values())]:
+                subscription = await client.create_subscription(interval, handler)
+                subscriptions.append(subscription)
+                self.subscriptions.append(subscription)
+                subscribed += await self.create_monitored_items(subscription, groups.get(interval, []), monitor_chunk)
+
+            print(f"Subscribed to {subscribed} of {variables} variables on {client.server_url} "
+                  f"({len(nodeids) - variables} rows skipped) in {len(subscriptions)} subscriptions ("
+                  + ", ".join(f"{len(groups[interval])} at {interval} ms" for interval in sorted(groups))
+                  + f") in {time.perf_counter() - started:.2f} s")
+            return subscriptions, handler
+        except Exception as e:
+            print(f"Error setting up subscription for {client.server_url}: {e}")
+            return None
+
+    def log_data(self, node, val):
+        """
+        Logs node value changes to a CSV file in real-time with a timestamp.
+        """
+        timestamp = datetime.datetime.now()
+        node_info = self.node_index.get((node.nodeid.NamespaceIndex, node.nodeid.Identifier), {"Name": "Unknown", "Node": str(node)})
+
+        data_entry = {
+            "timestamp": timestamp,
+            "Name": node_info["Name"],
+            "Node": f"ns={node.nodeid.NamespaceIndex};i={node.nodeid.Identifier}",
+            "value": val
+        }
+        self.logged_data.append(data_entry)
+        if self.verbose:
+            print(f"Logged data: {data_entry}")
+
+        # Queue the row for the log writer thread
+        self.sink.write((timestamp, node_info["Name"], node.nodeid.NamespaceIndex, node.nodeid.Identifier, val))
+
+        # Update the GUI with the latest logged data
+        if self.display is not None:
+            self.display(data_entry)
+
+    class SubscriptionHandler:
+        def __init__(self, client_obj, server_url=None, started=None):
+            self.client_obj = client_obj
+            self.server_url = server_url
+            self.started = started
+            self.first_notification = None
+            self.notifications = 0
+            self.last_notification = None
+
+        def datachange_notification(self, node, val, data):
+            """
+            Handles data change notifications.
+            """
+            if self.first_notification is None and self.started is not None:
+                self.first_notification = time.perf_counter() - self.started
+                print(f"First notification from {self.server_url} {self.first_notification:.2f} s "
+                      f"after subscription setup started")
+            self.notifications += 1
+            self.last_notification = time.monotonic()
+            if self.client_obj.verbose:
+                print(f"Data change detected for node: {node}")
+            self.client_obj.log_data(node, val)
+
+        def event_notification(self, event):
+            """
+            Handles events.
+            """
+            print(f"New event: {event}")
@@ -0,0 +1,187 @@
+import json
+import os
+import re
+
+from asyncua import ua
+
+# Subscription profiles: a JSON file with "profiles", "rules" and "default", or "single" for the
+# previous setup of one 500 ms subscription with the same parameters for every node
+SUBSCRIPTION_PROFILES = os.getenv("OPCUA_SUBSCRIPTION_PROFILES", "")
+
+# Intervals in milliseconds. Nodes of profiles with the same publishing interval share a subscription.
+DEFAULT_PROFILES = {
+    # Position, movement and status of the field elements: every change, promptly
+    "fast": {"publishing_interval": 250, "sampling_interval": 100, "queue_size": 10},
+    # Everything else that changes in operation
+    "normal": {"publishing_interval": 1000, "sampling_interval": 500, "queue_size": 1},
+    # Measurements, reported when they move by more than the deadband
+    "analog": {"publishing_interval": 1000, "sampling_interval": 500, "queue_size": 1,
+               "deadband_type": "absolute", "deadband_value": 0.5},
+    # Identification and configuration, which hardly ever change
+    "static": {"publishing_interval": 10000, "sampling_interval": 5000, "queue_size": 1},
+}
+DEFAULT_PROFILE = "normal"
+
+# Node list DataType words naming the numeric types a deadband applies to
+ANALOG_DATATYPES = {"SByte", "Byte", "Int16", "UInt16", "Int32", "UInt32", "Int64", "UInt64", "Float", "Double",
+                    "Real", "Integer", "Long"}
+
+# The first rule matching a node's Name, Parent, Group or DataType sets its profile
+DEFAULT_RULES = [
+    {"profile": "fast", "names": [
+        "position", "lastCommandedPosition", "movementStatus", "positionDegraded", "pointAbleToMoveStatus",
+        "ableToMoveStatus", "aggregateAbleToMoveStatus", "statusTechnical", "operationStatus", "isAvailable",
+        "isActive", "IsMaintenanceMode"]},
+    {"profile": "static", "names": [
+        "label", "manufacturer", "manufacturerModel", "serialNumber", "hardwareRevision", "softwareRevision",
+        "manufacturingDateTime", "FieldElementSpecificationRevision", "SubsystemIdentification", "TechnicalPlace",
+        "trackEdgeId", "trackKm", "lat", "lon", "machineType", "operatingSystem", "systemDescription", "ramSize",
+        "memorySize", "macAddress", "nominalBandwidth", "index", "isCrucial", "driveCutoffPrinciple",
+        "BasicDataReadable", "pSamplingInterval", "timeOffsetStartLeft", "timeOffsetStartRight",
+        "isExcludedFromRedundancyGroup", "minimumAvailable"]},
+    {"profile": "analog", "datatypes": ["Float", "Double"]},
+]
+
+SINGLE_PROFILES = {"single": {"publishing_interval": 500, "sampling_interval": 0, "queue_size": 0}}
+
+DEADBAND_TYPES = {"none": ua.DeadbandType.None_, "absolute": ua.DeadbandType.Absolute,
+                  "percent": ua.DeadbandType.Percent}
+
+# Results of servers that refuse a deadband for a node; the node is then monitored without one
+FILTER_REJECTED = {ua.StatusCodes.BadFilterNotAllowed, ua.StatusCodes.BadMonitoredItemFilterUnsupported,
+                   ua.StatusCodes.BadDeadbandFilterInvalid, ua.StatusCodes.BadMonitoredItemFilterInvalid}
+
+def name_key(name):
+    """
+    Normalize a node list name for matching; the workbook has trailing spaces and mixed case.
+    """
+    return str(name).strip().lower()
+
+# Load the profiles and assignment rules
+def load_profiles(spec=SUBSCRIPTION_PROFILES):
+    """
+    Load the subscription profiles, their assignment rules and the default profile.
+
+    Parameters:
+        spec (str): A JSON file path, "single" for one subscription of
+            every node, or empty for the built-in profiles.
+
+    Returns:
+        tuple[dict, list[dict], str]: The profiles by name, the rules and the default profile.
+    """
+    if spec == "single":
+        return SINGLE_PROFILES, [], "single"
+    if not spec:
+        return DEFAULT_PROFILES, DEFAULT_RULES, DEFAULT_PROFILE
+    with open(spec) as file:
+        config = json.load(file)
+    profiles = config.get("profiles", DEFAULT_PROFILES)
+    default = config.get("default", DEFAULT_PROFILE)
+    if default not in profiles:
+        raise ValueError(f"Default subscription profile '{default}' is not defined in {spec}")
+    return profiles, config.get("rules", DEFAULT_RULES), default
+
+# Pick the profile of every node of the node list
+def assign_profiles(node_info, profiles, rules, default):
+    """
+    Assign a profile to every node of the node list.
+
+    A Profile column in the node list sets the profile of a node directly;
+    other nodes get the profile of the first rule matching their Name,
+    Parent or Group (case-insensitive) or a token of their DataType.
+
+    Parameters:
+        node_info (list[dict]): The nodes loaded from the node list.
+        profiles (dict): The profiles by name.
+        rules (list[dict]): The rules with "profile" and any of "names",
+            "parents", "groups" and "datatypes".
+        default (str): The profile of nodes no rule matches.
+
+    Returns:
+        list[str]: The profile name of each node.
+    """
+    compiled = [
+        (rule["profile"], {name_key(name) for name in rule.get("names", ())},
+         {name_key(name) for name in rule.get("parents", ())}, {name_key(name) for name in rule.get("groups", ())},
+         set(rule.get("datatypes", ())))
+        for rule in rules
+    ]
+    assigned = []
+    for node in node_info:
+        profile = node.get("Profile")
+        if profile not in profiles:
+            name, parent, group = name_key(node.get("Name")), name_key(node.get("Parent")), name_key(node.get("Group"))
+            tokens = set(re.findall(r"[A-Za-z0-9]+", str(node.get("DataType", ""))))
+            profile = next((rule_profile for rule_profile, names, parents, groups, datatypes in compiled
+                            if name in names or parent in parents or group in groups or tokens & datatypes), default)
+        assigned.append(profile)
+    return assigned
+
+# Whether a deadband applies to a node
+def is_analog(datatype):
+    """
+    Check whether a node list DataType is a number a deadband applies to.
+
+    The DataType is split into words like the rule matching does, and a word
+    must be the exact name of a numeric type, e.g. "Real (Float)" or
+    "Integer (UInt16)"; a type that only contains "Int" in its name is not
+    one. Enumerations and multi-state values are numbers too, but every
+    change of them matters, and strings or booleans cannot be compared by
+    distance.
+    """
+    datatype = str(datatype)
+    if "Enumeration" in datatype or "MultiState" in datatype:
+        return False
+    return bool(set(re.findall(r"[A-Za-z0-9]+", datatype)) & ANALOG_DATATYPES)
+
+# Build the monitoring filter of a profile
+def data_change_filter(profile):
+    """
+    Build the DataChangeFilter of a profile's deadband.
+
+    Parameters:
+        profile (dict): The profile.
+
+    Returns:
+        ua.DataChangeFilter | None: The filter, or None without a deadband.
+    """
+    deadband_type = DEADBAND_TYPES[profile.get("deadband_type", "none")]
+    if deadband_type == ua.DeadbandType.None_:
+        return None
+    mfilter = ua.DataChangeFilter()
+    mfilter.Trigger = ua.DataChangeTrigger.StatusValue
+    mfilter.DeadbandType = deadband_type
+    mfilter.DeadbandValue = float(profile.get("deadband_value", 0.0))
+    return mfilter
+
+# Build one monitored item request
+def monitored_item_request(subscription, nodeid, profile, mfilter=None):
+    """
+    Build the request monitoring one node's value with the parameters of a profile.
+
+    Parameters:
+        subscription (Subscription): The subscription the item is created in.
+        nodeid (ua.NodeId): The node.
+        profile (dict): The profile.
+        mfilter (ua.DataChangeFilter, optional): The deadband filter.
+
+    Returns:
+        ua.MonitoredItemCreateRequest: The request.
+    """
+    read_value = ua.ReadValueId()
+    read_value.NodeId = nodeid
+    read_value.AttributeId = ua.AttributeIds.Value
+    # Client handles are shared with the subscription's own subscribe calls and must stay unique
+    subscription._client_handle += 1
+    parameters = ua.MonitoringParameters()
+    parameters.ClientHandle = subscription._client_handle
+    parameters.SamplingInterval = float(profile.get("sampling_interval", 0))
+    parameters.QueueSize = int(profile.get("queue_size", 0))
+    parameters.DiscardOldest = True
+    if mfilter is not None:
+        parameters.Filter = mfilter
+    request = ua.MonitoredItemCreateRequest()
+    request.ItemToMonitor = read_value
+    request.MonitoringMode = ua.MonitoringMode.Reporting
+    request.RequestedParameters = parameters
+    return request
@@ -0,0 +1,362 @@
+import asyncio
+import gc
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+
+import pandas as pd
+from asyncua import Server, ua
+from asyncua.ua.ua_binary import struct_to_binary
+
+from address_space_snapshot import (NODESET_FILES, import_nodesets, init_address_space, init_from_snapshot,
+                                    snapshot_header_path, snapshot_key)
+from event_emitter import POINT_TURN_EVENT_TYPE
+from instance_simulator import INSTANCE_TEMPLATE
+from scenario_plan import SCENARIO_WORKBOOK, load_scenario_plan
+
+logger = logging.getLogger(__name__)
+
+# Load only the part of the nodesets that the scenarios, the events and the clients need
+PRUNE_ADDRESS_SPACE = os.getenv("OPCUA_PRUNE_ADDRESS_SPACE", "0") == "1"
+PRUNED_SNAPSHOT_PATH = os.getenv("OPCUA_PRUNED_SNAPSHOT", "address_space.pruned.snapshot")
+# Further NodeIds whose whole subtrees are kept, comma separated
+PRUNE_KEEP = [nodeid.strip() for nodeid in os.getenv("OPCUA_PRUNE_KEEP", "").split(",") if nodeid.strip()]
+# Client node list workbooks, comma separated; the ns/i rows of all their sheets are kept
+PRUNE_NODE_LISTS = [path.strip() for path in os.getenv("OPCUA_PRUNE_NODE_LISTS", "").split(",") if path.strip()]
+
+# Bump whenever the closure rules change so old pruned snapshots are treated as stale
+PRUNE_FORMAT_VERSION = 1
+# Namespaces from this index on come from the nodesets and are pruned; 0 (standard) and 1 (server) stay whole
+PRUNE_MIN_NAMESPACE = 2
+
+HAS_SUBTYPE = ua.NodeId(ua.ObjectIds.HasSubtype)
+HAS_TYPE_DEFINITION = ua.NodeId(ua.ObjectIds.HasTypeDefinition)
+HAS_PROPERTY = ua.NodeId(ua.ObjectIds.HasProperty)
+HAS_ENCODING = ua.NodeId(ua.ObjectIds.HasEncoding)
+TYPE_NODE_CLASSES = (ua.NodeClass.ObjectType, ua.NodeClass.VariableType, ua.NodeClass.DataType,
+                     ua.NodeClass.ReferenceType)
+
+# Collect the nodes the scenarios and clients reference
+def prune_seeds(plan, node_lists=PRUNE_NODE_LISTS, keep=PRUNE_KEEP):
+    """
+    Collect the nodes a pruned address space must contain.
+
+    Parameters:
+        plan (dict): The compiled scenario plan.
+        node_lists (list[str]): Client node list workbooks with ns and i columns.
+        keep (list[str]): Further NodeIds whose subtrees are kept.
+
+    Returns:
+        tuple[list[ua.NodeId], list[ua.NodeId]]: The nodes of the plan and
+        node lists, and the roots of the subtrees kept whole: the instance
+        template, the PointTurn event type and the keep list.
+    """
+    nodes = {node["nodeid"] for sheet in plan["sheets"].values() for node in sheet["nodes"]}
+    for path in node_lists:
+        for df in pd.read_excel(path, sheet_name=None, engine="openpyxl").values():
+            if {"ns", "i"} <= set(df.columns):
+                rows = df[["ns", "i"]].dropna()
+                nodes.update(ua.NodeId(int(i), int(ns)) for ns, i in zip(rows["ns"], rows["i"]))
+    subtrees = [ua.NodeId.from_string(nodeid) for nodeid in [INSTANCE_TEMPLATE, POINT_TURN_EVENT_TYPE] + keep]
+    return sorted(nodes, key=lambda nodeid: nodeid.to_string()), subtrees
+
+# Resident memory of this process, for the savings report
+def current_rss():
+    """
+    Read the resident set size of this process.
+
+    Returns:
+        int | None: The RSS in bytes, or None where /proc is not available.
+    """
+    try:
+        with open("/proc/self/status") as file:
+            return next(int(line.split()[1]) * 1024 for line in file if line.startswith("VmRSS:"))
+    except (OSError, StopIteration, ValueError):
+        return None
+
+# Key identifying the nodesets and seeds a pruned snapshot was built from
+def pruned_snapshot_key(nodes, subtrees, nodeset_files=NODESET_FILES):
+    digest = hashlib.sha256(f"{PRUNE_FORMAT_VERSION}:{snapshot_key(nodeset_files)}".encode())
+    for nodeid in list(nodes) + [None] + list(subtrees):
+        digest.update(f"{nodeid.to_string() if nodeid is not None else '|'};".encode())
+    return digest.hexdigest()
+
+def node_class(data):
+    return data.attributes[ua.AttributeIds.NodeClass].value.Value.Value
+
+# All reference types below a reference type
+def reference_subtypes(nodes, root):
+    found = {root}
+    pending = [root]
+    while pending:
+        for ref in nodes[pending.pop()].references:
+            if ref.IsForward and ref.ReferenceTypeId == HAS_SUBTYPE and ref.NodeId not in found:
+                found.add(ref.NodeId)
+                pending.append(ref.NodeId)
+    return found
+
+# Shortest hierarchical path to every node from the root
+def hierarchy_parents(nodes, hierarchical, root=ua.NodeId(ua.ObjectIds.RootFolder)):
+    parents = {root: None}
+    queue = deque([root])
+    while queue:
+        nodeid = queue.popleft()
+        for ref in nodes[nodeid].references:
+            if ref.IsForward and ref.ReferenceTypeId in hierarchical and ref.NodeId in nodes and ref.NodeId not in parents:
+                parents[ref.NodeId] = nodeid
+                queue.append(ref.NodeId)
+    return parents
+
+# Compute the nodes a pruned address space keeps
+def address_space_closure(nodes, seeds, subtrees, min_namespace=PRUNE_MIN_NAMESPACE):
+    """
+    Close a set of seed nodes over everything they need to be served.
+
+    Kept are the seeds, the whole hierarchical subtrees of the subtree roots,
+    and, for every kept node of a pruned namespace:
+    - its parents on the shortest hierarchical path from the Root folder,
+      so it stays browsable;
+    - its type definition, its data type, and the supertypes of its types;
+    - for data types, their encodings and properties (EnumStrings,
+      EnumValues).
+    A type among the subtree roots keeps the subtrees of its supertypes too,
+    because instances and events of it inherit their declarations. All
+    reference types of the pruned namespaces are kept, to interpret the
+    remaining references. Nodes of namespaces below min_namespace are kept
+    and not followed.
+
+    Parameters:
+        nodes (dict): The address space nodes, NodeId to NodeData.
+        seeds (list[ua.NodeId]): The nodes to keep.
+        subtrees (list[ua.NodeId]): The roots of subtrees to keep whole.
+        min_namespace (int): The first pruned namespace index.
+
+    Returns:
+        tuple[set[ua.NodeId], list[ua.NodeId]]: The kept nodes of the pruned
+        namespaces, and the seeds missing from the address space.
+    """
+    hierarchical = reference_subtypes(nodes, ua.NodeId(ua.ObjectIds.HierarchicalReferences))
+    parents = hierarchy_parents(nodes, hierarchical)
+    pending = [nodeid for nodeid in seeds if nodeid in nodes]
+    missing = [nodeid for nodeid in seeds if nodeid not in nodes]
+    pending += [nodeid for nodeid, data in nodes.items()
+                if nodeid.NamespaceIndex >= min_namespace and node_class(data) == ua.NodeClass.ReferenceType]
+
+    # Subtree roots, and the supertypes of the type roots, with all their hierarchical descendants
+    roots = [nodeid for nodeid in subtrees if nodeid in nodes]
+    missing += [nodeid for nodeid in subtrees if nodeid not in nodes]
+    expanded = set()
+    while roots:
+        nodeid = roots.pop()
+        if nodeid in expanded or nodeid.NamespaceIndex < min_namespace:
+            continue
+        expanded.add(nodeid)
+        pending.append(nodeid)
+        data = nodes[nodeid]
+        for ref in data.references:
+            if ref.NodeId not in nodes:
+                continue
+            if ref.IsForward and ref.ReferenceTypeId in hierarchical:
+                roots.append(ref.NodeId)
+            elif not ref.IsForward and ref.ReferenceTypeId == HAS_SUBTYPE and node_class(data) in TYPE_NODE_CLASSES:
+                roots.append(ref.NodeId)
+
+    keep = set()
+    while pending:
+        nodeid = pending.pop()
+        if nodeid in keep or nodeid not in nodes or nodeid.NamespaceIndex < min_namespace:
+            continue
+        keep.add(nodeid)
+        data = nodes[nodeid]
+        if parents.get(nodeid) is not None:
+            pending.append(parents[nodeid])
+        is_data_type = node_class(data) == ua.NodeClass.DataType
+        for ref in data.references:
+            if ref.IsForward and ref.ReferenceTypeId == HAS_TYPE_DEFINITION:
+                pending.append(ref.NodeId)
+            elif not ref.IsForward and ref.ReferenceTypeId == HAS_SUBTYPE:
+                pending.append(ref.NodeId)
+            elif is_data_type and ref.IsForward and ref.ReferenceTypeId in (HAS_ENCODING, HAS_PROPERTY):
+                pending.append(ref.NodeId)
+        data_type = data.attributes.get(ua.AttributeIds.DataType)
+        if data_type is not None:
+            pending.append(data_type.value.Value.Value)
+    return keep, missing
+
+# Remove the nodes outside the closure and the references to them
+def prune_address_space(nodes, keep, min_namespace=PRUNE_MIN_NAMESPACE):
+    """
+    Delete the nodes of the pruned namespaces that are not kept, in place.
+
+    References to deleted nodes are removed from the remaining nodes, so
+    browsing never returns a node that does not exist.
+
+    Parameters:
+        nodes (dict): The address space nodes, NodeId to NodeData.
+        keep (set[ua.NodeId]): The kept nodes of the pruned namespaces.
+        min_namespace (int): The first pruned namespace index.
+
+    Returns:
+        dict: The numbers of nodes and references removed.
+    """
+    removed = [nodeid for nodeid in nodes if nodeid.NamespaceIndex >= min_namespace and nodeid not in keep]
+    for nodeid in removed:
+        del nodes[nodeid]
+    references = 0
+    for data in nodes.values():
+        kept = [ref for ref in data.references if ref.NodeId in nodes or ref.NodeId.NamespaceIndex < min_namespace]
+        references += len(data.references) - len(kept)
+        data.references = kept
+    return {"nodes_removed": len(removed), "references_removed": references}
+
+# Size of a complete browse of the Objects folder
+def browse_size(nodes):
+    """
+    Sum the encoded references a client receives when it browses the whole Objects tree.
+
+    Every node reachable from the Objects folder is browsed for its forward
+    hierarchical references, like a client expanding the tree.
+
+    Parameters:
+        nodes (dict): The address space nodes, NodeId to NodeData.
+
+    Returns:
+        tuple[int, int]: The browsed nodes and the bytes of their ReferenceDescriptions.
+    """
+    hierarchical = reference_subtypes(nodes, ua.NodeId(ua.ObjectIds.HierarchicalReferences))
+    browsed = hierarchy_parents(nodes, hierarchical, ua.NodeId(ua.ObjectIds.ObjectsFolder))
+    size = sum(len(struct_to_binary(ref)) for nodeid in browsed for ref in nodes[nodeid].references
+               if ref.IsForward and ref.ReferenceTypeId in hierarchical)
+    return len(browsed), size
+
+# Build a snapshot of the pruned address space
+async def build_pruned_snapshot(nodes, subtrees, nodeset_files=NODESET_FILES, snapshot_path=PRUNED_SNAPSHOT_PATH):
+    """
+    Load the full address space into a fresh server, prune it and dump it.
+
+    The header records the kept and full node counts, the browse size of
+    the Objects tree before and after pruning, and the snapshot size.
+
+    Parameters:
+        nodes (list[ua.NodeId]): The seed nodes, see prune_seeds().
+        subtrees (list[ua.NodeId]): The roots of subtrees to keep whole.
+        nodeset_files (list[str]): The nodeset XML files in import order.
+        snapshot_path (str): The destination of the pruned snapshot.
+
+    Returns:
+        dict: The snapshot header.
+    """
+    start = time.perf_counter()
+    server = Server()
+    await init_address_space(server, nodeset_files)
+    aspace_nodes = server.iserver.aspace._nodes
+    full_nodes = len(aspace_nodes)
+    full_browsed, full_browse_bytes = browse_size(aspace_nodes)
+
+    keep, missing = address_space_closure(aspace_nodes, nodes, subtrees)
+    if missing:
+        logger.warning(f"{len(missing)} nodes to keep are not in the nodesets, e.g. "
+                       f"{', '.join(nodeid.to_string() for nodeid in missing[:5])}")
+    removed = prune_address_space(aspace_nodes, keep)
+    browsed, browse_bytes = browse_size(aspace_nodes)
+
+    header = {
+        "version": PRUNE_FORMAT_VERSION,
+        "key": pruned_snapshot_key(nodes, subtrees, nodeset_files),
+        "nodesets": [os.path.basename(path) for path in nodeset_files],
+        "namespaces": await server.get_namespace_array(),
+        "nodes": len(aspace_nodes),
+        "full_nodes": full_nodes,
+        "seeds": len(nodes),
+        "subtrees": [nodeid.to_string() for nodeid in subtrees],
+        "missing": len(missing),
+        "references_removed": removed["references_removed"],
+        "browsed_nodes": browsed,
+        "browse_bytes": browse_bytes,
+        "full_browsed_nodes": full_browsed,
+        "full_browse_bytes": full_browse_bytes,
+    }
+    tmp_path = f"{snapshot_path}.tmp{os.getpid()}"
+    server.iserver.dump_address_space(tmp_path)
+    os.replace(tmp_path, snapshot_path)
+    header["bytes"] = os.path.getsize(snapshot_path)
+    with open(snapshot_header_path(snapshot_path), "w") as file:
+        json.dump(header, file, indent=2)
+    del server, aspace_nodes
+    gc.collect()
+    logger.info(f"Pruned address space snapshot with {header['nodes']} of {full_nodes} nodes written to "
+                f"{snapshot_path} in {time.perf_counter() - start:.2f} s")
+    return header
+
+# Read the pruned snapshot header if it matches the nodesets and seeds
+def read_fresh_pruned_header(nodes, subtrees, nodeset_files=NODESET_FILES, snapshot_path=PRUNED_SNAPSHOT_PATH):
+    try:
+        with open(snapshot_header_path(snapshot_path)) as file:
+            header = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if not os.path.isfile(snapshot_path):
+        return None
+    if header.get("version") != PRUNE_FORMAT_VERSION or header.get("key") != pruned_snapshot_key(
+            nodes, subtrees, nodeset_files):
+        return None
+    return header
+
+# Initialize the server with only the nodes the scenarios and clients need
+async def init_pruned_address_space(server, plan, nodeset_files=NODESET_FILES, snapshot_path=PRUNED_SNAPSHOT_PATH):
+    """
+    Initialize the server from the pruned snapshot, building it first if it is missing or stale.
+
+    The standard namespace and the server's own namespace stay complete;
+    the nodeset namespaces keep the closure of the plan's nodes, the node
+    lists, the instance template and the PointTurn event type. The savings
+    against the full address space are logged, with the memory the load
+    added unless the snapshot was just built in this process.
+
+    Parameters:
+        server (Server): The OPC UA server instance, not yet initialized.
+        plan (dict): The compiled scenario plan.
+        nodeset_files (list[str]): The nodeset XML files in import order.
+        snapshot_path (str): The path of the pruned snapshot.
+
+    Returns:
+        str: "pruned", or "xml" if the pruned snapshot could not be loaded
+        and the full nodesets were imported instead.
+    """
+    nodes, subtrees = prune_seeds(plan)
+    header = read_fresh_pruned_header(nodes, subtrees, nodeset_files, snapshot_path)
+    rebuilt = header is None
+    if rebuilt:
+        logger.info(f"Pruned address space snapshot {snapshot_path} is missing or stale, building it")
+        header = await build_pruned_snapshot(nodes, subtrees, nodeset_files, snapshot_path)
+
+    # The memory freed by a build just before is reused by the load, so the growth is only reported without one
+    rss_before = None if rebuilt else current_rss()
+    start = time.perf_counter()
+    if not await init_from_snapshot(server, snapshot_path, header):
+        await import_nodesets(server, nodeset_files)
+        logger.warning("Could not load the pruned address space, imported the full nodesets instead")
+        return "xml"
+    rss_after = current_rss()
+    rss = f", RSS +{(rss_after - rss_before) / 2**20:.0f} MB" if rss_before is not None and rss_after is not None else ""
+    logger.info(f"Pruned address space loaded in {time.perf_counter() - start:.2f} s: {header['nodes']} of "
+                f"{header['full_nodes']} nodes ({100 * (1 - header['nodes'] / header['full_nodes']):.0f}% fewer), "
+                f"browse of Objects {header['browse_bytes'] // 1024} of {header['full_browse_bytes'] // 1024} KB, "
+                f"snapshot {header['bytes'] / 2**20:.1f} MB{rss}",
+                extra={"nodes": header["nodes"], "full_nodes": header["full_nodes"],
+                       "browse_bytes": header["browse_bytes"], "full_browse_bytes": header["full_browse_bytes"]})
+    return "pruned"
+
+if __name__ == "__main__":
+    # Build the pruned snapshot, e.g. at image build time: python address_space_pruning.py [snapshot path]
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    path = sys.argv[1] if len(sys.argv) > 1 else PRUNED_SNAPSHOT_PATH
+    seeds, roots = prune_seeds(load_scenario_plan(SCENARIO_WORKBOOK))
+    pruned_header = asyncio.run(build_pruned_snapshot(seeds, roots, snapshot_path=path))
+    print(f"Pruned address space snapshot with {pruned_header['nodes']} of {pruned_header['full_nodes']} nodes "
+          f"written to {path}; browse of Objects {pruned_header['browse_bytes']} of "
+          f"{pruned_header['full_browse_bytes']} bytes")
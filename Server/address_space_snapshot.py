@@ -0,0 +1,206 @@
+import asyncio
+import gc
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+
+import asyncua
+from asyncua import Server, ua
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the snapshot layout changes so old snapshots are treated as stale
+SNAPSHOT_FORMAT_VERSION = 1
+
+# Nodesets imported by the server, in import order
+NODESET_FILES = [
+    "eulynx.generic.bl4r3.rev01.xml",
+    "eulynx.manufacturer.example.bl4r3.rev01.xml",
+    "mdm.rev01.xml",
+]
+SNAPSHOT_PATH = os.getenv("OPCUA_ADDRESS_SPACE_SNAPSHOT", "address_space.snapshot")
+
+# Key identifying the nodesets and asyncua version a snapshot was built from
+def snapshot_key(nodeset_files=NODESET_FILES):
+    """
+    Hash the nodeset files, their order and the asyncua version.
+
+    Parameters:
+        nodeset_files (list[str]): The nodeset XML files in import order.
+
+    Returns:
+        str: The hex digest identifying a matching snapshot.
+    """
+    digest = hashlib.sha256(f"{SNAPSHOT_FORMAT_VERSION}:{asyncua.__version__}".encode())
+    for path in nodeset_files:
+        digest.update(os.path.basename(path).encode())
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 16), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+def snapshot_header_path(snapshot_path):
+    return f"{snapshot_path}.json"
+
+# Import the nodesets from XML
+async def import_nodesets(server, nodeset_files=NODESET_FILES):
+    """
+    Import the nodeset XML files into an initialized server.
+
+    Parameters:
+        server (Server): The OPC UA server instance.
+        nodeset_files (list[str]): The nodeset XML files in import order.
+
+    Returns:
+        None
+    """
+    for path in nodeset_files:
+        await server.import_xml(path)
+
+# Build a snapshot of the imported address space
+async def build_snapshot(nodeset_files=NODESET_FILES, snapshot_path=SNAPSHOT_PATH):
+    """
+    Import the nodesets into a fresh server and dump the address space.
+
+    The snapshot holds the complete address space (standard nodes included)
+    plus a JSON header with the nodeset key and the namespace array.
+
+    Parameters:
+        nodeset_files (list[str]): The nodeset XML files in import order.
+        snapshot_path (str): The destination of the binary snapshot.
+
+    Returns:
+        dict: The snapshot header.
+    """
+    server = Server()
+    await server.init()
+    await import_nodesets(server, nodeset_files)
+
+    header = {
+        "version": SNAPSHOT_FORMAT_VERSION,
+        "key": snapshot_key(nodeset_files),
+        "nodesets": [os.path.basename(path) for path in nodeset_files],
+        "namespaces": await server.get_namespace_array(),
+        "nodes": len(server.iserver.aspace.keys()),
+    }
+    tmp_path = f"{snapshot_path}.tmp{os.getpid()}"
+    server.iserver.dump_address_space(tmp_path)
+    os.replace(tmp_path, snapshot_path)
+    with open(snapshot_header_path(snapshot_path), "w") as file:
+        json.dump(header, file, indent=2)
+    return header
+
+# Read the snapshot header if the snapshot matches the nodesets
+def read_fresh_snapshot_header(nodeset_files=NODESET_FILES, snapshot_path=SNAPSHOT_PATH):
+    """
+    Check whether a snapshot exists and was built from the current nodesets.
+
+    Parameters:
+        nodeset_files (list[str]): The nodeset XML files in import order.
+        snapshot_path (str): The path of the binary snapshot.
+
+    Returns:
+        dict | None: The snapshot header, or None if missing or stale.
+    """
+    try:
+        with open(snapshot_header_path(snapshot_path)) as file:
+            header = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if not os.path.isfile(snapshot_path):
+        return None
+    if header.get("version") != SNAPSHOT_FORMAT_VERSION or header.get("key") != snapshot_key(nodeset_files):
+        return None
+    return header
+
+# Initialize the server address space from the snapshot or the nodesets
+async def init_address_space(server, nodeset_files=NODESET_FILES, snapshot_path=SNAPSHOT_PATH):
+    """
+    Initialize the server and populate its address space.
+
+    A fresh snapshot replaces both asyncua's standard address space fill and
+    the XML import. A missing, stale or unreadable snapshot falls back to the
+    regular init followed by the XML import.
+
+    Parameters:
+        server (Server): The OPC UA server instance, not yet initialized.
+        nodeset_files (list[str]): The nodeset XML files in import order.
+        snapshot_path (str): The path of the binary snapshot.
+
+    Returns:
+        str: "snapshot" or "xml", depending on the path taken.
+    """
+    start = time.perf_counter()
+    header = read_fresh_snapshot_header(nodeset_files, snapshot_path)
+    if header is None:
+        logger.info(f"Address space snapshot {snapshot_path} is missing or stale, importing XML")
+        await server.init()
+    elif await init_from_snapshot(server, snapshot_path, header):
+        logger.info(f"Address space loaded from snapshot {snapshot_path} in {time.perf_counter() - start:.2f} s")
+        return "snapshot"
+
+    # Either way init() has run with the standard address space, only the import is left
+    await import_nodesets(server, nodeset_files)
+    logger.info(f"Address space imported from XML in {time.perf_counter() - start:.2f} s")
+    return "xml"
+
+# Initialize the server with the snapshot standing in for the standard address space
+async def init_from_snapshot(server, snapshot_path, header):
+    """
+    Run server.init() with the snapshot loaded in place of the standard nodes.
+
+    Parameters:
+        server (Server): The OPC UA server instance, not yet initialized.
+        snapshot_path (str): The path of the binary snapshot.
+        header (dict): The snapshot header.
+
+    Returns:
+        bool: True if the snapshot was loaded, False if init() fell back to
+        the standard address space because the snapshot could not be read.
+    """
+    iserver = server.iserver
+    fill_standard_address_space = iserver.load_standard_address_space
+    loaded = False
+
+    # The snapshot already contains the standard nodes, so it replaces asyncua's fill
+    async def load_standard_address_space(shelf_file=None):
+        nonlocal loaded
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            iserver.load_address_space(snapshot_path)
+            loaded = True
+        except Exception as e:
+            logger.warning(f"Could not load address space snapshot {snapshot_path}: {e}")
+            iserver.aspace.clear()
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        if not loaded:
+            await fill_standard_address_space(shelf_file)
+
+    iserver.load_standard_address_space = load_standard_address_space
+    try:
+        await server.init()
+    finally:
+        del iserver.load_standard_address_space
+    if not loaded:
+        return False
+
+    # init() resets the namespace array to the standard and application URIs
+    namespace_node = server.get_node(ua.NodeId(ua.ObjectIds.Server_NamespaceArray))
+    namespaces = await namespace_node.read_value()
+    await namespace_node.write_value(namespaces[:2] + header["namespaces"][2:])
+    return True
+
+if __name__ == "__main__":
+    # Build the snapshot, e.g. at image build time: python address_space_snapshot.py [snapshot path]
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    path = sys.argv[1] if len(sys.argv) > 1 else SNAPSHOT_PATH
+    start = time.perf_counter()
+    snapshot_header = asyncio.run(build_snapshot(snapshot_path=path))
+    print(f"Address space snapshot with {snapshot_header['nodes']} nodes written to {path} "
+          f"in {time.perf_counter() - start:.2f} s")
@@ -0,0 +1,2 @@
+# Benchmarks for the OPC UA server. Run them from the Server directory, e.g.
+#     python -m benchmarks.bench_scenario_plan
@@ -0,0 +1,64 @@
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from asyncua import ua
+
+from amqp_bridge import AmqpBridge, LocalBroker, decode_envelope
+from scenario_plan import SCENARIO_WORKBOOK, load_scenario_plan
+
+def publish_steps(bridge, nodeids, steps, count):
+    """
+    Record count steps into the bridge and wait until they are published.
+
+    Returns the seconds taken by the callers and until the last envelope was published.
+    """
+    timestamp = datetime.utcnow()
+    bridge.start()
+    start = time.perf_counter()
+    for index in range(count):
+        timestamp += timedelta(seconds=1)
+        bridge.record_values(nodeids, steps[index % len(steps)], timestamp)
+    recorded = time.perf_counter() - start
+    bridge.close(timeout=60)
+    return recorded, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure AMQP bridge throughput against the local stand-in broker.")
+    parser.add_argument("--workbook", default=SCENARIO_WORKBOOK)
+    parser.add_argument("--steps", type=int, default=20000)
+    parser.add_argument("--delay-ms", type=float, default=2.0, help="publish latency of the slow broker run")
+    args = parser.parse_args()
+
+    plan = load_scenario_plan(args.workbook)
+    sheet = plan["sheets"]["1"]
+    nodeids = [node["nodeid"] for node in sheet["nodes"]]
+    steps = [[variant if variant is not None else ua.Variant(0, ua.VariantType.Int32) for variant in step["values"]]
+             for step in sheet["steps"]]
+    records = args.steps * len(nodeids)
+    print(f"{args.steps} writes of {len(nodeids)} values ({records} records)")
+    print(f"  {'batch':>6} {'compression':<12} {'msgs/s':>9} {'records/s':>11} {'bytes/record':>13} {'caller us/write':>16}")
+
+    for batch_size in (1, 50, 500, 5000):
+        for compression in ("", "deflate", "gzip"):
+            broker = LocalBroker()
+            bridge = AmqpBridge(broker, "bench", batch_size=batch_size, linger_seconds=0.05,
+                                compression=compression, outbox_size=args.steps)
+            recorded, seconds = publish_steps(bridge, nodeids, steps, args.steps)
+            assert bridge.counters["records"] == records, bridge.counters
+            envelope = decode_envelope(*broker.messages[-1])
+            assert envelope["values"], envelope
+            print(f"  {batch_size:>6} {compression or 'none':<12} {broker.counters['messages'] / seconds:>9.0f} "
+                  f"{records / seconds:>11.0f} {broker.counters['bytes'] / records:>13.1f} "
+                  f"{recorded / args.steps * 1e6:>16.2f}")
+
+    # A slow broker: the outbox fills up and the surplus is dropped instead of blocking the writers
+    broker = LocalBroker(delay=args.delay_ms / 1000)
+    bridge = AmqpBridge(broker, "bench", batch_size=len(nodeids), linger_seconds=0.05, outbox_size=1000)
+    recorded, seconds = publish_steps(bridge, nodeids, steps, args.steps)
+    print(f"Slow broker ({args.delay_ms:g} ms per publish, outbox of 1000 writes): "
+          f"{recorded / args.steps * 1e6:.2f} us/write for the callers, "
+          f"{bridge.counters['records']} records published, {bridge.counters['dropped']} writes dropped")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import argparse
+import asyncio
+import time
+
+from asyncua import Server, ua
+
+from address_space_snapshot import init_address_space
+from event_emitter import EVENT_MESSAGE, EVENT_SEVERITY, POINT_TURN_EVENT_TYPE, EventEmitter
+from instance_simulator import INSTANCE_TEMPLATE, clone_instances
+from scenario_plan import SCENARIO_WORKBOOK, load_scenario_plan
+
+class EventCounter:
+    """
+    Subscription handler counting delivered events and keeping the last one.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.last = None
+
+    def event_notification(self, event):
+        self.count += 1
+        self.last = event
+
+async def legacy_emit(server, event_type_node, sources, field_values):
+    """
+    Emit one event per source the way trigger_event used to: a new generator per event.
+    """
+    for source, fields in zip(sources, field_values):
+        generator = await server.get_event_generator(event_type_node, source)
+        generator.event.Severity = EVENT_SEVERITY
+        generator.event.Message = ua.LocalizedText(EVENT_MESSAGE)
+        for attribute, variant in fields:
+            setattr(generator.event, attribute, variant.Value)
+        await generator.trigger()
+
+async def measure(workbook, count, rounds):
+    server = Server()
+    await init_address_space(server)
+    plan = load_scenario_plan(workbook)
+    sheet = plan["sheets"]["1"]
+
+    template = server.get_node(INSTANCE_TEMPLATE)
+    if count == 1:
+        sources = [template]
+    else:
+        names, _, namespace_idx = await clone_instances(server, template, count)
+        sources = [server.get_node(ua.NodeId(name, namespace_idx)) for name in names]
+
+    emitter = EventEmitter(server, POINT_TURN_EVENT_TYPE)
+    fields = await emitter.map_fields(sheet["nodes"])
+    step_values = [emitter.field_values(fields, step["values"]) for step in sheet["steps"]]
+
+    # Creating the generators makes the sources event notifiers, which subscribing needs
+    prepare = time.perf_counter()
+    await emitter.prepare(sources)
+    prepare = time.perf_counter() - prepare
+
+    # One in-process subscriber on every source, so each event is filtered and queued
+    counter = EventCounter()
+    subscription = await server.create_subscription(50, counter)
+    for source in sources:
+        await subscription.subscribe_events(source, emitter.event_type)
+
+    results = {}
+    for label, emit in (
+        ("legacy", lambda values: legacy_emit(server, emitter.event_type, sources, values)),
+        ("cached", lambda values: emitter.emit(sources, values)),
+    ):
+        start = time.perf_counter()
+        for round_index in range(rounds):
+            await emit([step_values[round_index % len(step_values)]] * len(sources))
+        results[label] = rounds * len(sources) / (time.perf_counter() - start)
+
+    await asyncio.sleep(0.5)
+    await subscription.delete()
+    return results, prepare, counter
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-event generator creation with the cached event emitter.")
+    parser.add_argument("--workbook", default=SCENARIO_WORKBOOK)
+    parser.add_argument("--counts", type=int, nargs="+", default=[1, 1000])
+    parser.add_argument("--events", type=int, default=5000, help="Approximate events per path and instance count")
+    args = parser.parse_args()
+
+    print("PointTurn event emission with one in-process subscriber")
+    print(f"  {'instances':>9} {'legacy ev/s':>12} {'cached ev/s':>12} {'speedup':>8} {'prepare s':>10} {'delivered':>10}")
+    for count in args.counts:
+        rounds = max(args.events // count, 1)
+        results, prepare, counter = asyncio.run(measure(args.workbook, count, rounds))
+        legacy, cached = results["legacy"], results["cached"]
+        print(f"  {count:>9} {legacy:>12.0f} {cached:>12.0f} {cached / legacy:>7.1f}x {prepare:>10.2f} "
+              f"{counter.count:>10}")
+    print(f"  last event: IsEndPositionReached={counter.last.IsEndPositionReached}, "
+          f"CommandedPosition={counter.last.CommandedPosition}, FailureReason={counter.last.FailureReason}")
+
+if __name__ == "__main__":
+    main()
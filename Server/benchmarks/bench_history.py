@@ -0,0 +1,125 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from asyncua import ua
+
+from history_store import DiagnosticHistoryManager, RingHistory
+from scenario_plan import SCENARIO_WORKBOOK, load_scenario_plan
+
+async def ingest(storage, nodeids, steps, repeat):
+    """
+    Record every step of a sheet repeat times, returning the cost per step.
+    """
+    start = time.perf_counter()
+    timestamp = datetime.utcnow()
+    for round_index in range(repeat):
+        for values in steps:
+            timestamp += timedelta(seconds=5)
+            storage.record_values(nodeids, values, timestamp)
+        if storage._db is not None:
+            await storage.flush()
+    return (time.perf_counter() - start) / (repeat * len(steps))
+
+def read_params(details, nodeid):
+    params = ua.HistoryReadParameters()
+    params.HistoryReadDetails = details
+    read_value = ua.HistoryReadValueId()
+    read_value.NodeId = nodeid
+    params.NodesToRead.append(read_value)
+    return params
+
+async def read_all(manager, details, nodeid):
+    """
+    Read a raw history range, following continuation points.
+    """
+    values = 0
+    params = read_params(details, nodeid)
+    while True:
+        result = (await manager.read_history(params))[0]
+        values += len(result.HistoryData.DataValues)
+        if not result.ContinuationPoint:
+            return values
+        params.NodesToRead[0].ContinuationPoint = result.ContinuationPoint
+
+async def best_of(repeat, coroutine_factory):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = await coroutine_factory()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+async def run(workbook, nodes, step_seconds, repeat):
+    plan = load_scenario_plan(workbook)
+    sheet = plan["sheets"]["1"]
+    sheet_nodeids = [node["nodeid"] for node in sheet["nodes"]]
+    steps = [[variant if variant is not None else ua.Variant(0, ua.VariantType.Int32) for variant in step["values"]]
+             for step in sheet["steps"]]
+
+    print(f"Ingest cost per step ({len(sheet_nodeids)} nodes)")
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, db_path in (("memory", ""), ("memory + SQLite", os.path.join(tmp, "history.db"))):
+            storage = RingHistory(size=100000, db_path=db_path)
+            await storage.init()
+            for nodeid in sheet_nodeids:
+                await storage.new_historized_node(nodeid, None)
+            per_step = await ingest(storage, sheet_nodeids, steps, repeat=200)
+            await storage.stop()
+            print(f"  {label:<16} {per_step * 1e6:>8.1f} us/step {per_step / len(sheet_nodeids) * 1e9:>8.0f} ns/value")
+
+    # A day of steps for the requested number of nodes, cycling through the scenario values
+    day_steps = int(86400 / step_seconds)
+    nodeids = [ua.NodeId(f"bench_{index}", 1) for index in range(nodes)]
+    # The whole day stays in memory, above the default total bound
+    storage = RingHistory(size=day_steps, total_size=nodes * day_steps)
+    for nodeid in nodeids:
+        await storage.new_historized_node(nodeid, None)
+    day_start = datetime.utcnow() - timedelta(days=1)
+    start = time.perf_counter()
+    for step_index in range(day_steps):
+        values = steps[step_index % len(steps)]
+        storage.record_values(nodeids, [values[index % len(values)] for index in range(nodes)],
+                              day_start + timedelta(seconds=step_index * step_seconds))
+    fill_seconds = time.perf_counter() - start
+    print(f"Query latency over one day: {nodes} nodes, {day_steps} steps of {step_seconds:g} s "
+          f"({nodes * day_steps} values, filled in {fill_seconds:.1f} s)")
+
+    manager = DiagnosticHistoryManager(None, storage)
+    day_end = day_start + timedelta(days=1)
+    nodeid = nodeids[0]
+    queries = [
+        ("raw, last hour", lambda: read_all(manager, ua.ReadRawModifiedDetails(
+            StartTime=day_end - timedelta(hours=1), EndTime=day_end), nodeid)),
+        ("raw, whole day", lambda: read_all(manager, ua.ReadRawModifiedDetails(
+            StartTime=day_start, EndTime=day_end), nodeid)),
+        ("raw, latest 100", lambda: read_all(manager, ua.ReadRawModifiedDetails(
+            StartTime=ua.get_win_epoch(), EndTime=day_end, NumValuesPerNode=100), nodeid)),
+        ("average, 1 min", lambda: processed(manager, day_start, day_end, 60, nodeid)),
+        ("average, 1 h", lambda: processed(manager, day_start, day_end, 3600, nodeid)),
+    ]
+    print(f"  {'query':<16} {'ms':>8} {'values':>8}")
+    for label, factory in queries:
+        seconds, values = await best_of(repeat, factory)
+        print(f"  {label:<16} {seconds * 1000:>8.2f} {values:>8}")
+
+async def processed(manager, start, end, interval_seconds, nodeid):
+    details = ua.ReadProcessedDetails(StartTime=start, EndTime=end, ProcessingInterval=interval_seconds * 1000,
+                                      AggregateType=[ua.NodeId(ua.ObjectIds.AggregateFunction_Average)])
+    result = (await manager.read_history(read_params(details, nodeid)))[0]
+    return len(result.HistoryData.DataValues)
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure history ingest cost and HistoryRead latency.")
+    parser.add_argument("--workbook", default=SCENARIO_WORKBOOK)
+    parser.add_argument("--nodes", type=int, default=100)
+    parser.add_argument("--step-seconds", type=float, default=5.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.workbook, args.nodes, args.step_seconds, args.repeat))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import socket
+import time
+
+from asyncua import Server, ua
+from asyncua.ua.ua_binary import struct_to_binary
+
+from address_space_snapshot import init_address_space
+from event_emitter import is_event_specific
+from live_ingest import LiveIngest
+from node_writer import DataAccessViewWriter
+from scenario_plan import SCENARIO_WORKBOOK, load_scenario_plan
+
+NUMERIC_TYPES = (ua.VariantType.Float, ua.VariantType.Double, ua.VariantType.Int32, ua.VariantType.UInt16)
+
+def send_samples(port, nodes, seconds, per_line, sent):
+    """
+    Push samples of the given nodes over TCP as fast as possible for some seconds.
+    """
+    with socket.create_connection(("127.0.0.1", port)) as connection:
+        count = 0
+        value = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            chunk = []
+            for _ in range(200):
+                samples = []
+                for _ in range(per_line):
+                    samples.append({"node": nodes[count % len(nodes)], "value": value})
+                    count += 1
+                # Stay within the range of every numeric type, UInt16 included
+                value = (value + 1) % 1000
+                chunk.append(json.dumps(samples[0] if per_line == 1 else samples))
+            connection.sendall(("\n".join(chunk) + "\n").encode())
+    sent.value = count
+
+async def bench_ingest(server, plan, nodeids, node_count, per_line, seconds, interval, port):
+    ingest = LiveIngest(plan, DataAccessViewWriter(server), interval=interval)
+    await ingest.start(tcp_port=port)
+    flusher = asyncio.create_task(ingest.run())
+    context = multiprocessing.get_context("spawn")
+    sent = context.Value("q", 0)
+    nodes = [nodeid.to_string() for nodeid in nodeids[:node_count]]
+    sender = context.Process(target=send_samples, args=(port, nodes, seconds, per_line, sent))
+    sender.start()
+    # Time from the connection, not from the start of the sender process
+    while ingest.counters["connections"] == 0:
+        await asyncio.sleep(0.001)
+    start = time.perf_counter()
+    await asyncio.get_running_loop().run_in_executor(None, sender.join)
+    # Let the ingest read what is still buffered in the socket, then flush it
+    while ingest.counters["received"] < sent.value and time.perf_counter() - start < seconds + 30:
+        await asyncio.sleep(0.01)
+    wall = time.perf_counter() - start
+    await asyncio.sleep(interval * 2)
+    flusher.cancel()
+    ingest.close()
+    return ingest, sent.value, wall
+
+async def check_out_of_range(server, plan, nodeids, writer):
+    """
+    Check that samples outside the range of a node's type, or with a fraction for an integer
+    node, are counted as invalid and not written.
+    """
+    limits = {ua.VariantType.Int32: -5000000000000, ua.VariantType.UInt16: 70000, ua.VariantType.Float: 1e39}
+    ingest = LiveIngest(plan, DataAccessViewWriter(server))
+    checked = {}
+    for nodeid in nodeids:
+        variant_type = writer.variant_types[nodeid]
+        if variant_type in limits and variant_type not in checked:
+            checked[variant_type] = nodeid
+            ingest.feed(json.dumps({"node": nodeid.to_string(), "value": limits[variant_type]}))
+    await ingest.flush()
+    for variant_type in (ua.VariantType.Int32, ua.VariantType.UInt16):
+        if variant_type in checked:
+            ingest.feed(json.dumps({"node": checked[variant_type].to_string(), "value": 2.5}))
+            await ingest.flush()
+    fractions = sum(1 for variant_type in (ua.VariantType.Int32, ua.VariantType.UInt16) if variant_type in checked)
+    assert ingest.counters["invalid"] == len(checked) + fractions, ingest.counters
+    assert ingest.writer.counters["written"] == 0, ingest.writer.counters
+    for nodeid in checked.values():
+        # The value a client read would return must still encode
+        struct_to_binary(server.iserver.aspace.read_attribute_value(nodeid, ua.AttributeIds.Value))
+    return len(checked)
+
+async def bench_per_sample(server, nodeids, samples):
+    # One write call per sample, the way a naive gateway would apply them
+    writer = DataAccessViewWriter(server)
+    await writer.resolve(nodeids)
+    start = time.perf_counter()
+    for index in range(samples):
+        await writer.write([nodeids[index % len(nodeids)]], [ua.Variant(float(index), ua.VariantType.Double)])
+    return samples / (time.perf_counter() - start)
+
+async def run(args):
+    server = Server()
+    await init_address_space(server)
+    plan = load_scenario_plan(args.workbook)
+    writer = DataAccessViewWriter(server)
+    candidates = list(dict.fromkeys(node["nodeid"] for node in plan["sheets"]["default"]["nodes"]
+                                    if not is_event_specific(node["name"])))
+    await writer.resolve(candidates)
+    nodeids = [nodeid for nodeid in candidates if writer.variant_types.get(nodeid) in NUMERIC_TYPES]
+    print(f"{len(nodeids)} numeric nodes of the node list, {args.seconds:g} s per run, "
+          f"{args.interval * 1000:g} ms publishing interval")
+
+    print(f"  out-of-range samples of {await check_out_of_range(server, plan, nodeids, writer)} types rejected")
+    print(f"  per-sample writes: {await bench_per_sample(server, nodeids, 5000):10.0f} samples/s")
+    print(f"  {'nodes':>6} {'per line':>9} {'samples/s':>10} {'coalesced':>10} {'written':>8} {'flushes':>8} "
+          f"{'dropped':>8} {'invalid':>8}")
+    for node_count in args.nodes:
+        for per_line in args.per_line:
+            ingest, sent, wall = await bench_ingest(server, plan, nodeids, node_count, per_line, args.seconds,
+                                              args.interval, args.port)
+            counters = ingest.counters
+            print(f"  {min(node_count, len(nodeids)):>6} {per_line:>9} {counters['received'] / wall:>10.0f} "
+                  f"{counters['coalesced']:>10} {ingest.writer.counters['written']:>8} {counters['flushes']:>8} "
+                  f"{counters['dropped']:>8} {counters['invalid']:>8}")
+            assert counters["received"] == sent, (counters["received"], sent)
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure live ingestion throughput with write coalescing.")
+    parser.add_argument("--workbook", default=SCENARIO_WORKBOOK)
+    parser.add_argument("--nodes", type=int, nargs="+", default=[10, 500])
+    parser.add_argument("--per-line", type=int, nargs="+", default=[1, 50])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--interval", type=float, default=0.1)
+    parser.add_argument("--port", type=int, default=48700)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import argparse
+import asyncio
+import time
+
+from asyncua import Server
+
+from address_space_snapshot import init_address_space
+from instance_simulator import INSTANCE_TEMPLATE, InstanceSimulator, clone_instances
+from node_writer import DataAccessViewWriter
+from scenario_plan import SCENARIO_WORKBOOK, load_scenario_plan
+
+async def measure(workbook, count, scenario, ticks):
+    """
+    Clone the template count times and replay the scenario for a few step periods.
+    """
+    server = Server()
+    await init_address_space(server)
+    plan = load_scenario_plan(workbook)
+
+    start = time.perf_counter()
+    names, paths, namespace_idx = await clone_instances(server, server.get_node(INSTANCE_TEMPLATE), count)
+    clone_seconds = time.perf_counter() - start
+
+    writer = DataAccessViewWriter(server)
+    simulator = InstanceSimulator(writer, plan["sheets"][scenario], names, paths, namespace_idx,
+                                  step_seconds=1.0, jitter_seconds=1.0)
+    await simulator.write_defaults(plan["sheets"]["default"])
+    # The first tick writes every instance, the others only those whose step changed
+    await simulator.tick(0.0)
+
+    written = writer.counters["written"]
+    tick_times = []
+    for tick in range(1, ticks + 1):
+        start = time.perf_counter()
+        await simulator.tick(tick * 0.25)
+        tick_times.append(time.perf_counter() - start)
+    tick_times.sort()
+    return {
+        "nodes": count * len(paths),
+        "clone_seconds": clone_seconds,
+        "tick_median": tick_times[len(tick_times) // 2],
+        "tick_max": tick_times[-1],
+        "writes_per_tick": (writer.counters["written"] - written) / ticks,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure instance cloning and simulation tick cost.")
+    parser.add_argument("--workbook", default=SCENARIO_WORKBOOK)
+    parser.add_argument("--counts", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--scenario", default="1")
+    parser.add_argument("--ticks", type=int, default=40)
+    args = parser.parse_args()
+
+    print(f"Instance simulation, scenario '{args.scenario}', 1 s steps, 0.25 s ticks")
+    print(f"  {'instances':>9} {'nodes':>7} {'clone s':>8} {'us/node':>8} {'tick ms p50':>12} {'tick ms max':>12} {'writes/tick':>12}")
+    for count in args.counts:
+        result = asyncio.run(measure(args.workbook, count, args.scenario, args.ticks))
+        print(f"  {count:>9} {result['nodes']:>7} {result['clone_seconds']:>8.2f} "
+              f"{result['clone_seconds'] / result['nodes'] * 1e6:>8.1f} {result['tick_median'] * 1000:>12.2f} "
+              f"{result['tick_max'] * 1000:>12.2f} {result['writes_per_tick']:>12.1f}")
+
+if __name__ == "__main__":
+    main()
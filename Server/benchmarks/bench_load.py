@@ -0,0 +1,269 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+CLIENT_DIR = os.path.join(ROOT, "Client")
+CLIENT_WORKBOOK = os.path.join(CLIENT_DIR, "BL4R3-rev01-Diagnostic_NodeID_List-scenario.xlsx")
+
+# The S10 instance emitting the PointTurn events, and the event type
+EVENT_SOURCE = "ns=4;i=5057"
+EVENT_TYPE = "ns=2;i=1123"
+
+# Seconds to let the initial values of new subscriptions arrive; they carry old source timestamps
+SETTLE_SECONDS = 3.0
+
+# Clock ticks per second of the CPU times in /proc/<pid>/stat
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+def load_client_class():
+    """
+    Build the simulated subscriber on the Client's OPCUAClient subscription logic.
+
+    Notifications are timed against their source timestamps instead of
+    being logged, so the client side stays cheap.
+    """
+    sys.path.insert(0, CLIENT_DIR)
+    from opcua_client import OPCUAClient
+
+    class LatencyHandler(OPCUAClient.SubscriptionHandler):
+        def datachange_notification(self, node, val, data):
+            self.notifications += 1
+            self.client_obj.record(data.monitored_item.Value.SourceTimestamp)
+
+        def event_notification(self, event):
+            self.notifications += 1
+            self.client_obj.record(event.Time)
+
+    class LoadClient(OPCUAClient):
+        SubscriptionHandler = LatencyHandler
+
+        def __init__(self, excel_file):
+            super().__init__(excel_file, verbose=False)
+            self.measuring = False
+            self.latencies = []
+
+        def record(self, source_timestamp):
+            if not self.measuring or source_timestamp is None:
+                return
+            if source_timestamp.tzinfo is None:
+                source_timestamp = source_timestamp.replace(tzinfo=timezone.utc)
+            self.latencies.append((datetime.now(timezone.utc) - source_timestamp).total_seconds())
+
+    return LoadClient
+
+async def run_clients(url, count, excel_file, ready, go, duration, results):
+    """
+    Connect count subscribers, wait for the measurement window and report their latencies.
+    """
+    LoadClient = load_client_class()
+    clients = []
+    for _ in range(count):
+        load_client = LoadClient(excel_file)
+        client = await load_client.add_server(url)
+        if client is None:
+            continue
+        monitored = await load_client.monitor_nodes(client)
+        if monitored is not None:
+            subscriptions, handler = monitored
+            await subscriptions[0].subscribe_events(client.get_node(EVENT_SOURCE), client.get_node(EVENT_TYPE))
+            clients.append((load_client, handler))
+
+    await asyncio.sleep(SETTLE_SECONDS)
+    ready.wait()
+    await asyncio.get_running_loop().run_in_executor(None, go.wait)
+    for load_client, handler in clients:
+        load_client.measuring = True
+        handler.notifications = 0
+    await asyncio.sleep(duration)
+    for load_client, _ in clients:
+        load_client.measuring = False
+    results.put({
+        "clients": len(clients),
+        "notifications": sum(handler.notifications for _, handler in clients),
+        "latencies": [latency for load_client, _ in clients for latency in load_client.latencies],
+    })
+    for load_client, _ in clients:
+        await load_client.disconnect_from_server()
+
+def client_worker(url, count, excel_file, ready, go, duration, results):
+    # Keep the Client's own output out of the report
+    sys.stdout = open(os.devnull, "w")
+    asyncio.run(run_clients(url, count, excel_file, ready, go, duration, results))
+
+def process_stats(pid):
+    """
+    Read the CPU seconds and resident memory of a process from /proc.
+    """
+    with open(f"/proc/{pid}/stat") as file:
+        fields = file.read().rsplit(")", 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    with open(f"/proc/{pid}/status") as file:
+        rss = next(int(line.split()[1]) * 1024 for line in file if line.startswith("VmRSS:"))
+    return cpu, rss
+
+def scrape(port):
+    """
+    Read the sums and counts of the server's latency histograms from /metrics.
+    """
+    metrics = {}
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+        for line in response.read().decode().splitlines():
+            if line.startswith("#") or "_bucket" in line:
+                continue
+            name, value = line.rsplit(" ", 1)
+            # Labelled samples are summed, e.g. the step apply durations of all tracks
+            base = name.split("{")[0]
+            metrics[base] = metrics.get(base, 0.0) + float(value)
+    return metrics
+
+def histogram_delta(before, after, name):
+    count = after.get(f"{name}_count", 0) - before.get(f"{name}_count", 0)
+    total = after.get(f"{name}_sum", 0) - before.get(f"{name}_sum", 0)
+    return {"count": int(count), "mean_ms": round(total / count * 1000, 3) if count else None}
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def wait_for_port(port, process, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server.py exited with code {process.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.5)
+    raise TimeoutError(f"server.py did not listen on port {port} within {timeout} s")
+
+def start_server(port, metrics_port, time_scale, instances):
+    env = dict(os.environ,
+               OPCUA_SERVER_PORT=str(port),
+               OPCUA_ENDPOINT=f"opc.tcp://0.0.0.0:{port}/EULYNX",
+               OPCUA_METRICS_PORT=str(metrics_port),
+               OPCUA_TIME_SCALE=str(time_scale),
+               OPCUA_INSTANCES=str(instances),
+               OPCUA_LOG_LEVEL="WARNING")
+    return subprocess.Popen([sys.executable, "server.py"], env=env, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+
+def run_level(server, args, url, clients):
+    """
+    Measure one client count: subscribe, then record a window of scenario playback.
+    """
+    context = multiprocessing.get_context("spawn")
+    workers = min(args.workers, clients)
+    ready = context.Barrier(workers + 1)
+    go = context.Event()
+    results = context.Queue()
+    counts = [clients // workers + (1 if index < clients % workers else 0) for index in range(workers)]
+
+    _, rss_before = process_stats(server.pid)
+    processes = [context.Process(target=client_worker,
+                                 args=(url, count, args.workbook, ready, go, args.duration, results))
+                 for count in counts]
+    setup_start = time.perf_counter()
+    for process in processes:
+        process.start()
+    ready.wait(timeout=args.setup_timeout)
+    setup_seconds = time.perf_counter() - setup_start
+
+    _, rss_after = process_stats(server.pid)
+    metrics_before = scrape(args.metrics_port)
+    cpu_before, _ = process_stats(server.pid)
+    go.set()
+    window_start = time.perf_counter()
+    reports = [results.get(timeout=args.duration + args.setup_timeout) for _ in processes]
+    window = time.perf_counter() - window_start
+    cpu_after, _ = process_stats(server.pid)
+    metrics_after = scrape(args.metrics_port)
+    for process in processes:
+        process.join(timeout=30)
+
+    latencies = [latency for report in reports for latency in report["latencies"]]
+    connected = sum(report["clients"] for report in reports)
+    return {
+        "clients": clients,
+        "connected": connected,
+        "setup_seconds": round(setup_seconds, 2),
+        "window_seconds": round(window, 2),
+        "notifications": sum(report["notifications"] for report in reports),
+        "notifications_per_second": round(sum(report["notifications"] for report in reports) / window, 1),
+        "latency_ms": {name: round(percentile(latencies, fraction) * 1000, 2) if latencies else None
+                       for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0))},
+        "server_cpu_percent": round(100 * (cpu_after - cpu_before) / window, 1),
+        "server_rss_mb": round(rss_after / 2 ** 20, 1),
+        "memory_per_session_kb": round((rss_after - rss_before) / 1024 / connected, 1) if connected else None,
+        "sessions": metrics_before.get("opcua_sessions"),
+        "monitored_items": metrics_before.get("opcua_monitored_items"),
+        "write": histogram_delta(metrics_before, metrics_after, "opcua_write_seconds"),
+        "event_trigger": histogram_delta(metrics_before, metrics_after, "opcua_event_trigger_seconds"),
+        "step_apply": histogram_delta(metrics_before, metrics_after, "opcua_step_apply_seconds"),
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=ROOT).stdout.strip() or None
+    except OSError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test server.py with simulated subscribers.")
+    parser.add_argument("--clients", default="1,10,50", help="comma-separated client counts, one run each")
+    parser.add_argument("--workers", type=int, default=4, help="client processes per run")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds measured per run")
+    parser.add_argument("--time-scale", type=float, default=10.0, help="OPCUA_TIME_SCALE of the server")
+    parser.add_argument("--instances", type=int, default=0, help="OPCUA_INSTANCES of the server")
+    parser.add_argument("--port", type=int, default=48400)
+    parser.add_argument("--metrics-port", type=int, default=19464)
+    parser.add_argument("--setup-timeout", type=float, default=300.0)
+    parser.add_argument("--workbook", default=CLIENT_WORKBOOK, help="the Client's node list")
+    parser.add_argument("--report", default="load_report.json")
+    args = parser.parse_args()
+
+    url = f"opc.tcp://127.0.0.1:{args.port}/EULYNX"
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key != "report"},
+        "runs": [],
+    }
+    server = start_server(args.port, args.metrics_port, args.time_scale, args.instances)
+    try:
+        wait_for_port(args.port, server, args.setup_timeout)
+        print(f"{'clients':>7} {'notif/s':>9} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8} "
+              f"{'cpu %':>6} {'kB/session':>10} {'step ms':>8} {'event ms':>8}")
+        for clients in (int(count) for count in args.clients.split(",")):
+            run = run_level(server, args, url, clients)
+            report["runs"].append(run)
+            latency = run["latency_ms"]
+            print(f"{run['connected']:>7} {run['notifications_per_second']:>9} {latency['p50']!s:>8} "
+                  f"{latency['p90']!s:>8} {latency['p99']!s:>8} {latency['max']!s:>8} "
+                  f"{run['server_cpu_percent']:>6} {run['memory_per_session_kb']!s:>10} "
+                  f"{run['step_apply']['mean_ms']!s:>8} {run['event_trigger']['mean_ms']!s:>8}")
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    with open(args.report, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Report written to {args.report}")
+
+if __name__ == "__main__":
+    main()
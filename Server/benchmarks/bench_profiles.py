@@ -0,0 +1,175 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import sys
+import time
+
+from benchmarks.bench_load import CLIENT_DIR, CLIENT_WORKBOOK, start_server, wait_for_port
+
+# Seconds to let the initial values of the new subscriptions arrive, after the slowest publishing interval
+SETTLE_SECONDS = 2.0
+
+def load_client_class():
+    """
+    Build a counting subscriber on the Client's OPCUAClient, counting notifications and received bytes.
+    """
+    sys.path.insert(0, CLIENT_DIR)
+    from opcua_client import OPCUAClient
+
+    class CountingClient(OPCUAClient):
+        def __init__(self, excel_file, profiles):
+            super().__init__(excel_file, verbose=False, profiles=profiles)
+            self.counters = {"notifications": 0, "bytes_received": 0, "bytes_sent": 0}
+            self.by_node = {}
+
+        def log_data(self, node, val):
+            self.counters["notifications"] += 1
+            key = node.nodeid.to_string()
+            self.by_node[key] = self.by_node.get(key, 0) + 1
+
+        def count_traffic(self, client):
+            protocol = client.uaclient.protocol
+            data_received = protocol.data_received
+            write = protocol.transport.write
+
+            def counting_data_received(data):
+                self.counters["bytes_received"] += len(data)
+                data_received(data)
+
+            def counting_write(data):
+                self.counters["bytes_sent"] += len(data)
+                write(data)
+            protocol.data_received = counting_data_received
+            protocol.transport.write = counting_write
+
+    return CountingClient
+
+def workload(opcua_client, seed):
+    """
+    Pick the changing nodes of the workload from the node list, by what they are rather than by profile.
+
+    Returns (interval seconds, node, kind) per changing node: positions and
+    statuses every 0.2 s, measurements jitter every 0.1 s, other enumerations,
+    counters and flags every 2 s. Identification and configuration nodes
+    (strings, dates and the rows the built-in rules call static) stay put.
+    """
+    from subscription_profiles import DEFAULT_RULES, name_key
+    fast = {name_key(name) for name in DEFAULT_RULES[0]["names"]}
+    static = {name_key(name) for name in DEFAULT_RULES[1]["names"]}
+    rng = random.Random(seed)
+    nodes = []
+    for node in opcua_client.node_info:
+        datatype = str(node["DataType"])
+        name = name_key(node["Name"])
+        nodeid = f"ns={node['ns']};i={node['i']}"
+        if name in static or "String" in datatype or "DateTime" in datatype or datatype == "nan":
+            continue
+        if "Float" in datatype or "Double" in datatype:
+            nodes.append((0.1, nodeid, "analog", rng.uniform(10, 90)))
+        elif "Boolean" in datatype:
+            nodes.append((0.2 if name in fast else 2.0, nodeid, "flag", False))
+        else:
+            nodes.append((0.2 if name in fast else 2.0, nodeid, "state", 1))
+    return nodes
+
+def drive(port, nodes, seconds, seed):
+    """
+    Push the workload into the server's live ingest for some seconds.
+    """
+    rng = random.Random(seed)
+    values = {nodeid: value for _, nodeid, _, value in nodes}
+    due = {nodeid: 0.0 for _, nodeid, _, _ in nodes}
+    start = time.monotonic()
+    with socket.create_connection(("127.0.0.1", port)) as connection:
+        while time.monotonic() - start < seconds:
+            elapsed = time.monotonic() - start
+            samples = []
+            for interval, nodeid, kind, _ in nodes:
+                if elapsed < due[nodeid]:
+                    continue
+                due[nodeid] = elapsed + interval
+                if kind == "analog":
+                    # Sensor noise of +-0.2 around the value, and a real move of 5 now and then
+                    values[nodeid] += rng.uniform(-0.2, 0.2) + (rng.choice((-5, 5)) if rng.random() < 0.02 else 0)
+                elif kind == "flag":
+                    values[nodeid] = not values[nodeid]
+                else:
+                    values[nodeid] = values[nodeid] % 3 + 1
+                samples.append({"node": nodeid, "value": values[nodeid]})
+            if samples:
+                connection.sendall((json.dumps(samples) + "\n").encode())
+            time.sleep(0.02)
+
+async def run(args):
+    env_ingest = {"OPCUA_INGEST_TCP_PORT": str(args.ingest_port), "OPCUA_INGEST_INTERVAL_SECONDS": "0.05",
+                  "OPCUA_SCENARIO_TRACKS": "" if args.no_scenarios else os.getenv("OPCUA_SCENARIO_TRACKS", "default,1,default,2")}
+    os.environ.update(env_ingest)
+    server = start_server(args.port, args.metrics_port, args.time_scale, 0)
+    try:
+        wait_for_port(args.port, server, 300)
+        wait_for_port(args.ingest_port, server, 30)
+        CountingClient = load_client_class()
+        url = f"opc.tcp://127.0.0.1:{args.port}/EULYNX"
+        setups = {"single 500 ms subscription": CountingClient(args.workbook, "single"),
+                  "subscription profiles": CountingClient(args.workbook, args.profiles)}
+        for opcua_client in setups.values():
+            client = await opcua_client.add_server(url)
+            opcua_client.count_traffic(client)
+            await opcua_client.monitor_nodes(client)
+        slowest = max(profile["publishing_interval"] for opcua_client in setups.values()
+                      for profile in opcua_client.profiles.values())
+        await asyncio.sleep(slowest / 1000 + SETTLE_SECONDS)
+        before = {label: (dict(opcua_client.counters), dict(opcua_client.by_node)) for label, opcua_client in setups.items()}
+
+        nodes = workload(setups["single 500 ms subscription"], args.seed)
+        print(f"Workload: {len(nodes)} changing nodes for {args.seconds:g} s"
+              f"{'' if args.no_scenarios else ' on top of the scenario playback'}")
+        await asyncio.get_running_loop().run_in_executor(None, drive, args.ingest_port, nodes, args.seconds, args.seed)
+        await asyncio.sleep(1.5)
+
+        print(f"  {'':<28} {'subscriptions':>13} {'notifications':>14} {'per s':>8} {'kB received':>12} "
+              f"{'kB/s':>7} {'kB sent':>8}")
+        results = {}
+        for label, opcua_client in setups.items():
+            delta = {key: opcua_client.counters[key] - before[label][0][key] for key in opcua_client.counters}
+            results[label] = delta
+            print(f"  {label:<28} {len(opcua_client.subscriptions):>13} {delta['notifications']:>14} "
+                  f"{delta['notifications'] / args.seconds:>8.0f} {delta['bytes_received'] / 1024:>12.1f} "
+                  f"{delta['bytes_received'] / 1024 / args.seconds:>7.1f} {delta['bytes_sent'] / 1024:>8.1f}")
+        # Notifications per profile of the profiled client's assignment, for both setups
+        profiled = setups["subscription profiles"]
+        node_profile = {f"ns={node['ns']};i={node['i']}": profile
+                        for node, profile in zip(profiled.node_info, profiled.node_profiles)}
+        print(f"  {'notifications by profile':<28} {'nodes':>6} " + " ".join(f"{label:>28}" for label in setups))
+        for profile in profiled.profiles:
+            counts = [sum(count - before[label][1].get(key, 0) for key, count in opcua_client.by_node.items()
+                          if node_profile.get(key) == profile) for label, opcua_client in setups.items()]
+            nodes = sum(1 for value in node_profile.values() if value == profile)
+            print(f"  {profile:<28} {nodes:>6} " + " ".join(f"{count:>28}" for count in counts))
+        single, profiles = results.values()
+        print(f"  profiles vs single: {100 * (1 - profiles['notifications'] / single['notifications']):.0f}% fewer "
+              f"notifications, {100 * (1 - profiles['bytes_received'] / single['bytes_received']):.0f}% fewer bytes received")
+        for opcua_client in setups.values():
+            await opcua_client.disconnect_from_server()
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare one 500 ms subscription with subscription profiles.")
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--profiles", default="", help="OPCUA_SUBSCRIPTION_PROFILES of the profiled client")
+    parser.add_argument("--time-scale", type=float, default=10.0)
+    parser.add_argument("--no-scenarios", action="store_true", help="only the ingested workload")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--port", type=int, default=48420)
+    parser.add_argument("--metrics-port", type=int, default=19420)
+    parser.add_argument("--ingest-port", type=int, default=48421)
+    parser.add_argument("--workbook", default=CLIENT_WORKBOOK)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from asyncua import Client, ua
+from asyncua.ua.ua_binary import struct_to_binary
+
+from address_space_pruning import PRUNED_SNAPSHOT_PATH, build_pruned_snapshot, prune_seeds, read_fresh_pruned_header
+from address_space_snapshot import SNAPSHOT_PATH, build_snapshot, read_fresh_snapshot_header
+from benchmarks.bench_load import EVENT_SOURCE, EVENT_TYPE, process_stats, scrape, start_server, wait_for_port
+from scenario_plan import SCENARIO_WORKBOOK, load_scenario_plan
+
+# Nodes per Browse request of the client's tree walk
+BROWSE_BATCH = 500
+
+# Child process: initialize a server through one path and report the timings and memory as JSON
+CHILD_SCRIPT = """
+import asyncio, json, resource, sys, time
+from asyncua import Server
+from address_space_pruning import init_pruned_address_space
+from address_space_snapshot import init_address_space
+from scenario_plan import SCENARIO_WORKBOOK, load_scenario_plan
+
+def rss():
+    with open("/proc/self/status") as file:
+        return next(int(line.split()[1]) * 1024 for line in file if line.startswith("VmRSS:"))
+
+async def run():
+    plan = load_scenario_plan(SCENARIO_WORKBOOK)
+    server = Server()
+    before, start = rss(), time.perf_counter()
+    if sys.argv[1] == "pruned":
+        source = await init_pruned_address_space(server, plan)
+    else:
+        source = await init_address_space(server)
+    return source, len(server.iserver.aspace.keys()), time.perf_counter() - start, rss() - before
+
+source, nodes, init, grown = asyncio.run(run())
+print(json.dumps({"source": source, "nodes": nodes, "init": init, "rss_growth": grown,
+                  "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}))
+"""
+
+def run_child(mode):
+    """
+    Start a fresh interpreter that initializes the full or the pruned address space once.
+    """
+    result = subprocess.run([sys.executable, "-c", CHILD_SCRIPT, mode], capture_output=True, text=True, check=True,
+                            cwd=os.getcwd())
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+# Browse the whole Objects tree the way a client expanding it does
+async def browse_tree(client):
+    """
+    Browse every node below the Objects folder for its forward hierarchical references.
+
+    Returns:
+        tuple[int, int, float]: The browsed nodes, the bytes of the returned
+        ReferenceDescriptions and the seconds taken.
+    """
+    start = time.perf_counter()
+    seen = {ua.NodeId(ua.ObjectIds.ObjectsFolder)}
+    level = list(seen)
+    size = 0
+    while level:
+        following = []
+        for offset in range(0, len(level), BROWSE_BATCH):
+            parameters = ua.BrowseParameters()
+            for nodeid in level[offset:offset + BROWSE_BATCH]:
+                description = ua.BrowseDescription()
+                description.NodeId = nodeid
+                description.BrowseDirection = ua.BrowseDirection.Forward
+                description.ReferenceTypeId = ua.NodeId(ua.ObjectIds.HierarchicalReferences)
+                description.IncludeSubtypes = True
+                description.ResultMask = ua.BrowseResultMask.All
+                parameters.NodesToBrowse.append(description)
+            for result in await client.uaclient.browse(parameters):
+                for ref in result.References:
+                    size += len(struct_to_binary(ref))
+                    if ref.NodeId not in seen:
+                        seen.add(ref.NodeId)
+                        following.append(ref.NodeId)
+        level = following
+    return len(seen), size, time.perf_counter() - start
+
+# Start server.py with or without pruning, browse it and check that it still emits events
+async def measure_server(pruned, port, metrics_port, instances, event_seconds):
+    os.environ["OPCUA_PRUNE_ADDRESS_SPACE"] = "1" if pruned else "0"
+    started = time.perf_counter()
+    server = start_server(port, metrics_port, 1.0, instances)
+    try:
+        wait_for_port(port, server, 120)
+        ready = time.perf_counter() - started
+        async with Client(f"opc.tcp://127.0.0.1:{port}/EULYNX") as client:
+            browsed, size, seconds = await browse_tree(client)
+            received = []
+
+            class Handler:
+                def event_notification(self, event):
+                    received.append(event)
+
+            subscription = await client.create_subscription(250, Handler())
+            event_type = client.get_node(EVENT_TYPE)
+            await subscription.subscribe_events(client.get_node(EVENT_SOURCE), event_type)
+            await asyncio.sleep(event_seconds)
+            await subscription.delete()
+        _, rss = process_stats(server.pid)
+        nodes = int(scrape(metrics_port).get("opcua_address_space_nodes", 0))
+    finally:
+        server.terminate()
+        server.wait(10)
+    return {"ready": ready, "nodes": nodes, "rss": rss, "browsed": browsed, "browse_bytes": size,
+            "browse_seconds": seconds, "events": len(received)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the full address space with the pruned one.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--port", type=int, default=48410)
+    parser.add_argument("--metrics-port", type=int, default=48411)
+    parser.add_argument("--instances", type=int, default=4)
+    parser.add_argument("--event-seconds", type=float, default=20.0)
+    args = parser.parse_args()
+
+    if read_fresh_snapshot_header() is None:
+        print(f"Building snapshot {SNAPSHOT_PATH} ...")
+        asyncio.run(build_snapshot())
+    nodes, subtrees = prune_seeds(load_scenario_plan(SCENARIO_WORKBOOK))
+    header = read_fresh_pruned_header(nodes, subtrees)
+    if header is None:
+        print(f"Building pruned snapshot {PRUNED_SNAPSHOT_PATH} ...")
+        started = time.perf_counter()
+        header = asyncio.run(build_pruned_snapshot(nodes, subtrees))
+        print(f"  built in {time.perf_counter() - started:.2f} s")
+    print(f"Closure of {header['seeds']} plan nodes and the subtrees of {', '.join(header['subtrees'])}: "
+          f"{header['nodes']} of {header['full_nodes']} nodes, snapshot {header['bytes'] / 2**20:.1f} MB "
+          f"instead of {os.path.getsize(SNAPSHOT_PATH) / 2**20:.1f} MB")
+
+    print(f"Address space initialization over {args.repeat} runs (median)")
+    print(f"  {'':<7} {'nodes':>6} {'init s':>7} {'RSS growth MB':>14} {'peak RSS MB':>12}")
+    for mode in ("full", "pruned"):
+        reports = [run_child(mode) for _ in range(args.repeat)]
+        print(f"  {mode:<7} {reports[0]['nodes']:>6} {statistics.median(r['init'] for r in reports):>7.2f} "
+              f"{statistics.median(r['rss_growth'] for r in reports) / 2**20:>14.1f} "
+              f"{statistics.median(r['peak_rss'] for r in reports) / 2**20:>12.1f}")
+
+    print(f"server.py with {args.instances} simulated instances, full tree browse of Objects, "
+          f"PointTurn events over {args.event_seconds:g} s")
+    print(f"  {'':<7} {'nodes':>6} {'ready s':>8} {'RSS MB':>7} {'browsed':>8} {'browse kB':>10} {'browse s':>9} "
+          f"{'events':>7}")
+    for pruned in (False, True):
+        result = asyncio.run(measure_server(pruned, args.port, args.metrics_port, args.instances, args.event_seconds))
+        print(f"  {'pruned' if pruned else 'full':<7} {result['nodes']:>6} {result['ready']:>8.2f} "
+              f"{result['rss'] / 2**20:>7.1f} {result['browsed']:>8} {result['browse_bytes'] / 1024:>10.1f} "
+              f"{result['browse_seconds']:>9.2f} {result['events']:>7}")
+
+if __name__ == "__main__":
+    main()
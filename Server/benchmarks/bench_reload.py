@@ -0,0 +1,96 @@
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+import openpyxl
+
+from scenario_plan import SCENARIO_WORKBOOK, load_scenario_plan
+from scenario_reload import ScenarioReloader
+
+async def watch_loop(stalls, stop):
+    """
+    Tick every millisecond and keep the longest gap between ticks, i.e. the longest event loop stall.
+    """
+    loop = asyncio.get_running_loop()
+    last = loop.time()
+    while not stop.is_set():
+        await asyncio.sleep(0.001)
+        now = loop.time()
+        stalls.append(now - last)
+        last = now
+
+async def measure(label, action):
+    stalls = []
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(watch_loop(stalls, stop))
+    await asyncio.sleep(0.05)
+    start = time.perf_counter()
+    result = await action()
+    wall = time.perf_counter() - start
+    stop.set()
+    await watcher
+    print(f"  {label:<40} {wall * 1000:>9.2f} {max(stalls) * 1000:>14.2f}")
+    return result
+
+def edit_workbook(path, edit):
+    workbook = openpyxl.load_workbook(path)
+    edit(workbook)
+    workbook.save(path)
+
+def change_cell(workbook):
+    # Flip isTimeSynchronised of the controller in step 2 of scenario 2
+    cell = workbook["2"].cell(row=3, column=9)
+    cell.value = "False" if cell.value == "True" else "True"
+
+def add_sheet(workbook):
+    workbook.copy_worksheet(workbook["1"]).title = "3"
+
+async def run(source, repeat):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, os.path.basename(source))
+        cache_dir = os.path.join(tmp, "plan_cache")
+        shutil.copy(source, path)
+        plan = load_scenario_plan(path, cache_dir)
+        reloader = ScenarioReloader(plan, path, cache_dir=cache_dir)
+
+        print(f"  {'':<40} {'wall ms':>9} {'loop stall ms':>14}")
+        start = time.perf_counter()
+        for _ in range(repeat * 100):
+            await reloader.check()
+        print(f"  {'check, workbook unchanged (stat)':<40} {(time.perf_counter() - start) / (repeat * 100) * 1000:>9.3f}")
+
+        os.utime(path)
+        await measure("check after touch (hash only)", reloader.check)
+
+        for _ in range(repeat):
+            edit_workbook(path, change_cell)
+            diff = await measure("check after one changed cell", reloader.check)
+        print(f"    changed: {list(diff['changed'])}, "
+              + ", ".join(f"{key} {len(value) if isinstance(value, list) else value}"
+                          for key, value in diff["changed"]["2"].items()))
+
+        edit_workbook(path, add_sheet)
+        diff = await measure("check after an added sheet", reloader.check)
+        print(f"    added: {diff['added']}, changed: {list(diff['changed'])}")
+
+        # The previous way to pick up a change: recompiling the workbook on the event loop
+        edit_workbook(path, change_cell)
+        shutil.rmtree(cache_dir)
+
+        async def compile_on_loop():
+            return load_scenario_plan(path, cache_dir)
+        await measure("full compile on the event loop", compile_on_loop)
+        reloader.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure scenario workbook hot reload.")
+    parser.add_argument("--workbook", default=SCENARIO_WORKBOOK)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(run(args.workbook, args.repeat))
+
+if __name__ == "__main__":
+    main()
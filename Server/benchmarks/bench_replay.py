@@ -0,0 +1,68 @@
+import argparse
+import asyncio
+import csv
+import os
+import resource
+import tempfile
+import time
+from datetime import timedelta
+
+from asyncua import Server
+
+from address_space_snapshot import init_address_space
+from log_replay import LogReplay, read_log
+from node_writer import DataAccessViewWriter
+
+CLIENT_LOG = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                          "Client", "opcua_data_log.csv")
+
+def write_long_log(source, path, repeat):
+    """
+    Concatenate a recorded log repeat times, shifting the timestamps of every copy.
+
+    Returns the number of records and the recorded seconds of the long log.
+    """
+    records = list(read_log(source))
+    span = (records[-1][0] - records[0][0]) + timedelta(seconds=1)
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["timestamp", "Name", "Node", "value"])
+        for copy_index in range(repeat):
+            shift = span * copy_index
+            writer.writerows((timestamp + shift, "", nodeid.to_string(), value) for timestamp, nodeid, value in records)
+    return len(records) * repeat, (span * repeat).total_seconds()
+
+async def run(source, repeat, speeds, slices):
+    server = Server()
+    await init_address_space(server)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "long_log.csv")
+        records, seconds = write_long_log(source, path, repeat)
+        print(f"Replaying {records} records covering {seconds / 3600:.1f} recorded hours "
+              f"({os.path.getsize(path) / 2 ** 20:.1f} MB)")
+        print(f"  {'speed':>8} {'slice ms':>9} {'wall s':>7} {'achieved':>9} {'records/s':>10} "
+              f"{'writes':>7} {'coalesced':>10} {'values written':>15} {'late p99 ms':>12}")
+        for speed in speeds:
+            for slice_seconds in slices:
+                writer = DataAccessViewWriter(server)
+                replay = LogReplay(path, writer, speed=speed, slice_seconds=slice_seconds)
+                start = time.perf_counter()
+                lateness = await replay.play()
+                wall = time.perf_counter() - start
+                print(f"  {speed:>7g}x {slice_seconds * 1000:>9g} {wall:>7.2f} {seconds / wall:>8.0f}x "
+                      f"{records / wall:>10.0f} {replay.counters['slices']:>7} {replay.counters['coalesced']:>10} "
+                      f"{writer.counters['written']:>15} {lateness.percentile(0.99) * 1000:>12.2f}")
+    # Streaming keeps the peak memory independent of the log size
+    print(f"Peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure replay throughput of a recorded client log.")
+    parser.add_argument("--log", default=CLIENT_LOG)
+    parser.add_argument("--repeat", type=int, default=50, help="copies of the log replayed back to back")
+    parser.add_argument("--speeds", type=float, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--slices", type=float, nargs="+", default=[0.001, 0.01, 0.1], help="slice seconds")
+    args = parser.parse_args()
+    asyncio.run(run(args.log, args.repeat, args.speeds, args.slices))
+
+if __name__ == "__main__":
+    main()
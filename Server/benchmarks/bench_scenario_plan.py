@@ -0,0 +1,159 @@
+import argparse
+import asyncio
+import tempfile
+import time
+
+import pandas as pd
+from asyncua import Server, ua
+
+from scenario_plan import SCENARIO_WORKBOOK, clean_value, compile_scenario_plan, load_scenario_plan
+
+# Sheets played by one pass of the server's scenario loop
+SCENARIOS = ["default", "1", "default", "2"]
+NODESET_FILES = ["eulynx.generic.bl4r3.rev01.xml", "eulynx.manufacturer.example.bl4r3.rev01.xml", "mdm.rev01.xml"]
+
+# The workbook loaders the server used before the compiled plan, kept as the baseline
+def load_node_info(file_path, sheet_name):
+    """
+    Load node information from an Excel file.
+
+    Parameters:
+        file_path (str): The path to the Excel file.
+        sheet_name (str): The name of the sheet to read from.
+
+    Returns:
+        list[dict]: A list of dictionaries containing node information.
+    """
+    df = pd.read_excel(file_path, sheet_name=sheet_name, engine='openpyxl')
+    if sheet_name == 'default':
+        return [
+            {
+                "name": row["Name"],
+                "datatype": row["DataType"].replace("(Enumeration)", "").strip(),
+                "ns": int(row["ns"]),
+                "i": int(row["i"]),
+                "value": row["Value"]
+            }
+            for _, row in df.iterrows()
+            if row["NodeClass"] == "Variable"
+        ]
+    else:
+        return [
+            {
+                "name": row["Name"],
+                "datatype": row["DataType"].replace("(Enumeration)", "").strip(),
+                "ns": int(row["ns"]),
+                "i": int(row["i"])
+            }
+            for _, row in df.iterrows()
+            if row["NodeClass"] == "Variable"
+        ]
+
+def load_scenario_steps(file_path, sheet_name):
+    """
+    Load scenario steps from an Excel file.
+
+    Parameters:
+        file_path (str): The path to the Excel file.
+        sheet_name (str): The name of the sheet to read from.
+
+    Returns:
+        list[dict]: A list of dictionaries containing scenario step data.
+    """
+    df = pd.read_excel(file_path, sheet_name=sheet_name, engine='openpyxl')
+    steps = []
+    for step_column in df.columns:
+        if step_column.startswith("Step"):
+            step_data = {row["Name"]: clean_value(row[step_column], row["DataType"]) for _, row in df.iterrows()}
+            steps.append(step_data)
+    return steps
+
+def timed(func, repeat):
+    """
+    Run a function several times and return the best wall time in seconds.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def legacy_loop_pass(workbook):
+    """
+    Re-read every sheet of one scenario loop pass the way main() used to.
+    """
+    for scenario_choice in SCENARIOS:
+        load_node_info(workbook, sheet_name=scenario_choice)
+        if scenario_choice != "default":
+            load_scenario_steps(workbook, sheet_name=scenario_choice)
+
+async def legacy_step_preparation(server, nodes, step_data):
+    """
+    Prepare the Variants of one step the way update_node_value used to.
+    """
+    variants = []
+    for node_info in nodes:
+        value = step_data.get(node_info["name"])
+        if value is None:
+            continue
+        node = server.get_node(ua.NodeId(node_info["i"], node_info["ns"]))
+        data_type = await node.read_data_type_as_variant_type()
+        variants.append(ua.Variant(clean_value(value, data_type.name), data_type))
+    return variants
+
+def compiled_step_preparation(step):
+    """
+    Collect the Variants of one compiled step.
+    """
+    return [variant for variant in step["values"] if variant is not None]
+
+async def bench_step_preparation(workbook, repeat):
+    server = Server()
+    await server.init()
+    for nodeset in NODESET_FILES:
+        await server.import_xml(nodeset)
+
+    plan = load_scenario_plan(workbook)
+    results = {}
+    for sheet_name in ("1", "2"):
+        nodes = load_node_info(workbook, sheet_name=sheet_name)
+        legacy_steps = load_scenario_steps(workbook, sheet_name=sheet_name)
+        compiled_steps = plan["sheets"][sheet_name]["steps"]
+
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for step_data in legacy_steps:
+                await legacy_step_preparation(server, nodes, step_data)
+            best = min(best, time.perf_counter() - start)
+        legacy = best / len(legacy_steps)
+
+        compiled = timed(lambda: [compiled_step_preparation(step) for step in compiled_steps], repeat) / len(compiled_steps)
+        results[sheet_name] = (legacy, compiled)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Excel re-reading with the compiled scenario plan.")
+    parser.add_argument("--workbook", default=SCENARIO_WORKBOOK)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        legacy = timed(lambda: legacy_loop_pass(args.workbook), args.repeat)
+        compile_time = timed(lambda: compile_scenario_plan(args.workbook), args.repeat)
+        load_scenario_plan(args.workbook, cache_dir)
+        cached = timed(lambda: load_scenario_plan(args.workbook, cache_dir), args.repeat)
+
+    print("Plan load time")
+    print(f"  legacy Excel re-read per loop pass : {legacy * 1000:10.2f} ms")
+    print(f"  compile plan (cold, once)          : {compile_time * 1000:10.2f} ms")
+    print(f"  load cached plan (warm start)      : {cached * 1000:10.2f} ms")
+
+    print("Per-step preparation")
+    for sheet_name, (legacy_step, compiled_step) in asyncio.run(bench_step_preparation(args.workbook, args.repeat)).items():
+        print(f"  sheet '{sheet_name}': legacy {legacy_step * 1e6:10.1f} us/step, "
+              f"compiled {compiled_step * 1e6:8.1f} us/step")
+
+if __name__ == "__main__":
+    main()
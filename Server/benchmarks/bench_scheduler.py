@@ -0,0 +1,49 @@
+import argparse
+import asyncio
+import time
+
+from scenario_scheduler import Timeline
+
+async def legacy_playback(steps, step_seconds, work_seconds):
+    """
+    Play steps the way the old loop did: do the work, then sleep a fixed period.
+    """
+    start = asyncio.get_running_loop().time()
+    for _ in range(steps):
+        time.sleep(work_seconds)
+        await asyncio.sleep(step_seconds)
+    return asyncio.get_running_loop().time() - start
+
+async def timeline_playback(steps, step_seconds, work_seconds):
+    """
+    Play steps against the deadlines of a Timeline.
+    """
+    timeline = Timeline(1)
+    lateness = []
+    start = asyncio.get_running_loop().time()
+    for _ in range(steps):
+        lateness.append(await timeline.wait())
+        time.sleep(work_seconds)
+        timeline.advance(step_seconds)
+    await timeline.wait()
+    return asyncio.get_running_loop().time() - start, lateness
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare fixed-sleep playback with the deadline-based timeline.")
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--step-seconds", type=float, default=0.1)
+    parser.add_argument("--work", type=float, nargs="+", default=[0.0, 0.01, 0.05],
+                        help="Simulated write time per step in seconds")
+    args = parser.parse_args()
+
+    nominal = args.steps * args.step_seconds
+    print(f"Playback of {args.steps} steps of {args.step_seconds * 1000:.0f} ms (nominal {nominal:.2f} s)")
+    print(f"  {'work ms':>8} {'legacy s':>9} {'drift %':>8} {'timeline s':>11} {'drift %':>8} {'late max ms':>12}")
+    for work in args.work:
+        legacy = asyncio.run(legacy_playback(args.steps, args.step_seconds, work))
+        scheduled, lateness = asyncio.run(timeline_playback(args.steps, args.step_seconds, work))
+        print(f"  {work * 1000:>8.0f} {legacy:>9.2f} {100 * (legacy - nominal) / nominal:>8.1f} "
+              f"{scheduled:>11.2f} {100 * (scheduled - nominal) / nominal:>8.1f} {max(lateness) * 1000:>12.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from address_space_snapshot import SNAPSHOT_PATH, build_snapshot, read_fresh_snapshot_header
+
+# Child process: initialize a server through one path and report the timings as JSON
+CHILD_SCRIPT = """
+import asyncio, json, sys, time
+start = time.perf_counter()
+from asyncua import Server
+from address_space_snapshot import init_address_space
+imported = time.perf_counter()
+
+async def run():
+    server = Server()
+    source = await init_address_space(server, snapshot_path=sys.argv[1])
+    return source, len(server.iserver.aspace.keys())
+
+source, nodes = asyncio.run(run())
+done = time.perf_counter()
+print(json.dumps({"source": source, "nodes": nodes, "init": done - imported, "total": done - start}))
+"""
+
+def run_child(snapshot_path):
+    """
+    Start a fresh interpreter that initializes the address space once.
+    """
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", CHILD_SCRIPT, snapshot_path],
+                            capture_output=True, text=True, check=True, cwd=os.getcwd())
+    wall = time.perf_counter() - start
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report["wall"] = wall
+    return report
+
+def summarize(label, reports):
+    init = [report["init"] for report in reports]
+    wall = [report["wall"] for report in reports]
+    print(f"  {label:<9}: init {statistics.median(init):6.2f} s (min {min(init):5.2f}), "
+          f"process wall {statistics.median(wall):6.2f} s, {reports[0]['nodes']} nodes, source={reports[0]['source']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare server startup from XML with the address space snapshot.")
+    parser.add_argument("--snapshot", default=SNAPSHOT_PATH)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if read_fresh_snapshot_header(snapshot_path=args.snapshot) is None:
+        print(f"Building snapshot {args.snapshot} ...")
+        asyncio.run(build_snapshot(snapshot_path=args.snapshot))
+
+    with tempfile.TemporaryDirectory() as missing_dir:
+        xml_reports = [run_child(os.path.join(missing_dir, "none.snapshot")) for _ in range(args.repeat)]
+    snapshot_reports = [run_child(args.snapshot) for _ in range(args.repeat)]
+
+    print(f"Startup time over {args.repeat} runs (median)")
+    summarize("xml", xml_reports)
+    summarize("snapshot", snapshot_reports)
+    speedup = statistics.median(r["init"] for r in xml_reports) / statistics.median(r["init"] for r in snapshot_reports)
+    print(f"  speed-up : {speedup:.1f}x")
+
+if __name__ == "__main__":
+    main()
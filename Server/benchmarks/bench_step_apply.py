@@ -0,0 +1,62 @@
+import argparse
+import asyncio
+import time
+
+from asyncua import Server
+
+from address_space_snapshot import init_address_space
+from node_writer import DataAccessViewWriter
+from scenario_plan import SCENARIO_WORKBOOK, load_scenario_plan
+
+async def legacy_apply(server, updates):
+    """
+    Apply a step node by node the way update_node_value used to.
+    """
+    for nodeid, variant in updates:
+        node = server.get_node(nodeid)
+        data_type = await node.read_data_type_as_variant_type()
+        await node.write_value(variant.__class__(variant.Value, data_type))
+
+async def batched_apply(writer, updates):
+    """
+    Apply a step with one bulk write through the cached writer.
+    """
+    await writer.write([nodeid for nodeid, _ in updates], [variant for _, variant in updates])
+
+async def best_of(repeat, coroutine_factory):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await coroutine_factory()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+async def run(workbook, sizes, repeat):
+    server = Server()
+    await init_address_space(server)
+    plan = load_scenario_plan(workbook)
+    sheet = plan["sheets"]["default"]
+    updates = [(node["nodeid"], variant) for node, variant in zip(sheet["nodes"], sheet["values"]) if variant is not None]
+
+    writer = DataAccessViewWriter(server)
+    await writer.resolve([nodeid for nodeid, _ in updates])
+
+    print(f"Step-apply latency (best of {repeat})")
+    print(f"  {'nodes':>6} {'legacy ms':>10} {'batched ms':>11} {'legacy us/node':>15} {'batched us/node':>16}")
+    for size in sizes:
+        subset = updates[:size]
+        legacy = await best_of(repeat, lambda: legacy_apply(server, subset))
+        batched = await best_of(repeat, lambda: batched_apply(writer, subset))
+        print(f"  {len(subset):>6} {legacy * 1000:>10.2f} {batched * 1000:>11.2f} "
+              f"{legacy / len(subset) * 1e6:>15.1f} {batched / len(subset) * 1e6:>16.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-node writes with the batched, type-cached writer.")
+    parser.add_argument("--workbook", default=SCENARIO_WORKBOOK)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 250, 500, 1000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.workbook, args.sizes, args.repeat))
+
+if __name__ == "__main__":
+    main()
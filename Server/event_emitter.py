@@ -0,0 +1,202 @@
+import copy
+import time
+import uuid
+from datetime import datetime
+
+from asyncua import Node, ua
+from asyncua.common.events import get_event_obj_from_type_node
+
+from instrumentation import EVENT_SECONDS, EVENTS
+
+# PointTurn event type of the generic namespace
+POINT_TURN_EVENT_TYPE = "ns=2;i=1123"
+
+# Scenario nodes carried as event fields rather than written as values
+EVENT_SPECIFIC_NODES = ["IsEndPositionReached", "CommandedPosition", "FailureReason"]
+
+# Severity and message of scenario events
+EVENT_SEVERITY = 500
+EVENT_MESSAGE = "Event triggered with scenario values"
+
+def event_field_key(name):
+    """
+    Normalize a node or event field name for matching.
+
+    The workbook and the event type disagree on case and trailing spaces,
+    e.g. "IsEndpositionReached" versus "IsEndPositionReached".
+    """
+    return str(name).strip().lower()
+
+EVENT_SPECIFIC_KEYS = {event_field_key(name) for name in EVENT_SPECIFIC_NODES}
+
+def is_event_specific(name):
+    """
+    Check whether a scenario node is one of the EVENT_SPECIFIC_NODES.
+
+    Parameters:
+        name (str): The node name from the workbook.
+
+    Returns:
+        bool: True if the node is carried by the event instead of written.
+    """
+    return event_field_key(name) in EVENT_SPECIFIC_KEYS
+
+class EventEmitter:
+    """
+    Emits events of one event type for any number of source nodes.
+
+    The event object is built from the event type once. Each source gets one
+    EventGenerator, created on first use from a copy of that object and
+    reused for every later event, so emitting an event no longer browses the
+    event type or adds a GeneratesEvent reference to the address space.
+
+    Field mappings from scenario nodes to event attributes are computed once
+    per sheet with map_fields(), and emit() triggers a whole burst of events
+    with one timestamp.
+    """
+
+    def __init__(self, server, event_type=POINT_TURN_EVENT_TYPE, severity=EVENT_SEVERITY, message=EVENT_MESSAGE):
+        self.server = server
+        self.event_type = server.get_node(event_type)
+        self.severity = severity
+        self.message = ua.LocalizedText(message)
+        self.generators = {}
+        self.counters = {"events": 0, "generators": 0}
+        # Recorders of the triggered events, e.g. the history store or the AMQP bridge
+        self.recorders = []
+        self._template = None
+
+    async def template(self):
+        """
+        Build the event object of the event type once.
+
+        Returns:
+            BaseEvent: The event object all generators are copied from.
+        """
+        if self._template is None:
+            self._template = await get_event_obj_from_type_node(self.event_type)
+            self._template.Severity = self.severity
+            self._template.Message = self.message
+        return self._template
+
+    async def generator(self, source):
+        """
+        Return the generator for a source node, creating it on first use.
+
+        Parameters:
+            source (Node | ua.NodeId): The node emitting the events.
+
+        Returns:
+            EventGenerator: The cached generator for (event type, source).
+        """
+        nodeid = source.nodeid if isinstance(source, Node) else source
+        key = (self.event_type.nodeid, nodeid)
+        generator = self.generators.get(key)
+        if generator is None:
+            event = copy.deepcopy(await self.template())
+            generator = await self.server.get_event_generator(event, Node(self.server.iserver.isession, nodeid))
+            self.generators[key] = generator
+            self.counters["generators"] += 1
+        return generator
+
+    async def prepare(self, sources):
+        """
+        Create the generators of many sources up front, e.g. at startup.
+
+        Parameters:
+            sources (list[Node | ua.NodeId]): The nodes emitting the events.
+
+        Returns:
+            None
+        """
+        for source in sources:
+            await self.generator(source)
+
+    async def map_fields(self, nodes):
+        """
+        Map the event-specific nodes of a sheet to event attributes.
+
+        Node names are matched case-insensitively against the attributes of
+        the event type, so "IsEndpositionReached" sets IsEndPositionReached.
+
+        Parameters:
+            nodes (list[dict]): The compiled node information of the sheet.
+
+        Returns:
+            list[tuple[int, str, ua.VariantType]]: The node index, event
+            attribute and attribute variant type of each mapped node.
+        """
+        template = await self.template()
+        attributes = {event_field_key(name): name for name in template.data_types}
+        fields = []
+        for index, node in enumerate(nodes):
+            attribute = attributes.get(event_field_key(node["name"]))
+            if is_event_specific(node["name"]) and attribute is not None:
+                fields.append((index, attribute, template.data_types[attribute]))
+        return fields
+
+    @staticmethod
+    def field_values(fields, values):
+        """
+        Build the event field Variants of a step.
+
+        Nodes without a value in the step fall back to the default of the
+        attribute's type (False or 0), as before.
+
+        Parameters:
+            fields (list[tuple]): The mapping returned by map_fields().
+            values (list[ua.Variant | None]): The compiled values of the step.
+
+        Returns:
+            list[tuple[str, ua.Variant]]: The attribute and value of each field.
+        """
+        field_values = []
+        for index, attribute, variant_type in fields:
+            variant = values[index]
+            if variant is None:
+                variant = ua.Variant(ua.get_default_value(variant_type), variant_type)
+            elif variant.VariantType != variant_type:
+                variant = ua.Variant(variant.Value, variant_type)
+            field_values.append((attribute, variant))
+        return field_values
+
+    async def emit(self, sources, field_values):
+        """
+        Trigger one event per source in a single pass.
+
+        All events of the burst share the same Time, ReceiveTime and LocalTime.
+
+        Parameters:
+            sources (list[Node | ua.NodeId]): The nodes emitting the events.
+            field_values (list[list[tuple[str, ua.Variant]]]): The event fields
+                of each source, as returned by field_values().
+
+        Returns:
+            int: The number of events triggered.
+        """
+        if not sources:
+            return 0
+        now = datetime.utcnow()
+        local_time = ua.uaprotocol_auto.TimeZoneDataType()
+        localtime = time.localtime(now.timestamp())
+        local_time.Offset = localtime.tm_gmtoff // 60
+        local_time.DaylightSavingInOffset = bool(localtime.tm_isdst != -1)
+        subscription_service = self.server.iserver.isession.subscription_service
+
+        for source, fields in zip(sources, field_values):
+            event = (await self.generator(source)).event
+            for attribute, variant in fields:
+                # The event wraps attributes in Variants of their data type when it is sent
+                setattr(event, attribute, variant.Value)
+            event.EventId = uuid.uuid4().hex.encode('utf-8')
+            event.Time = now
+            event.ReceiveTime = now
+            event.LocalTime = local_time
+            start = time.perf_counter()
+            await subscription_service.trigger_event(event)
+            EVENT_SECONDS.observe(time.perf_counter() - start)
+            for recorder in self.recorders:
+                recorder.record_event(source.nodeid if isinstance(source, Node) else source, event)
+        self.counters["events"] += len(sources)
+        EVENTS.inc(len(sources))
+        return len(sources)
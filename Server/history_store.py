@@ -0,0 +1,502 @@
+import asyncio
+import copy
+import logging
+import os
+import pickle
+import sqlite3
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+
+from asyncua import ua
+from asyncua.common.events import Event
+from asyncua.server.history import HistoryManager, HistoryStorageInterface
+
+logger = logging.getLogger(__name__)
+
+# History of the Data Access View variables and PointTurn events; OPCUA_HISTORY=0 disables it
+HISTORY_ENABLED = os.getenv("OPCUA_HISTORY", "1") == "1"
+# Values kept in memory per node and events per source
+HISTORY_SIZE = int(os.getenv("OPCUA_HISTORY_SIZE", 20000))
+# Values and events kept in memory over all nodes and sources, shared out evenly; 0 for no total bound
+HISTORY_TOTAL_SIZE = int(os.getenv("OPCUA_HISTORY_TOTAL_SIZE", 1000000))
+# Optional SQLite file the history is persisted to and reloaded from at startup
+HISTORY_DB = os.getenv("OPCUA_HISTORY_DB", "")
+HISTORY_RETENTION = timedelta(days=float(os.getenv("OPCUA_HISTORY_DAYS", 7)))
+HISTORY_FLUSH_SECONDS = float(os.getenv("OPCUA_HISTORY_FLUSH_SECONDS", 1))
+# Values or events returned per node and HistoryRead call before a continuation point
+HISTORY_MAX_RESPONSE = int(os.getenv("OPCUA_HISTORY_MAX_RESPONSE", 10000))
+
+# Aggregates served for ReadProcessedDetails
+AGGREGATES = {
+    ua.NodeId(ua.ObjectIds.AggregateFunction_Average): "Average",
+    ua.NodeId(ua.ObjectIds.AggregateFunction_Minimum): "Minimum",
+    ua.NodeId(ua.ObjectIds.AggregateFunction_Maximum): "Maximum",
+    ua.NodeId(ua.ObjectIds.AggregateFunction_Total): "Total",
+    ua.NodeId(ua.ObjectIds.AggregateFunction_Count): "Count",
+    ua.NodeId(ua.ObjectIds.AggregateFunction_Start): "Start",
+    ua.NodeId(ua.ObjectIds.AggregateFunction_End): "End",
+}
+
+# Timestamps are stored as naive UTC like the rest of asyncua
+def naive_utc(timestamp):
+    """
+    Convert a timezone-aware timestamp to naive UTC; naive ones are returned as is.
+    """
+    if timestamp is not None and timestamp.tzinfo is not None:
+        return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+class _Ring:
+    """
+    The timestamps and entries of one node or source, oldest first.
+
+    Both are plain lists, so reads bisect them in O(log n). Entries beyond
+    the bound are skipped by moving start and dropped in one slice once they
+    make up half of the lists, which keeps appending amortised O(1).
+    """
+
+    __slots__ = ("timestamps", "entries", "start", "size")
+
+    def __init__(self, size):
+        self.timestamps = []
+        self.entries = []
+        self.start = 0
+        self.size = size
+
+    def __len__(self):
+        return len(self.timestamps) - self.start
+
+    def append(self, timestamp, entry, maxlen):
+        self.timestamps.append(timestamp)
+        self.entries.append(entry)
+        if len(self.timestamps) - self.start > maxlen:
+            self.start = len(self.timestamps) - maxlen
+            if self.start * 2 >= len(self.timestamps):
+                del self.timestamps[:self.start]
+                del self.entries[:self.start]
+                self.start = 0
+
+class RingHistory(HistoryStorageInterface):
+    """
+    Keeps the latest values of each node and events of each source in memory.
+
+    Every node and source has a bounded ring of timestamps and entries, so
+    recording is an append and reads locate their time range by bisection.
+    Values are kept as (timestamp, Variant) and only turned into DataValues
+    when read. Each ring keeps up to size entries, and no more than its
+    share of total_size over all rings; rings over a reduced share are
+    trimmed on their next append.
+
+    Values and events are fed directly by the writer and the event emitter
+    through record_values() and record_event(), instead of through asyncua's
+    internal history subscription.
+
+    With a database path, recorded entries are also appended to SQLite in
+    batches every flush_seconds and reloaded when the server starts.
+    """
+
+    def __init__(self, size=HISTORY_SIZE, db_path=HISTORY_DB, retention=HISTORY_RETENTION,
+                 flush_seconds=HISTORY_FLUSH_SECONDS, max_history_data_response_size=HISTORY_MAX_RESPONSE,
+                 total_size=HISTORY_TOTAL_SIZE):
+        super().__init__(max_history_data_response_size)
+        self.size = size
+        self.total_size = total_size
+        self.share = size
+        self.db_path = db_path
+        self.retention = retention
+        self.flush_seconds = flush_seconds
+        self.values = {}
+        self.events = {}
+        self.counters = {"values": 0, "events": 0, "persisted": 0}
+        self._pending_values = []
+        self._pending_events = []
+        self._db = None
+        self._flush_task = None
+        self._writing = None
+
+    async def init(self):
+        if not self.db_path:
+            return
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS history_values (nodeid TEXT, ts TIMESTAMP, variant BLOB)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS history_values_ts ON history_values (ts)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS history_events (source TEXT, ts TIMESTAMP, fields BLOB)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS history_events_ts ON history_events (ts)")
+        self._db.commit()
+        self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def new_historized_node(self, node_id, period, count=0):
+        if node_id not in self.values:
+            self.values[node_id] = _Ring(count or self.size)
+            self._share_out()
+
+    async def new_historized_event(self, source_id, evtypes, period, count=0):
+        if source_id not in self.events:
+            self.events[source_id] = _Ring(count or self.size)
+            self._share_out()
+
+    def _share_out(self):
+        if self.total_size:
+            self.share = max(self.total_size // (len(self.values) + len(self.events)), 1)
+
+    def record_values(self, nodeids, variants, timestamp):
+        """
+        Record the values written to historized nodes.
+
+        Parameters:
+            nodeids (list[ua.NodeId]): The written nodes; others than the historized ones are ignored.
+            variants (list[ua.Variant]): The written values.
+            timestamp (datetime): The source timestamp of the write.
+
+        Returns:
+            None
+        """
+        for nodeid, variant in zip(nodeids, variants):
+            history = self.values.get(nodeid)
+            if history is None:
+                continue
+            history.append(timestamp, variant, min(history.size, self.share))
+            self.counters["values"] += 1
+            if self._db is not None:
+                self._pending_values.append((nodeid, timestamp, variant))
+
+    def record_event(self, source_id, event):
+        """
+        Record a copy of an event triggered by a historized source.
+
+        Parameters:
+            source_id (ua.NodeId): The node that emitted the event.
+            event (Event): The event; it is copied since generators reuse it.
+
+        Returns:
+            None
+        """
+        history = self.events.get(source_id)
+        if history is None:
+            return
+        event = copy.copy(event)
+        history.append(event.Time, event, min(history.size, self.share))
+        self.counters["events"] += 1
+        if self._db is not None:
+            self._pending_events.append((source_id, event))
+
+    async def save_node_value(self, node_id, datavalue):
+        self.record_values([node_id], [datavalue.Value], datavalue.SourceTimestamp)
+
+    async def save_event(self, event):
+        self.record_event(event.emitting_node, event)
+
+    def _select(self, history, start, end, nb_values):
+        """
+        Select entries of a history in the order the OPC UA time range asks for.
+
+        An unset start reads backwards from end, an unset end forwards from
+        start, and start > end reads the range backwards.
+
+        Returns:
+            tuple[list, datetime | None]: The (timestamp, entry) pairs and the
+            continuation timestamp if the response was cut short.
+        """
+        timestamps, entries, first = history.timestamps, history.entries, history.start
+        epoch = ua.get_win_epoch()
+        start = None if start in (None, epoch) else naive_utc(start)
+        end = None if end in (None, epoch) else naive_utc(end)
+
+        if start is not None and end is not None and start > end:
+            low, high, backwards = bisect_left(timestamps, end, first), bisect_right(timestamps, start, first), True
+        elif start is None:
+            low = first
+            high = bisect_right(timestamps, end, first) if end is not None else len(timestamps)
+            backwards = True
+        else:
+            low = bisect_left(timestamps, start, first)
+            high = bisect_right(timestamps, end, first) if end is not None else len(timestamps)
+            backwards = False
+
+        indices = range(high - 1, low - 1, -1) if backwards else range(low, high)
+        limit = min(nb_values or len(indices), self.max_history_data_response_size)
+        continuation = None
+        if len(indices) > limit and (not nb_values or nb_values > limit):
+            continuation = timestamps[indices[limit]]
+        return [(timestamps[index], entries[index]) for index in indices[:limit]], continuation
+
+    async def read_node_history(self, node_id, start, end, nb_values):
+        history = self.values.get(node_id)
+        if history is None:
+            return [], None
+        selected, continuation = self._select(history, start, end, nb_values)
+        return [
+            ua.DataValue(variant, SourceTimestamp=timestamp, ServerTimestamp=timestamp)
+            for timestamp, variant in selected
+        ], continuation
+
+    async def read_event_history(self, source_id, start, end, nb_values, evfilter):
+        history = self.events.get(source_id)
+        if history is None:
+            return [], None
+        selected, continuation = self._select(history, start, end, nb_values)
+        return [event for _, event in selected], continuation
+
+    def read_processed(self, node_id, start, end, interval, aggregate):
+        """
+        Compute one aggregate per interval of a node's history.
+
+        Parameters:
+            node_id (ua.NodeId): The historized node.
+            start (datetime): The start of the first interval.
+            end (datetime): The end of the last interval.
+            interval (timedelta): The interval length; the whole range if zero.
+            aggregate (str): One of the AGGREGATES names.
+
+        Returns:
+            list[ua.DataValue]: One value per interval, BadNoData where it is empty.
+        """
+        history = self.values.get(node_id)
+        if history is None:
+            return []
+        timestamps, variants, first = history.timestamps, history.entries, history.start
+        start, end = naive_utc(start), naive_utc(end)
+        if start > end:
+            start, end = end, start
+        # A zero interval asks for one aggregate over the whole range (OPC UA Part 13)
+        if interval <= timedelta(0):
+            interval = end - start
+        if interval <= timedelta(0):
+            return []
+        # At most one response worth of intervals
+        interval = max(interval, (end - start) / self.max_history_data_response_size)
+        results = []
+        interval_start = start
+        while interval_start < end:
+            interval_end = min(interval_start + interval, end)
+            low, high = bisect_left(timestamps, interval_start, first), bisect_left(timestamps, interval_end, first)
+            values = [variants[index].Value for index in range(low, high)]
+            results.append(aggregate_value(aggregate, values, interval_start))
+            interval_start = interval_end
+        return results
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"Could not persist history to {self.db_path}: {e}")
+
+    async def flush(self):
+        """
+        Append the entries recorded since the last flush to SQLite.
+
+        Returns:
+            None
+        """
+        if self._db is None or not (self._pending_values or self._pending_events):
+            return
+        values, self._pending_values = self._pending_values, []
+        events, self._pending_events = self._pending_events, []
+        value_rows = [(nodeid.to_string(), timestamp, ua.ua_binary.variant_to_binary(variant))
+                      for nodeid, timestamp, variant in values]
+        event_rows = [(source_id.to_string(), event.Time, pickle.dumps(event_fields(event)))
+                      for source_id, event in events]
+        cutoff = datetime.utcnow() - self.retention
+        # Shielded so that stop() can wait for a write in progress instead of closing the database under it
+        self._writing = asyncio.get_running_loop().run_in_executor(
+            None, self._write_rows, value_rows, event_rows, cutoff)
+        await asyncio.shield(self._writing)
+
+    def _write_rows(self, value_rows, event_rows, cutoff):
+        self._db.executemany("INSERT INTO history_values VALUES (?, ?, ?)", value_rows)
+        self._db.executemany("INSERT INTO history_events VALUES (?, ?, ?)", event_rows)
+        self._db.execute("DELETE FROM history_values WHERE ts < ?", (cutoff,))
+        self._db.execute("DELETE FROM history_events WHERE ts < ?", (cutoff,))
+        self._db.commit()
+        self.counters["persisted"] += len(value_rows) + len(event_rows)
+
+    def load(self):
+        """
+        Reload the persisted history of the historized nodes and sources.
+
+        Returns:
+            int: The number of values and events loaded.
+        """
+        if self._db is None:
+            return 0
+        cutoff = datetime.utcnow() - self.retention
+        nodes = {nodeid.to_string(): history for nodeid, history in self.values.items()}
+        sources = {nodeid.to_string(): history for nodeid, history in self.events.items()}
+        loaded = 0
+        for nodeid, timestamp, data in self._db.execute(
+                "SELECT nodeid, ts, variant FROM history_values WHERE ts >= ? ORDER BY ts", (cutoff,)):
+            history = nodes.get(nodeid)
+            if history is not None:
+                history.append(datetime.fromisoformat(timestamp) if isinstance(timestamp, str) else timestamp,
+                               ua.ua_binary.variant_from_binary(ua.utils.Buffer(data)), min(history.size, self.share))
+                loaded += 1
+        for source_id, timestamp, data in self._db.execute(
+                "SELECT source, ts, fields FROM history_events WHERE ts >= ? ORDER BY ts", (cutoff,)):
+            history = sources.get(source_id)
+            if history is not None:
+                event = Event()
+                for name, (value, variant_type) in pickle.loads(data).items():
+                    event.add_property(name, value, variant_type)
+                history.append(event.Time, event, min(history.size, self.share))
+                loaded += 1
+        return loaded
+
+    async def stop(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        if self._writing is not None and not self._writing.done():
+            await asyncio.wait([self._writing])
+        await self.flush()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+# Fields of an event for persistence
+def event_fields(event):
+    """
+    Collect the fields of an event with their variant types.
+
+    Unlike Event.get_event_props_as_fields_dict() this keeps fields that are
+    None, which cannot be wrapped in a Variant of their type.
+
+    Parameters:
+        event (Event): The event.
+
+    Returns:
+        dict[str, tuple]: The value and variant type of each field.
+    """
+    return {name: (getattr(event, name, None), variant_type) for name, variant_type in event.data_types.items()}
+
+# Aggregate the values of one interval
+def aggregate_value(aggregate, values, timestamp):
+    """
+    Compute an aggregate over the raw values of one interval.
+
+    Parameters:
+        aggregate (str): One of the AGGREGATES names.
+        values (list): The raw values of the interval, in time order.
+        timestamp (datetime): The start of the interval.
+
+    Returns:
+        ua.DataValue: The aggregate, or BadNoData if the interval is empty.
+    """
+    if aggregate == "Count":
+        return ua.DataValue(ua.Variant(len(values), ua.VariantType.Int32), SourceTimestamp=timestamp)
+    numbers = [float(value) for value in values if isinstance(value, (bool, int, float))]
+    if not numbers:
+        return ua.DataValue(StatusCode_=ua.StatusCode(ua.StatusCodes.BadNoData), SourceTimestamp=timestamp)
+    if aggregate == "Average":
+        result = sum(numbers) / len(numbers)
+    elif aggregate == "Minimum":
+        result = min(numbers)
+    elif aggregate == "Maximum":
+        result = max(numbers)
+    elif aggregate == "Total":
+        result = sum(numbers)
+    elif aggregate == "Start":
+        result = numbers[0]
+    else:
+        result = numbers[-1]
+    return ua.DataValue(ua.Variant(result, ua.VariantType.Double), SourceTimestamp=timestamp)
+
+def write_value(nodeid, attribute, variant):
+    """
+    Build the WriteValue of one attribute.
+    """
+    value = ua.WriteValue()
+    value.NodeId = nodeid
+    value.AttributeId = attribute
+    value.Value = ua.DataValue(variant)
+    return value
+
+class DiagnosticHistoryManager(HistoryManager):
+    """
+    History manager serving raw, event and processed HistoryRead from a RingHistory.
+
+    Nodes are historized without asyncua's internal subscription: the
+    attributes that announce history are set in bulk and the values are
+    recorded by the writers and the event emitter.
+    """
+
+    def __init__(self, iserver, storage=None):
+        super().__init__(iserver)
+        self.storage = storage or RingHistory()
+
+    async def historize(self, nodeids, sources=(), load=True):
+        """
+        Mark variables and event sources as historized and start their histories.
+
+        Parameters:
+            nodeids (list[ua.NodeId]): The variables to historize.
+            sources (list[ua.NodeId]): The nodes whose events are historized.
+            load (bool): Reload the persisted history; only once, at startup.
+
+        Returns:
+            int: The number of values and events reloaded from the database.
+        """
+        nodeids = list(dict.fromkeys(nodeids))
+        sources = list(dict.fromkeys(sources))
+        isession = self.iserver.isession
+
+        params = ua.ReadParameters()
+        attributes = [(nodeid, attribute) for nodeid in nodeids
+                      for attribute in (ua.AttributeIds.AccessLevel, ua.AttributeIds.UserAccessLevel)]
+        attributes += [(nodeid, ua.AttributeIds.EventNotifier) for nodeid in sources]
+        for nodeid, attribute in attributes:
+            read_value = ua.ReadValueId()
+            read_value.NodeId = nodeid
+            read_value.AttributeId = attribute
+            params.NodesToRead.append(read_value)
+        to_read = params.NodesToRead
+        results = await isession.read(params)
+
+        # Add the HistoryRead bit to the access levels and event notifiers, and set Historizing
+        params = ua.WriteParameters()
+        for read_value, result in zip(to_read, results):
+            if not result.StatusCode.is_good():
+                continue
+            history_read = ua.EventNotifier.HistoryRead if read_value.AttributeId == ua.AttributeIds.EventNotifier \
+                else 1 << ua.AccessLevel.HistoryRead
+            variant = ua.Variant(result.Value.Value | history_read, ua.VariantType.Byte)
+            params.NodesToWrite.append(write_value(read_value.NodeId, read_value.AttributeId, variant))
+        for nodeid in nodeids:
+            params.NodesToWrite.append(
+                write_value(nodeid, ua.AttributeIds.Historizing, ua.Variant(True, ua.VariantType.Boolean)))
+        await isession.write(params)
+
+        for nodeid in nodeids:
+            await self.storage.new_historized_node(nodeid, None)
+        for nodeid in sources:
+            await self.storage.new_historized_event(nodeid, [], None)
+        return self.storage.load() if load else 0
+
+    async def read_history(self, params):
+        details = params.HistoryReadDetails
+        if not isinstance(details, ua.ReadProcessedDetails):
+            return await super().read_history(params)
+        return [self.read_processed(details, index, rv) for index, rv in enumerate(params.NodesToRead)]
+
+    def read_processed(self, details, index, rv):
+        """
+        Serve ReadProcessedDetails for one node of a HistoryRead call.
+
+        AggregateType holds one aggregate per node in NodesToRead order; a
+        single aggregate is applied to every node.
+        """
+        result = ua.HistoryReadResult()
+        aggregate_types = details.AggregateType
+        if not aggregate_types or (len(aggregate_types) > 1 and index >= len(aggregate_types)):
+            result.StatusCode = ua.StatusCode(ua.StatusCodes.BadAggregateListMismatch)
+            return result
+        aggregate = AGGREGATES.get(aggregate_types[index if len(aggregate_types) > 1 else 0])
+        if aggregate is None:
+            result.StatusCode = ua.StatusCode(ua.StatusCodes.BadAggregateNotSupported)
+            return result
+        result.HistoryData = ua.HistoryData()
+        result.HistoryData.DataValues = self.storage.read_processed(
+            rv.NodeId, details.StartTime, details.EndTime, timedelta(milliseconds=details.ProcessingInterval), aggregate
+        )
+        return result
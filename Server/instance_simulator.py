@@ -0,0 +1,290 @@
+import asyncio
+import dataclasses
+import logging
+import os
+import time
+
+import numpy as np
+from asyncua import Node, ua
+
+from event_emitter import EventEmitter
+
+logger = logging.getLogger(__name__)
+
+# Simulation settings; OPCUA_INSTANCES=0 keeps the single S10 instance only
+INSTANCE_COUNT = int(os.getenv("OPCUA_INSTANCES", 0))
+INSTANCE_TEMPLATE = os.getenv("OPCUA_INSTANCE_TEMPLATE", "ns=4;i=5057")
+INSTANCE_SCENARIO = os.getenv("OPCUA_INSTANCE_SCENARIO", "1")
+INSTANCE_STEP_SECONDS = float(os.getenv("OPCUA_INSTANCE_STEP_SECONDS", 5))
+INSTANCE_JITTER_SECONDS = float(os.getenv("OPCUA_INSTANCE_JITTER_SECONDS", 1))
+INSTANCE_TICK_SECONDS = float(os.getenv("OPCUA_INSTANCE_TICK_SECONDS", 0.5))
+INSTANCE_SEED = int(os.getenv("OPCUA_INSTANCE_SEED", 0))
+# Instances numbered before this shard's, set by the supervisor so names are unique across workers
+INSTANCE_OFFSET = int(os.getenv("OPCUA_INSTANCE_OFFSET", 0))
+INSTANCE_NAMESPACE = "http://europerail.com/mdm/simulation/"
+
+# Instances cloned per AddNodes call
+CLONE_BATCH_SIZE = 100
+
+# Attributes copied from the template nodes, per node class
+CLONED_ATTRIBUTES = {
+    ua.NodeClass.Object: (ua.ObjectAttributes, ["DisplayName", "Description", "WriteMask", "UserWriteMask", "EventNotifier"]),
+    ua.NodeClass.Variable: (ua.VariableAttributes, [
+        "DisplayName", "Description", "WriteMask", "UserWriteMask", "Value", "DataType", "ValueRank",
+        "ArrayDimensions", "AccessLevel", "UserAccessLevel", "MinimumSamplingInterval", "Historizing",
+    ]),
+}
+
+# Read the subtree of the template instance once
+async def read_template(template):
+    """
+    Collect the Object and Variable nodes below a template instance.
+
+    Parameters:
+        template (Node): The instance to clone, e.g. S10.
+
+    Returns:
+        list[dict]: One entry per node in parent-first order with its relative
+        path, parent path, reference type, browse name, node class, type
+        definition and attribute struct. The root has the path "".
+    """
+    entries = [await read_template_node(template, "", None, None)]
+    queue = [(template, "")]
+    while queue:
+        node, path = queue.pop(0)
+        for desc in await node.get_references(refs=ua.ObjectIds.HasChild, direction=ua.BrowseDirection.Forward):
+            if desc.NodeClass not in CLONED_ATTRIBUTES:
+                continue
+            child = Node(node.session, desc.NodeId)
+            child_path = f"{path}.{desc.BrowseName.Name}" if path else desc.BrowseName.Name
+            entries.append(await read_template_node(child, child_path, path, desc))
+            queue.append((child, child_path))
+    return entries
+
+async def read_template_node(node, path, parent_path, desc):
+    node_class = await node.read_node_class()
+    attributes_class, names = CLONED_ATTRIBUTES[node_class]
+    attributes = attributes_class()
+    results = await node.read_attributes([getattr(ua.AttributeIds, name) for name in names])
+    for name, result in zip(names, results):
+        if not result.StatusCode.is_good():
+            continue
+        setattr(attributes, name, result.Value if name == "Value" else result.Value.Value)
+        attributes.SpecifiedAttributes |= getattr(ua.NodeAttributesMask, name)
+    return {
+        "path": path,
+        "parent_path": parent_path,
+        "nodeid": node.nodeid,
+        "reference_type": desc.ReferenceTypeId if desc else ua.NodeId(ua.ObjectIds.Organizes),
+        "browse_name": desc.BrowseName if desc else await node.read_browse_name(),
+        "node_class": node_class,
+        "type_definition": desc.TypeDefinition if desc else await node.read_type_definition(),
+        "attributes": attributes,
+    }
+
+def instance_nodeid(name, path, namespace_idx):
+    """
+    NodeId of a cloned node, derived from the instance name and relative path.
+    """
+    return ua.NodeId(f"{name}.{path}" if path else name, namespace_idx)
+
+# Clone the template instance in batches
+async def clone_instances(server, template, count, prefix=None, offset=INSTANCE_OFFSET):
+    """
+    Create point machine instances shaped like the template instance.
+
+    The template subtree is read once, then all clones are created with
+    batched AddNodes calls under an "SimulatedPointMachines" folder in a
+    dedicated namespace. Clone NodeIds are strings built from the instance
+    name and the browse path, so mapping a template node to its clone needs
+    no browsing.
+
+    Parameters:
+        server (Server): The OPC UA server instance.
+        template (Node): The instance to clone, e.g. S10.
+        count (int): The number of instances to create.
+        prefix (str, optional): Instance name prefix, the template name by default.
+        offset (int, optional): Instances numbered before the first one, e.g. of other shards.
+
+    Returns:
+        tuple[list[str], dict, int]: The instance names, the map of template
+        NodeId to relative path, and the namespace index of the clones.
+    """
+    namespace_idx = await server.register_namespace(INSTANCE_NAMESPACE)
+    entries = await read_template(template)
+    prefix = prefix or entries[0]["browse_name"].Name
+    folder = await server.nodes.objects.add_folder(ua.NodeId("SimulatedPointMachines", namespace_idx),
+                                                   ua.QualifiedName("SimulatedPointMachines", namespace_idx))
+
+    names = [f"{prefix}_{number:04d}" for number in range(offset + 1, offset + count + 1)]
+    for start in range(0, count, CLONE_BATCH_SIZE):
+        items = []
+        for name in names[start:start + CLONE_BATCH_SIZE]:
+            for entry in entries:
+                item = ua.AddNodesItem()
+                item.RequestedNewNodeId = instance_nodeid(name, entry["path"], namespace_idx)
+                item.ReferenceTypeId = entry["reference_type"]
+                item.NodeClass = entry["node_class"]
+                item.TypeDefinition = entry["type_definition"]
+                if entry["parent_path"] is None:
+                    item.ParentNodeId = folder.nodeid
+                    item.BrowseName = ua.QualifiedName(name, namespace_idx)
+                    item.NodeAttributes = dataclasses.replace(entry["attributes"], DisplayName=ua.LocalizedText(name))
+                else:
+                    item.ParentNodeId = instance_nodeid(name, entry["parent_path"], namespace_idx)
+                    item.BrowseName = entry["browse_name"]
+                    item.NodeAttributes = entry["attributes"]
+                items.append(item)
+        for result in await server.iserver.isession.add_nodes(items):
+            result.StatusCode.check()
+
+    paths = {entry["nodeid"]: entry["path"] for entry in entries}
+    return names, paths, namespace_idx
+
+class InstanceSimulator:
+    """
+    Plays one scenario sheet on many cloned instances at once.
+
+    Every instance loops over the sheet's steps with its own phase offset (in
+    steps) and a random start jitter (in seconds). Each tick computes the
+    current step of all instances with NumPy, gathers the values of the
+    instances whose step changed from a steps x nodes value matrix and writes
+    them with one batched, delta-only write. With an emitter, the instances
+    that changed step also emit their PointTurn event in one burst.
+    """
+
+    def __init__(self, writer, sheet, names, paths, namespace_idx, step_seconds=INSTANCE_STEP_SECONDS,
+                 jitter_seconds=INSTANCE_JITTER_SECONDS, seed=INSTANCE_SEED, emitter=None, event_fields=()):
+        self.writer = writer
+        self.emitter = emitter
+        self.step_seconds = step_seconds
+        self.names = names
+        self.paths = paths
+        self.namespace_idx = namespace_idx
+        self.sources = [instance_nodeid(name, "", namespace_idx) for name in names]
+
+        rng = np.random.default_rng(seed)
+        self.phase = rng.integers(0, max(len(sheet["steps"]), 1), size=len(names))
+        self.jitter = rng.uniform(0, jitter_seconds, size=len(names)) if jitter_seconds > 0 else np.zeros(len(names))
+        self.current = np.full(len(names), -1)
+        self.counters = {"ticks": 0, "instance_steps": 0, "events": 0}
+        self.nodes = []
+        self.nodeids = np.empty((len(names), 0), dtype=object)
+        self.load_sheet(sheet, event_fields)
+
+    def load_sheet(self, sheet, event_fields=()):
+        """
+        Build the value matrix, instance node ids and event fields of a scenario sheet.
+
+        Called again when the scenario workbook is reloaded; the instances
+        keep their phase and pick up the new values at their next step.
+
+        Parameters:
+            sheet (dict): The compiled scenario sheet.
+            event_fields (list): The event field mapping of the sheet.
+
+        Returns:
+            None
+        """
+        # Only sheet nodes inside the template subtree exist on the clones
+        columns = [index for index, node in enumerate(sheet["nodes"]) if node["nodeid"] in self.paths]
+        nodes = [sheet["nodes"][index] for index in columns]
+        values = np.empty((len(sheet["steps"]), len(columns)), dtype=object)
+        for step_index, step in enumerate(sheet["steps"]):
+            values[step_index, :] = [step["values"][index] for index in columns]
+        if [node["nodeid"] for node in nodes] != [node["nodeid"] for node in self.nodes]:
+            self.nodeids = np.empty((len(self.names), len(columns)), dtype=object)
+            for row, name in enumerate(self.names):
+                self.nodeids[row, :] = [instance_nodeid(name, self.paths[node["nodeid"]], self.namespace_idx)
+                                        for node in nodes]
+        self.nodes = nodes
+        self.values = values
+        # Event fields per step, from the same sheet rows as the values
+        self.event_values = [EventEmitter.field_values(event_fields, step["values"]) for step in sheet["steps"]]
+        if len(sheet["steps"]):
+            self.phase %= len(sheet["steps"])
+
+    async def write_defaults(self, sheet):
+        """
+        Write the values of a default sheet to every instance.
+
+        Parameters:
+            sheet (dict): The compiled default sheet.
+
+        Returns:
+            None
+        """
+        defaults = [
+            (self.paths[node["nodeid"]], variant)
+            for node, variant in zip(sheet["nodes"], sheet["values"])
+            if node["nodeid"] in self.paths and variant is not None
+        ]
+        nodeids = [instance_nodeid(name, path, self.namespace_idx) for name in self.names for path, _ in defaults]
+        await self.writer.write_changes(nodeids, [variant for _ in self.names for _, variant in defaults])
+
+    def step_indices(self, elapsed):
+        """
+        Compute the step every instance is on after the given elapsed time.
+
+        Parameters:
+            elapsed (float): Seconds since the simulation started.
+
+        Returns:
+            np.ndarray: The step index per instance.
+        """
+        periods = np.floor((elapsed - self.jitter) / self.step_seconds).astype(np.int64)
+        periods = np.maximum(periods, 0)
+        return (periods + self.phase) % self.values.shape[0]
+
+    async def tick(self, elapsed):
+        """
+        Write the values of all instances that moved to another step.
+
+        Parameters:
+            elapsed (float): Seconds since the simulation started.
+
+        Returns:
+            np.ndarray: The indices of the instances that changed step.
+        """
+        self.counters["ticks"] += 1
+        if self.values.size == 0:
+            return np.empty(0, dtype=np.int64)
+        steps = self.step_indices(elapsed)
+        changed = np.flatnonzero(steps != self.current)
+        self.current = steps
+        if changed.size == 0:
+            return changed
+
+        values = self.values[steps[changed]].ravel()
+        nodeids = self.nodeids[changed].ravel()
+        present = np.array([value is not None for value in values], dtype=bool)
+        await self.writer.write_changes(list(nodeids[present]), list(values[present]))
+        self.counters["instance_steps"] += changed.size
+        if self.emitter is not None:
+            self.counters["events"] += await self.emitter.emit(
+                [self.sources[index] for index in changed], [self.event_values[step] for step in steps[changed]]
+            )
+        return changed
+
+    async def run(self, tick_seconds=INSTANCE_TICK_SECONDS):
+        """
+        Tick forever, reporting the write counters about once a minute.
+
+        Parameters:
+            tick_seconds (float): The interval between ticks.
+
+        Returns:
+            None
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        last_report = time.monotonic()
+        while True:
+            tick_start = loop.time()
+            await self.tick(tick_start - start)
+            if time.monotonic() - last_report >= 60:
+                last_report = time.monotonic()
+                logger.info(f"Simulated {len(self.names)} instances: {self.counters['instance_steps']} instance steps, "
+                            f"{self.counters['events']} events, "
+                            f"last tick took {(loop.time() - tick_start) * 1000:.1f} ms")
+            await asyncio.sleep(max(0.0, tick_seconds - (loop.time() - tick_start)))
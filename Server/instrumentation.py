@@ -0,0 +1,302 @@
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from bisect import bisect_left
+
+# Port of the Prometheus /metrics endpoint, 0 (the default) to disable it; the Docker image sets 9464
+METRICS_PORT = int(os.getenv("OPCUA_METRICS_PORT", 0))
+METRICS_HOST = os.getenv("OPCUA_METRICS_HOST", "0.0.0.0")
+
+# Log level (DEBUG logs every write and event) and format ("text" or "json")
+LOG_LEVEL = os.getenv("OPCUA_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("OPCUA_LOG_FORMAT", "text")
+
+# Latency buckets in seconds, from 50 us to 5 s
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Attributes every LogRecord has; anything else was passed with extra= and is a structured field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+# Format the label set of a sample
+def label_text(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, values)) + "}"
+
+class Counter:
+    """
+    A monotonically increasing value, optionally per label values.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def inc(self, amount=1, *label_values):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        for label_values, value in self.values.items():
+            yield self.name, label_text(self.labels, label_values), value
+
+class Gauge(Counter):
+    """
+    A value that goes up and down, set directly or read from a callback at scrape time.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labels=(), callback=None):
+        super().__init__(name, help_text, labels)
+        self.callback = callback
+
+    def set(self, value, *label_values):
+        self.values[label_values] = value
+
+    def samples(self):
+        if self.callback is not None:
+            self.values[()] = self.callback()
+        return super().samples()
+
+class Histogram:
+    """
+    Observations counted into cumulative buckets, with their sum and count.
+
+    observe() is a bisect and two additions, cheap enough for every write.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # Per label values: [count per bucket (the last one is +Inf), sum]
+        self.values = {}
+
+    def observe(self, value, *label_values):
+        entry = self.values.get(label_values)
+        if entry is None:
+            entry = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def samples(self):
+        for label_values, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield (f"{self.name}_bucket", label_text(self.labels + ("le",), label_values + (le,)), cumulative)
+            yield f"{self.name}_sum", label_text(self.labels, label_values), total
+            yield f"{self.name}_count", label_text(self.labels, label_values), cumulative
+
+class Registry:
+    """
+    The metrics exposed on the /metrics endpoint.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        """
+        Add a metric, or return the already registered metric of that name.
+
+        Parameters:
+            metric (Counter | Gauge | Histogram): The metric.
+
+        Returns:
+            The registered metric.
+        """
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counters(self, prefix, counters, help_text, label=None):
+        """
+        Expose a component's counters dict, read at scrape time.
+
+        Every key becomes a counter named <prefix>_<key>_total, optionally
+        with a label telling the components apart.
+
+        Parameters:
+            prefix (str): The metric name prefix, e.g. "opcua_amqp".
+            counters (dict): The counters dict of the component.
+            help_text (str): The help text, formatted with the key.
+            label (tuple[str, str], optional): A label name and value.
+
+        Returns:
+            None
+        """
+        for key in counters:
+            metric = self.register(_CounterView(f"{prefix}_{key}_total", help_text.format(key=key),
+                                                (label[0],) if label else ()))
+            metric.sources[(label[1],) if label else ()] = (counters, key)
+
+    def render(self):
+        """
+        Render all metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The exposition text.
+        """
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name}{labels} {value}" for name, labels, value in metric.samples())
+        return "\n".join(lines) + "\n"
+
+class _CounterView(Counter):
+    """
+    A counter whose values are read from counters dicts at scrape time.
+    """
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self.sources = {}
+
+    def samples(self):
+        for label_values, (counters, key) in self.sources.items():
+            self.values[label_values] = counters[key]
+        return super().samples()
+
+REGISTRY = Registry()
+
+# Hot-path metrics, updated by the writers, the event emitter and the scenario player
+WRITE_SECONDS = REGISTRY.register(Histogram(
+    "opcua_write_seconds", "Duration of one bulk write service call"))
+WRITE_VALUES = REGISTRY.register(Counter(
+    "opcua_write_values_total", "Values written to the address space, by result", ("result",)))
+EVENT_SECONDS = REGISTRY.register(Histogram(
+    "opcua_event_trigger_seconds", "Duration of triggering one event to the subscriptions"))
+EVENTS = REGISTRY.register(Counter(
+    "opcua_events_total", "Events triggered"))
+STEP_SECONDS = REGISTRY.register(Histogram(
+    "opcua_step_apply_seconds", "Duration of applying one scenario step, writes and events", ("track",)))
+STEP_LATENESS_SECONDS = REGISTRY.register(Histogram(
+    "opcua_step_lateness_seconds", "How late a scenario step started after its deadline", ("track",)))
+
+# Register scrape-time gauges of the server's sessions and subscriptions
+def register_server_metrics(server, registry=REGISTRY):
+    """
+    Expose the connection, session, subscription, monitored item and node counts of a server.
+
+    Parameters:
+        server (Server): The asyncua server.
+        registry (Registry): The registry to add the gauges to.
+
+    Returns:
+        None
+    """
+    subscriptions = server.iserver.subscription_service.subscriptions
+
+    def clients():
+        return server.bserver.clients if server.bserver is not None else []
+
+    registry.register(Gauge("opcua_connections", "Open client connections", callback=lambda: len(clients())))
+    registry.register(Gauge("opcua_sessions", "Activated client sessions", callback=lambda: sum(
+        1 for client in clients()
+        if client.processor is not None and client.processor.session is not None
+        and client.processor.session.is_activated())))
+    registry.register(Gauge("opcua_subscriptions", "Client subscriptions", callback=lambda: len(subscriptions)))
+    registry.register(Gauge("opcua_monitored_items", "Monitored items of all subscriptions", callback=lambda: sum(
+        len(subscription.monitored_item_srv._monitored_items) for subscription in list(subscriptions.values()))))
+    registry.register(Gauge("opcua_address_space_nodes", "Nodes in the address space",
+                            callback=lambda: len(server.iserver.aspace.keys())))
+    start = time.time()
+    registry.register(Gauge("opcua_uptime_seconds", "Seconds since the server started",
+                            callback=lambda: round(time.time() - start, 3)))
+
+# Serve the registry on /metrics
+async def start_metrics_server(registry=REGISTRY, host=METRICS_HOST, port=METRICS_PORT):
+    """
+    Serve the metrics over HTTP for Prometheus to scrape.
+
+    A minimal HTTP/1.0 responder on the server's event loop: every request
+    gets the current exposition of /metrics, or 404 for other paths.
+
+    Parameters:
+        registry (Registry): The metrics to serve.
+        host (str): The address to listen on.
+        port (int): The port to listen on.
+
+    Returns:
+        asyncio.Server: The listening server.
+    """
+    async def handle(reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[1].split("?")[0] == "/metrics":
+                status, body = "200 OK", registry.render().encode()
+            else:
+                status, body = "404 Not Found", b"Not found\n"
+            writer.write(f"HTTP/1.0 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Formats records as "time level logger message key=value ..." or as one JSON object per line.
+
+    Fields passed with extra={...} are appended as key=value pairs, or as
+    keys of the JSON object.
+    """
+
+    def __init__(self, json_lines=False):
+        super().__init__()
+        self.json_lines = json_lines
+
+    def format(self, record):
+        fields = {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+        timestamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z"
+        message = record.getMessage()
+        if record.exc_info:
+            message += "\n" + self.formatException(record.exc_info)
+        if self.json_lines:
+            return json.dumps({"time": timestamp, "level": record.levelname, "logger": record.name,
+                               "message": message, **fields}, default=str)
+        return " ".join([timestamp, record.levelname, record.name, message]
+                        + [f"{key}={value}" for key, value in fields.items()])
+
+# Configure logging for the server process
+def setup_logging(level=LOG_LEVEL, log_format=LOG_FORMAT):
+    """
+    Send structured log lines to stdout at the given level.
+
+    asyncua's own loggers stay at WARNING unless DEBUG is requested.
+
+    Parameters:
+        level (str): The log level name, e.g. "INFO" or "DEBUG".
+        log_format (str): "text" or "json".
+
+    Returns:
+        None
+    """
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(StructuredFormatter(json_lines=log_format == "json"))
+    # Lines of supervised workers carry the worker index
+    worker = os.getenv("OPCUA_WORKER_INDEX")
+    if worker is not None:
+        handler.addFilter(lambda record: setattr(record, "worker", int(worker)) or True)
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+    logging.getLogger("asyncua").setLevel(level if level == "DEBUG" else "WARNING")
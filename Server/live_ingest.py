@@ -0,0 +1,252 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+from asyncua import ua
+
+from event_emitter import is_event_specific
+from instrumentation import STEP_LATENESS_SECONDS, STEP_SECONDS
+from log_replay import parse_value
+
+logger = logging.getLogger(__name__)
+
+# Local ingestion endpoints of JSON-lines samples; port 0 or an empty path disables them
+INGEST_HOST = os.getenv("OPCUA_INGEST_HOST", "127.0.0.1")
+INGEST_TCP_PORT = int(os.getenv("OPCUA_INGEST_TCP_PORT", 0))
+INGEST_UDP_PORT = int(os.getenv("OPCUA_INGEST_UDP_PORT", 0))
+INGEST_SOCKET = os.getenv("OPCUA_INGEST_SOCKET", "")
+# Samples of a node arriving within one interval are coalesced, the last value wins
+INGEST_INTERVAL_SECONDS = float(os.getenv("OPCUA_INGEST_INTERVAL_SECONDS", 0.1))
+# Nodes waiting for the next write; samples of further nodes are dropped and counted
+INGEST_MAX_PENDING = int(os.getenv("OPCUA_INGEST_MAX_PENDING", 100000))
+# Bytes read from a stream connection at a time
+INGEST_READ_BYTES = 1 << 16
+
+# Convert an ingested JSON value to a Variant
+def json_variant(value, variant_type):
+    """
+    Convert a JSON sample value into a Variant of the node's type.
+
+    Parameters:
+        value: The decoded JSON value; numbers, booleans and strings are accepted.
+        variant_type (ua.VariantType): The variant type of the node.
+
+    Returns:
+        ua.Variant | None: The Variant, or None if the value does not fit the
+        type, e.g. a number outside the range of an Int32 or Float node, or
+        a number with a fraction for an integer node.
+    """
+    if isinstance(value, bool):
+        value = "True" if value else "False"
+    elif isinstance(value, (int, float)):
+        if variant_type == ua.VariantType.Boolean:
+            value = "True" if value else "False"
+        else:
+            value = repr(value)
+    elif not isinstance(value, str):
+        return None
+    return parse_value(value, variant_type)
+
+class LiveIngest:
+    """
+    Writes field-element samples pushed over local sockets into the address space.
+
+    Clients send JSON lines, one sample {"node": "ns=4;i=6001", "value": 1}
+    or a list of samples per line; {"ns": 4, "i": 6001, "value": 1} names the
+    node by the workbook's ns and i columns. Only the variables of the
+    scenario node list are accepted, so the node list stays the contract of
+    what the server exposes.
+
+    Samples only replace the pending value of their node, so bursts for one
+    node within INGEST_INTERVAL_SECONDS collapse to the last value. Every
+    interval the pending values are converted and applied with one
+    delta-only bulk write.
+    """
+
+    def __init__(self, plan, writer, interval=INGEST_INTERVAL_SECONDS, max_pending=INGEST_MAX_PENDING):
+        self.plan = plan
+        self.writer = writer
+        self.interval = interval
+        self.max_pending = max_pending
+        self.pending = {}
+        self.counters = {"received": 0, "coalesced": 0, "dropped": 0, "invalid": 0, "unknown": 0,
+                         "flushes": 0, "connections": 0}
+        self.servers = []
+        self._keys = {}
+        self._keys_sha256 = None
+
+    def node_keys(self):
+        """
+        Map the node keys of the node list to their NodeIds, rebuilt when the workbook is reloaded.
+
+        Returns:
+            dict: NodeId strings and (ns, i) pairs to NodeIds.
+        """
+        if self._keys_sha256 != self.plan.get("sha256"):
+            keys = {}
+            for sheet in self.plan["sheets"].values():
+                for node in sheet["nodes"]:
+                    if not is_event_specific(node["name"]):
+                        keys[node["nodeid"].to_string()] = node["nodeid"]
+                        keys[(node["ns"], node["i"])] = node["nodeid"]
+            self._keys = keys
+            self._keys_sha256 = self.plan.get("sha256")
+        return self._keys
+
+    def feed(self, line):
+        """
+        Queue the samples of one JSON line for the next write.
+
+        Parameters:
+            line (bytes | str): One JSON sample or a JSON list of samples.
+
+        Returns:
+            None
+        """
+        try:
+            samples = json.loads(line)
+        except ValueError:
+            self.counters["invalid"] += 1
+            return
+        if isinstance(samples, dict):
+            samples = (samples,)
+        elif not isinstance(samples, list):
+            self.counters["invalid"] += 1
+            return
+        keys = self.node_keys()
+        pending = self.pending
+        for sample in samples:
+            try:
+                key = sample["node"] if "node" in sample else (sample["ns"], sample["i"])
+                value = sample["value"]
+                nodeid = keys.get(key)
+            except (KeyError, TypeError):
+                self.counters["invalid"] += 1
+                continue
+            self.counters["received"] += 1
+            if nodeid is None:
+                self.counters["unknown"] += 1
+            elif nodeid in pending:
+                pending[nodeid] = value
+                self.counters["coalesced"] += 1
+            elif len(pending) >= self.max_pending:
+                self.counters["dropped"] += 1
+            else:
+                pending[nodeid] = value
+
+    async def flush(self):
+        """
+        Write the pending value of every node in one bulk write.
+
+        Returns:
+            int: The number of nodes flushed.
+        """
+        if not self.pending:
+            return 0
+        pending, self.pending = self.pending, {}
+        await self.writer.resolve(list(pending))
+        nodeids = []
+        variants = []
+        for nodeid, value in pending.items():
+            variant = json_variant(value, self.writer.variant_types.get(nodeid))
+            if variant is None:
+                self.counters["invalid"] += 1
+                continue
+            nodeids.append(nodeid)
+            variants.append(variant)
+        start = time.perf_counter()
+        await self.writer.write_changes(nodeids, variants)
+        STEP_SECONDS.observe(time.perf_counter() - start, "ingest")
+        self.counters["flushes"] += 1
+        return len(pending)
+
+    async def run(self):
+        """
+        Flush the pending samples every interval, forever.
+
+        Returns:
+            None
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        while True:
+            deadline += self.interval
+            await asyncio.sleep(max(0.0, deadline - loop.time()))
+            STEP_LATENESS_SECONDS.observe(max(loop.time() - deadline, 0.0), "ingest")
+            await self.flush()
+            # Skip the intervals a slow write overran instead of flushing back to back
+            if loop.time() > deadline + self.interval:
+                deadline = loop.time()
+
+    async def handle_stream(self, reader, writer):
+        self.counters["connections"] += 1
+        buffer = b""
+        try:
+            while True:
+                data = await reader.read(INGEST_READ_BYTES)
+                if not data:
+                    break
+                lines = (buffer + data).split(b"\n")
+                buffer = lines.pop()
+                for line in lines:
+                    if line.strip():
+                        self.feed(line)
+            if buffer.strip():
+                self.feed(buffer)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host=INGEST_HOST, tcp_port=INGEST_TCP_PORT, udp_port=INGEST_UDP_PORT,
+                    socket_path=INGEST_SOCKET):
+        """
+        Open the configured ingestion endpoints.
+
+        A TCP or Unix stream carries any number of lines; a UDP datagram
+        carries one or more whole lines.
+
+        Parameters:
+            host (str): The address of the TCP and UDP endpoints.
+            tcp_port (int): The TCP port, 0 to disable it.
+            udp_port (int): The UDP port, 0 to disable it.
+            socket_path (str): The Unix socket path, empty to disable it.
+
+        Returns:
+            list[str]: The opened endpoints.
+        """
+        endpoints = []
+        if tcp_port:
+            self.servers.append(await asyncio.start_server(self.handle_stream, host, tcp_port))
+            endpoints.append(f"tcp://{host}:{tcp_port}")
+        if socket_path:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            self.servers.append(await asyncio.start_unix_server(self.handle_stream, socket_path))
+            endpoints.append(f"unix://{socket_path}")
+        if udp_port:
+            transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+                lambda: _DatagramProtocol(self), local_addr=(host, udp_port))
+            self.servers.append(transport)
+            endpoints.append(f"udp://{host}:{udp_port}")
+        return endpoints
+
+    def close(self):
+        for server in self.servers:
+            server.close()
+        self.servers = []
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    """
+    Feeds the lines of every UDP datagram to a LiveIngest.
+    """
+
+    def __init__(self, ingest):
+        self.ingest = ingest
+
+    def datagram_received(self, data, addr):
+        for line in data.split(b"\n"):
+            if line.strip():
+                self.ingest.feed(line)
@@ -0,0 +1,297 @@
+import csv
+import glob
+import logging
+import os
+import time
+from datetime import datetime
+
+from asyncua import ua
+
+from instrumentation import STEP_LATENESS_SECONDS, STEP_SECONDS
+from scenario_scheduler import LatenessSummary, Timeline
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+# Recorded client log to replay instead of the scenarios: a CSV file, a Parquet file or a Parquet log directory
+REPLAY_LOG = os.getenv("OPCUA_REPLAY_LOG", "")
+# Speed-up of the replay; OPCUA_REPLAY_SPEED=100 plays 100 recorded seconds per second
+REPLAY_SPEED = float(os.getenv("OPCUA_REPLAY_SPEED", 1))
+# Records within this many wall-clock seconds of the first one of a slice are written together
+REPLAY_SLICE_SECONDS = float(os.getenv("OPCUA_REPLAY_SLICE_SECONDS", 0.01))
+# Parquet rows read per batch
+REPLAY_READ_ROWS = 10000
+
+# Values the integer variant types can encode; anything outside fails when a read or publish is encoded
+INTEGER_RANGES = {
+    ua.VariantType.SByte: (-2**7, 2**7 - 1),
+    ua.VariantType.Byte: (0, 2**8 - 1),
+    ua.VariantType.Int16: (-2**15, 2**15 - 1),
+    ua.VariantType.UInt16: (0, 2**16 - 1),
+    ua.VariantType.Int32: (-2**31, 2**31 - 1),
+    ua.VariantType.UInt32: (0, 2**32 - 1),
+    ua.VariantType.Int64: (-2**63, 2**63 - 1),
+    ua.VariantType.UInt64: (0, 2**64 - 1),
+}
+# Largest finite float32
+FLOAT_MAX = 3.4028234663852886e38
+
+# Columns read from recorded CSV and Parquet logs
+CSV_COLUMNS = ("timestamp", "Node", "value")
+PARQUET_COLUMNS = ("timestamp", "ns", "i", "value")
+
+# The Parquet files of a recorded log, or None for a CSV log
+def parquet_files(path):
+    if not (os.path.isdir(path) or path.endswith(".parquet")):
+        return None
+    if pq is None:
+        raise RuntimeError("pyarrow is required to replay Parquet logs")
+    return sorted(glob.glob(os.path.join(path, "**", "*.parquet"), recursive=True)) if os.path.isdir(path) else [path]
+
+# Check that a recorded log has the columns read_log() needs
+def check_log(path):
+    """
+    Check the header of a recorded log before it is replayed.
+
+    Parameters:
+        path (str): The CSV file, Parquet file or Parquet log directory.
+
+    Returns:
+        None
+
+    Raises:
+        ValueError: If the CSV header or the schema of a Parquet file lacks a column.
+    """
+    files = parquet_files(path)
+    if files is not None:
+        for file_path in files:
+            missing = [name for name in PARQUET_COLUMNS if name not in pq.read_schema(file_path).names]
+            if missing:
+                raise ValueError(f"Cannot replay {file_path}: no {', '.join(missing)} column")
+        return
+    with open(path, newline="") as file:
+        header = next(csv.reader(file), None)
+    if header is not None:
+        missing = [name for name in CSV_COLUMNS if name not in {column.strip() for column in header}]
+        if missing:
+            raise ValueError(f"Cannot replay {path}: no {', '.join(missing)} column in the header")
+
+# Stream the records of a recorded log
+def read_log(path, counters=None):
+    """
+    Stream the records of a recorded client log without loading it.
+
+    CSV logs have the columns timestamp, Name, Node and value, e.g. the
+    Client's opcua_data_log.csv. Parquet logs are the Client's rotated
+    files with the columns timestamp, Name, ns, i and value; a directory
+    is read file by file in name (and therefore time) order. Rows that are
+    short, lack a timestamp or node, or have one that does not parse are
+    skipped and counted as invalid.
+
+    Parameters:
+        path (str): The CSV file, Parquet file or Parquet log directory.
+        counters (dict, optional): Counters whose "invalid" entry counts the skipped rows.
+
+    Yields:
+        tuple[datetime, ua.NodeId, str]: The timestamp, node and value text of each record.
+
+    Raises:
+        ValueError: If the log lacks one of the columns, see check_log().
+    """
+    if counters is None:
+        counters = {"invalid": 0}
+    check_log(path)
+    files = parquet_files(path)
+    if files is not None:
+        for file_path in files:
+            parquet_file = pq.ParquetFile(file_path)
+            for batch in parquet_file.iter_batches(batch_size=REPLAY_READ_ROWS, columns=list(PARQUET_COLUMNS)):
+                columns = batch.to_pydict()
+                for timestamp, ns, i, value in zip(columns["timestamp"], columns["ns"], columns["i"], columns["value"]):
+                    if timestamp is None or ns is None or i is None:
+                        counters["invalid"] += 1
+                        continue
+                    yield timestamp, ua.NodeId(i, ns), value
+        return
+
+    with open(path, newline="") as file:
+        reader = csv.reader(file)
+        header = next(reader, None)
+        if header is None:
+            return
+        columns = {name.strip(): index for index, name in enumerate(header)}
+        time_column, node_column, value_column = (columns[name] for name in CSV_COLUMNS)
+        nodeids = {}
+        for row in reader:
+            if len(row) <= max(time_column, node_column, value_column):
+                counters["invalid"] += 1
+                continue
+            node = row[node_column]
+            try:
+                nodeid = nodeids.get(node)
+                if nodeid is None:
+                    nodeid = nodeids[node] = ua.NodeId.from_string(node)
+                timestamp = datetime.fromisoformat(row[time_column])
+            except (ValueError, ua.UaStringParsingError):
+                counters["invalid"] += 1
+                continue
+            yield timestamp, nodeid, row[value_column]
+
+# Group log records into time slices
+def coalesce(records, slice_seconds):
+    """
+    Group records into slices of slice_seconds of log time.
+
+    A slice starts at its first record. Within a slice only the last value
+    of every node is kept. Records older than the current slice, e.g. from
+    interleaved writers, are added to it rather than going back in time.
+
+    Parameters:
+        records (iterable): The (timestamp, nodeid, value) records in log order.
+        slice_seconds (float): The log time covered by one slice.
+
+    Yields:
+        tuple[float, dict, int]: The slice's offset from the first record in
+        log seconds, its last value text per node, and the records it covers.
+    """
+    first = None
+    slice_end = None
+    offset = 0.0
+    updates = {}
+    count = 0
+    for timestamp, nodeid, value in records:
+        if first is None:
+            first = timestamp
+        elapsed = (timestamp - first).total_seconds()
+        if slice_end is not None and elapsed >= slice_end:
+            yield offset, updates, count
+            updates = {}
+            count = 0
+            slice_end = None
+        if slice_end is None:
+            offset = max(elapsed, offset)
+            slice_end = offset + slice_seconds
+        updates.pop(nodeid, None)
+        updates[nodeid] = value
+        count += 1
+    if updates:
+        yield offset, updates, count
+
+# Convert a logged value back to a Variant
+def parse_value(text, variant_type):
+    """
+    Convert the text of a logged value into a Variant of the node's type.
+
+    Numbers outside the range of the type are rejected: the address space
+    would accept them, but every later read and publish of the node would
+    fail to encode. Integer types also reject numbers with a fraction
+    instead of truncating them.
+
+    Parameters:
+        text (str | None): The logged value, as str() of the notified value.
+        variant_type (ua.VariantType): The variant type of the node.
+
+    Returns:
+        ua.Variant | None: The Variant, or None if the text does not fit the type.
+    """
+    if text is None:
+        return None
+    try:
+        if variant_type == ua.VariantType.Boolean:
+            if text not in ("True", "False"):
+                return None
+            return ua.Variant(text == "True", variant_type)
+        if variant_type == ua.VariantType.Float:
+            value = float(text)
+            if abs(value) > FLOAT_MAX and value not in (float("inf"), float("-inf")):
+                return None
+            return ua.Variant(value, variant_type)
+        if variant_type == ua.VariantType.Double:
+            return ua.Variant(float(text), variant_type)
+        if variant_type in INTEGER_RANGES:
+            # int() keeps large 64-bit values exact; "1.0" style text goes through float() and must be integral
+            try:
+                value = int(text)
+            except ValueError:
+                number = float(text)
+                if not number.is_integer():
+                    return None
+                value = int(number)
+            low, high = INTEGER_RANGES[variant_type]
+            if not low <= value <= high:
+                return None
+            return ua.Variant(value, variant_type)
+        if variant_type == ua.VariantType.DateTime:
+            return ua.Variant(datetime.fromisoformat(text), variant_type)
+        if variant_type == ua.VariantType.LocalizedText:
+            return ua.Variant(ua.LocalizedText(text), variant_type)
+        if variant_type == ua.VariantType.String:
+            return ua.Variant(text, variant_type)
+    except (ValueError, OverflowError):
+        return None
+    return None
+
+class LogReplay:
+    """
+    Replays a recorded client log into the server at a chosen speed-up.
+
+    The log is streamed and cut into slices of slice_seconds of wall-clock
+    time (slice_seconds * speed of log time). Each slice is written at its
+    deadline on a Timeline as one bulk write of the last value of every
+    node, skipping the values that did not change.
+    Malformed rows and values that do not fit their node are skipped and
+    counted as invalid.
+    """
+
+    def __init__(self, path, writer, speed=REPLAY_SPEED, slice_seconds=REPLAY_SLICE_SECONDS):
+        self.path = path
+        self.writer = writer
+        self.speed = speed
+        self.slice_seconds = slice_seconds
+        self.counters = {"records": 0, "slices": 0, "coalesced": 0, "unknown": 0, "invalid": 0}
+        self._unknown = set()
+        # A log without the needed columns is rejected here, not halfway through the first replay
+        check_log(path)
+
+    async def play(self):
+        """
+        Replay the log once.
+
+        Returns:
+            LatenessSummary: The lateness of the slices in wall-clock seconds.
+        """
+        timeline = Timeline(self.speed)
+        lateness = LatenessSummary()
+        for offset, updates, count in coalesce(read_log(self.path, self.counters), self.slice_seconds * self.speed):
+            await self.writer.resolve(list(updates))
+            nodeids = []
+            variants = []
+            for nodeid, text in updates.items():
+                variant_type = self.writer.variant_types.get(nodeid)
+                if variant_type is None:
+                    self.counters["unknown"] += 1
+                    if nodeid not in self._unknown:
+                        self._unknown.add(nodeid)
+                        logger.warning(f"Replayed node {nodeid.to_string()} is not in the address space")
+                    continue
+                variant = parse_value(text, variant_type)
+                if variant is None:
+                    self.counters["invalid"] += 1
+                    continue
+                nodeids.append(nodeid)
+                variants.append(variant)
+
+            timeline.offset = offset
+            lateness.add(await timeline.wait())
+            start = time.perf_counter()
+            await self.writer.write_changes(nodeids, variants)
+            STEP_SECONDS.observe(time.perf_counter() - start, "replay")
+            STEP_LATENESS_SECONDS.observe(lateness.last, "replay")
+            self.counters["records"] += count
+            self.counters["slices"] += 1
+            self.counters["coalesced"] += count - len(updates)
+        return lateness
@@ -0,0 +1,141 @@
+import time
+from datetime import datetime
+
+from asyncua import ua
+from asyncua.common.ua_utils import data_type_to_variant_type
+
+from instrumentation import WRITE_SECONDS, WRITE_VALUES
+
+class DataAccessViewWriter:
+    """
+    Writes scenario values to the server address space in bulk.
+
+    Variant types are resolved from the address space once per node (one
+    batched DataType read for all unknown nodes) and cached, so applying a
+    step is a single write service call no matter how many nodes it touches.
+
+    The writer also remembers the last value written to each node so that
+    write_changes() can drop writes that would not change anything; every
+    dropped write is one datachange notification less for each subscriber.
+    Writers of the same nodes, e.g. concurrent scenario tracks and the live
+    ingest, must share one last_values map, or each would skip writes based
+    on a value another writer has since overwritten.
+    """
+
+    def __init__(self, server, last_values=None):
+        self.server = server
+        self.variant_types = {}
+        self.last_values = {} if last_values is None else last_values
+        self.counters = {"written": 0, "skipped": 0, "failed": 0}
+        # Recorders of the written values, e.g. the history store or the AMQP bridge
+        self.recorders = []
+        self._datatype_variant_types = {}
+
+    async def resolve(self, nodeids):
+        """
+        Resolve and cache the variant types of the given nodes.
+
+        Parameters:
+            nodeids (list[ua.NodeId]): The nodes to resolve.
+
+        Returns:
+            None
+        """
+        pending = [nodeid for nodeid in dict.fromkeys(nodeids) if nodeid not in self.variant_types]
+        if not pending:
+            return
+
+        params = ua.ReadParameters()
+        for nodeid in pending:
+            read_value = ua.ReadValueId()
+            read_value.NodeId = nodeid
+            read_value.AttributeId = ua.AttributeIds.DataType
+            params.NodesToRead.append(read_value)
+        results = await self.server.iserver.isession.read(params)
+
+        for nodeid, result in zip(pending, results):
+            if not result.StatusCode.is_good():
+                # Unknown nodes are left to the write, which reports them
+                self.variant_types[nodeid] = None
+                continue
+            datatype = result.Value.Value
+            if datatype not in self._datatype_variant_types:
+                self._datatype_variant_types[datatype] = await data_type_to_variant_type(self.server.get_node(datatype))
+            self.variant_types[nodeid] = self._datatype_variant_types[datatype]
+
+    async def write(self, nodeids, variants):
+        """
+        Write one Variant per node in a single write call.
+
+        Variants whose type differs from the resolved type of their node are
+        converted to it first.
+
+        Parameters:
+            nodeids (list[ua.NodeId]): The nodes to write.
+            variants (list[ua.Variant]): The values, one per node.
+
+        Returns:
+            list[ua.StatusCode]: The write result per node.
+        """
+        if not nodeids:
+            return []
+        await self.resolve(nodeids)
+
+        # Same timestamp convention as Node.write_value; the server timestamp is added by the address space
+        now = datetime.utcnow()
+        params = ua.WriteParameters()
+        for nodeid, variant in zip(nodeids, variants):
+            variant_type = self.variant_types[nodeid]
+            if variant_type is not None and variant_type != ua.VariantType.Variant and variant.VariantType != variant_type:
+                variant = ua.Variant(variant.Value, variant_type)
+            write_value = ua.WriteValue()
+            write_value.NodeId = nodeid
+            write_value.AttributeId = ua.AttributeIds.Value
+            write_value.Value = ua.DataValue(variant, SourceTimestamp=now)
+            params.NodesToWrite.append(write_value)
+        start = time.perf_counter()
+        results = await self.server.iserver.isession.write(params)
+        WRITE_SECONDS.observe(time.perf_counter() - start)
+
+        failed = 0
+        for nodeid, variant, status in zip(nodeids, variants, results):
+            if status.is_good():
+                self.last_values[nodeid] = variant
+            else:
+                self.last_values.pop(nodeid, None)
+                failed += 1
+        self.counters["written"] += len(results) - failed
+        self.counters["failed"] += failed
+        WRITE_VALUES.inc(len(results) - failed, "written")
+        if failed:
+            WRITE_VALUES.inc(failed, "failed")
+        if self.recorders:
+            written = [index for index, status in enumerate(results) if status.is_good()]
+            written_nodeids = [nodeids[index] for index in written]
+            written_variants = [variants[index] for index in written]
+            for recorder in self.recorders:
+                recorder.record_values(written_nodeids, written_variants, now)
+        return results
+
+    async def write_changes(self, nodeids, variants):
+        """
+        Write only the nodes whose value differs from the last value written.
+
+        Parameters:
+            nodeids (list[ua.NodeId]): The candidate nodes.
+            variants (list[ua.Variant]): The values, one per node.
+
+        Returns:
+            tuple[list[int], list[ua.StatusCode]]: The positions of the written
+            nodes in the input lists and their write results.
+        """
+        changed = [
+            index
+            for index, (nodeid, variant) in enumerate(zip(nodeids, variants))
+            if self.last_values.get(nodeid) != variant
+        ]
+        skipped = len(nodeids) - len(changed)
+        self.counters["skipped"] += skipped
+        WRITE_VALUES.inc(skipped, "skipped")
+        results = await self.write([nodeids[index] for index in changed], [variants[index] for index in changed])
+        return changed, results
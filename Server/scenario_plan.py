@@ -0,0 +1,419 @@
+import hashlib
+import logging
+import os
+import pickle
+import re
+import struct
+import sys
+from multiprocessing import resource_tracker, shared_memory
+
+import pandas as pd
+from asyncua import ua
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the layout of a compiled plan changes so stale caches are ignored
+PLAN_FORMAT_VERSION = 4
+
+# Default workbook and cache location (relative to the server working directory)
+SCENARIO_WORKBOOK = "BL4R3-rev01-Diagnostic_NodeID_List-scenario.xlsx"
+PLAN_CACHE_DIR = os.getenv("OPCUA_PLAN_CACHE_DIR", "plan_cache")
+# Shared memory pointer to the compiled plan, set by the supervisor for its workers
+PLAN_SHARED_MEMORY = os.getenv("OPCUA_PLAN_SHM", "")
+# Bytes of the pointer block naming the current shared plan block
+PLAN_POINTER_BYTES = 256
+
+# Workbook DataType tokens and the variant type the address space declares for them
+DATATYPE_VARIANT_TYPES = {
+    "Boolean": ua.VariantType.Boolean,
+    "Real": ua.VariantType.Float,
+    "Float": ua.VariantType.Float,
+    "Double": ua.VariantType.Double,
+    "String": ua.VariantType.String,
+    "DateTime": ua.VariantType.DateTime,
+    "Int32": ua.VariantType.Int32,
+    "UInt16": ua.VariantType.UInt16,
+    "UInt64": ua.VariantType.UInt64,
+}
+
+# Clean values from the Excel file
+def clean_value(value, datatype):
+    """
+    Clean and convert the value from the Excel file based on its datatype.
+
+    Parameters:
+        value: The value to be cleaned.
+        datatype (str): The datatype of the value.
+
+    Returns:
+        The cleaned value in its appropriate type or None if not applicable.
+    """
+    if pd.isnull(value) or value == "Null":
+        return None
+
+    if "Enumeration" in datatype or "Int32" in datatype or "UInt16" in datatype or "UInt64" in datatype:
+        try:
+            return int(''.join(filter(str.isdigit, str(value).split()[0])))
+        except ValueError:
+            return None
+    elif "Boolean" in datatype:
+        return value.lower() == "true" if isinstance(value, str) else bool(value)
+    elif "Double" in datatype or "Real" in datatype:
+        return float(value)
+    elif "String" in datatype:
+        return str(value)
+    elif "DateTime" in datatype:
+        try:
+            dt = pd.to_datetime(value)
+            if dt.year < 1601:
+                return None
+            return dt
+        except (ValueError, OverflowError, pd.errors.OutOfBoundsDatetime):
+            return None
+    return value
+
+# Resolve the OPC UA variant type for a workbook DataType cell
+def resolve_variant_type(datatype):
+    """
+    Resolve the variant type of a node from its DataType cell in the workbook.
+
+    Enumerations are Int32 in the address space. Other cells either name the
+    type directly ("Boolean") or in parentheses ("Long (UInt64)"), so the last
+    known token wins.
+
+    Parameters:
+        datatype (str): The raw DataType cell, e.g. "Real (Float)".
+
+    Returns:
+        ua.VariantType: The variant type used to write the node.
+    """
+    if "Enumeration" in datatype:
+        return ua.VariantType.Int32
+    for token in reversed(re.findall(r"[A-Za-z0-9]+", datatype)):
+        if token in DATATYPE_VARIANT_TYPES:
+            return DATATYPE_VARIANT_TYPES[token]
+    return ua.VariantType.Int32
+
+# Convert a cleaned workbook value into the Variant written to the server
+def prepare_variant(value, variant_type):
+    """
+    Convert a workbook value into a Variant of the node's variant type.
+
+    Parameters:
+        value: The raw or workbook-cleaned value.
+        variant_type (ua.VariantType): The variant type of the target node.
+
+    Returns:
+        ua.Variant | None: The Variant to write, or None if the node is skipped.
+    """
+    cleaned_value = clean_value(value, variant_type.name)
+    if cleaned_value is None and variant_type != ua.VariantType.String:
+        return None
+    if isinstance(cleaned_value, pd.Timestamp):
+        cleaned_value = cleaned_value.to_pydatetime()
+    return ua.Variant(cleaned_value, variant_type)
+
+# Compile one worksheet into its node list and pre-typed values
+def compile_sheet(df):
+    """
+    Compile a scenario worksheet into nodes, default values and steps.
+
+    An optional row with the NodeClass "Duration" holds the duration of each
+    step in seconds; steps without one use the scheduler's default.
+
+    Parameters:
+        df (pd.DataFrame): The worksheet as read from the workbook.
+
+    Returns:
+        dict: The compiled sheet with "nodes", "values" and "steps". Each step
+        has its values and its duration, or None.
+    """
+    rows = df[df["NodeClass"] == "Variable"]
+    durations = df[df["NodeClass"].astype(str).str.strip().str.lower() == "duration"]
+    nodes = []
+    for _, row in rows.iterrows():
+        variant_type = resolve_variant_type(row["DataType"])
+        nodes.append({
+            "name": row["Name"],
+            "datatype": row["DataType"].replace("(Enumeration)", "").strip(),
+            "ns": int(row["ns"]),
+            "i": int(row["i"]),
+            "nodeid": ua.NodeId(int(row["i"]), int(row["ns"])),
+            "variant_type": variant_type,
+        })
+
+    values = []
+    if "Value" in df.columns:
+        values = [
+            prepare_variant(value, node["variant_type"])
+            for value, node in zip(rows["Value"], nodes)
+        ]
+
+    steps = []
+    for step_column in df.columns:
+        if not str(step_column).startswith("Step"):
+            continue
+        data = {}
+        step_values = []
+        for (_, row), node in zip(rows.iterrows(), nodes):
+            value = clean_value(row[step_column], row["DataType"])
+            data[node["name"]] = value
+            step_values.append(None if value is None else prepare_variant(value, node["variant_type"]))
+        steps.append({
+            "name": str(step_column).strip(),
+            "data": data,
+            "values": step_values,
+            "duration": step_duration(durations[step_column]) if not durations.empty else None,
+        })
+
+    return {"nodes": nodes, "values": values, "steps": steps}
+
+# Duration of a step from the optional Duration row
+def step_duration(cells):
+    """
+    Read the duration of a step from its Duration row cell.
+
+    Parameters:
+        cells (pd.Series): The step column of the Duration row(s).
+
+    Returns:
+        float | None: The duration in seconds, or None if not set or invalid.
+    """
+    for value in cells:
+        try:
+            duration = float(value)
+        except (TypeError, ValueError):
+            continue
+        if duration > 0:
+            return duration
+    return None
+
+# Compile the whole scenario workbook
+def compile_scenario_plan(file_path):
+    """
+    Parse the scenario workbook once into a pre-typed scenario plan.
+
+    Parameters:
+        file_path (str): The path to the Excel file.
+
+    Returns:
+        dict: The plan with the workbook hash and one compiled entry per sheet.
+    """
+    sheets = pd.read_excel(file_path, sheet_name=None, engine='openpyxl')
+    return {
+        "version": PLAN_FORMAT_VERSION,
+        "workbook": os.path.basename(file_path),
+        "sha256": workbook_hash(file_path),
+        "sheets": {str(name): compile_sheet(df) for name, df in sheets.items()},
+    }
+
+# Hash the workbook contents for cache lookups
+def workbook_hash(file_path):
+    """
+    Compute the SHA-256 of a workbook file.
+
+    Parameters:
+        file_path (str): The path to the Excel file.
+
+    Returns:
+        str: The hex digest of the file contents.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Location of the cached plan for a workbook
+def plan_cache_path(file_path, cache_dir=PLAN_CACHE_DIR, digest=None):
+    """
+    Build the cache file path for a workbook.
+
+    Parameters:
+        file_path (str): The path to the Excel file.
+        cache_dir (str): The directory holding compiled plans.
+        digest (str, optional): The workbook hash, computed if not given.
+
+    Returns:
+        str: The path of the cached plan.
+    """
+    digest = digest or workbook_hash(file_path)
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.join(cache_dir, f"{stem}.v{PLAN_FORMAT_VERSION}.{digest[:16]}.plan.pickle")
+
+# Write a compiled plan to the cache
+def save_scenario_plan(plan, path):
+    """
+    Atomically write a compiled plan to disk.
+
+    Parameters:
+        plan (dict): The compiled scenario plan.
+        path (str): The destination path.
+
+    Returns:
+        None
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as file:
+        pickle.dump(plan, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+# Load the plan for a workbook, compiling it on a cache miss
+def load_scenario_plan(file_path=SCENARIO_WORKBOOK, cache_dir=PLAN_CACHE_DIR):
+    """
+    Load the compiled plan for a workbook from the cache, compiling it if needed.
+
+    Parameters:
+        file_path (str): The path to the Excel file.
+        cache_dir (str): The directory holding compiled plans.
+
+    Returns:
+        dict: The compiled scenario plan.
+    """
+    digest = workbook_hash(file_path)
+    path = plan_cache_path(file_path, cache_dir, digest)
+    try:
+        with open(path, "rb") as file:
+            plan = pickle.load(file)
+        if plan.get("version") == PLAN_FORMAT_VERSION and plan.get("sha256") == digest:
+            return plan
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        pass
+
+    plan = compile_scenario_plan(file_path)
+    try:
+        save_scenario_plan(plan, path)
+        logger.info(f"Compiled scenario plan cached at {path}")
+    except OSError as e:
+        logger.warning(f"Could not cache scenario plan at {path}: {e}")
+    return plan
+
+# Publish a compiled plan in shared memory
+def share_scenario_plan(plan, name=None):
+    """
+    Copy a compiled plan into a shared memory block for worker processes.
+
+    The block holds the pickled plan behind its length, so every worker
+    loads the same plan without reading the workbook or the cache.
+
+    Parameters:
+        plan (dict): The compiled scenario plan.
+        name (str, optional): The block name, chosen by the system by default.
+
+    Returns:
+        shared_memory.SharedMemory: The block; the owner closes and unlinks it.
+    """
+    data = pickle.dumps(plan, protocol=pickle.HIGHEST_PROTOCOL)
+    block = shared_memory.SharedMemory(name=name, create=True, size=len(data) + 8)
+    block.buf[:8] = struct.pack("<Q", len(data))
+    block.buf[8:len(data) + 8] = data
+    return block
+
+# Attach to a shared memory block owned by another process
+def attach_shared_memory(name):
+    block = shared_memory.SharedMemory(name=name)
+    # Only the owner may unlink the block; attaching must not register it for cleanup
+    resource_tracker.unregister(block._name, "shared_memory")
+    return block
+
+# Read the name of the current plan block from a SharedScenarioPlan pointer
+def shared_plan_name(pointer):
+    size = struct.unpack("<Q", bytes(pointer.buf[:8]))[0]
+    return bytes(pointer.buf[8:size + 8]).decode()
+
+# Load a plan published by share_scenario_plan()
+def read_shared_plan(name):
+    """
+    Load the compiled plan from a shared memory block.
+
+    Parameters:
+        name (str): The name of the block written by share_scenario_plan().
+
+    Returns:
+        dict: The compiled scenario plan.
+    """
+    block = attach_shared_memory(name)
+    try:
+        size = struct.unpack("<Q", bytes(block.buf[:8]))[0]
+        return pickle.loads(block.buf[8:size + 8])
+    finally:
+        block.close()
+
+# Load the current plan of a SharedScenarioPlan
+def load_shared_plan(name=PLAN_SHARED_MEMORY):
+    """
+    Load the current compiled plan published by a SharedScenarioPlan.
+
+    Parameters:
+        name (str): The name of its pointer block.
+
+    Returns:
+        dict: The compiled scenario plan.
+    """
+    pointer = attach_shared_memory(name)
+    try:
+        return read_shared_plan(shared_plan_name(pointer))
+    finally:
+        pointer.close()
+
+class SharedScenarioPlan:
+    """
+    Shares the compiled plan with worker processes and republishes it after a reload.
+
+    A small pointer block holds the name of the block with the current plan;
+    the workers are given the pointer's name. publish() writes a reloaded plan
+    into a new block, points at it and unlinks the previous one, so the
+    workbook is compiled once by the owner and the workers only load the
+    result. A worker that misses a block between reading the pointer and
+    attaching reads the pointer again at its next check.
+    """
+
+    def __init__(self, plan, pointer_bytes=PLAN_POINTER_BYTES):
+        self.pointer = shared_memory.SharedMemory(create=True, size=pointer_bytes)
+        self.block = None
+        self.publish(plan)
+
+    @property
+    def name(self):
+        return self.pointer.name
+
+    def publish(self, plan):
+        """
+        Publish a plan as the current one.
+
+        Parameters:
+            plan (dict): The compiled scenario plan.
+
+        Returns:
+            shared_memory.SharedMemory: The block holding the plan.
+        """
+        block = share_scenario_plan(plan)
+        name = block.name.encode()
+        self.pointer.buf[:len(name) + 8] = struct.pack("<Q", len(name)) + name
+        if self.block is not None:
+            self.block.close()
+            self.block.unlink()
+        self.block = block
+        return block
+
+    def close(self):
+        """
+        Close and unlink the pointer and the current plan block.
+
+        Returns:
+            None
+        """
+        for block in (self.block, self.pointer):
+            if block is not None:
+                block.close()
+                block.unlink()
+        self.block = self.pointer = None
+
+if __name__ == "__main__":
+    # Precompile the plan, e.g. at image build time: python scenario_plan.py [workbook]
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    workbook = sys.argv[1] if len(sys.argv) > 1 else SCENARIO_WORKBOOK
+    plan = load_scenario_plan(workbook)
+    for sheet_name, sheet in plan["sheets"].items():
+        print(f"Sheet '{sheet_name}': {len(sheet['nodes'])} nodes, {len(sheet['steps'])} steps")
@@ -0,0 +1,251 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from scenario_plan import (PLAN_CACHE_DIR, SCENARIO_WORKBOOK, attach_shared_memory, load_scenario_plan,
+                           read_shared_plan, shared_plan_name, workbook_hash)
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks of the scenario workbook for changes, 0 disables hot reload
+RELOAD_SECONDS = float(os.getenv("OPCUA_RELOAD_SECONDS", 2))
+
+# Everything the plan says about each node of a sheet, keyed by node
+def sheet_rows(sheet):
+    """
+    Collect the name, type, default value and step values of every node of a compiled sheet.
+
+    Parameters:
+        sheet (dict): The compiled sheet.
+
+    Returns:
+        dict: (name, variant type, default value, step values) per node id.
+    """
+    defaults = sheet["values"] or [None] * len(sheet["nodes"])
+    return {
+        node["nodeid"]: (node["name"], node["variant_type"], default,
+                         tuple(step["values"][index] for step in sheet["steps"]))
+        for index, (node, default) in enumerate(zip(sheet["nodes"], defaults))
+    }
+
+# What a step sets, independent of the row order of its sheet
+def step_signature(sheet, step):
+    return step["name"], step["duration"], dict(zip((node["nodeid"] for node in sheet["nodes"]), step["values"]))
+
+# Compare two compiled versions of a sheet
+def diff_sheet(old, new):
+    """
+    Compare the nodes and steps of two compiled versions of a sheet.
+
+    Parameters:
+        old (dict): The running sheet.
+        new (dict): The sheet compiled from the changed workbook.
+
+    Returns:
+        dict | None: The added, removed and changed node ids and the number of
+        changed, added and removed steps, or None if the sheets are the same.
+    """
+    old_rows = sheet_rows(old)
+    new_rows = sheet_rows(new)
+    old_steps = [step_signature(old, step) for step in old["steps"]]
+    new_steps = [step_signature(new, step) for step in new["steps"]]
+    diff = {
+        "nodes_added": [nodeid for nodeid in new_rows if nodeid not in old_rows],
+        "nodes_removed": [nodeid for nodeid in old_rows if nodeid not in new_rows],
+        "nodes_changed": [nodeid for nodeid, row in new_rows.items()
+                          if nodeid in old_rows and old_rows[nodeid] != row],
+        "steps_changed": sum(1 for old_step, new_step in zip(old_steps, new_steps) if old_step != new_step),
+        "steps_added": max(len(new_steps) - len(old_steps), 0),
+        "steps_removed": max(len(old_steps) - len(new_steps), 0),
+    }
+    # Reordered rows alone leave the running sheet as it is; it is consistent with itself
+    if not any(diff.values()):
+        return None
+    return diff
+
+# Compare two compiled scenario plans sheet by sheet
+def diff_scenario_plans(old, new):
+    """
+    Compute which sheets of a scenario plan were added, removed or changed.
+
+    Parameters:
+        old (dict): The running plan.
+        new (dict): The plan compiled from the changed workbook.
+
+    Returns:
+        dict: The "added" and "removed" sheet names, and the diff_sheet() of
+        every "changed" sheet.
+    """
+    changed = {}
+    for name, sheet in new["sheets"].items():
+        if name in old["sheets"]:
+            sheet_diff = diff_sheet(old["sheets"][name], sheet)
+            if sheet_diff is not None:
+                changed[name] = sheet_diff
+    return {
+        "added": [name for name in new["sheets"] if name not in old["sheets"]],
+        "removed": [name for name in old["sheets"] if name not in new["sheets"]],
+        "changed": changed,
+    }
+
+class ScenarioReloader:
+    """
+    Watches the scenario workbook and applies its changes to the running plan.
+
+    Every interval the workbook is stat()ed on the event loop; only when its
+    mtime or size changed is it hashed (in the default executor), and only
+    when the hash differs from the running plan's is it compiled, or loaded
+    from the plan cache, in a separate process. Parsing the workbook holds
+    the GIL, so a thread would still stall playback and client sessions for
+    tens of milliseconds. The new plan is diffed against the running one, and only the
+    added and changed sheets are swapped into the running plan dict, in
+    place. Playback reads a sheet when its scenario starts, so a scenario
+    already playing finishes on the version it started with. The listeners
+    are then awaited with the plan and the diff, e.g. to map the event
+    fields of the changed sheets.
+
+    The workers of a supervisor pass the pointer of its SharedScenarioPlan as
+    shared instead: they do not watch the workbook, they load the plan the
+    supervisor compiled whenever the pointer names a new block.
+    """
+
+    def __init__(self, plan, path=SCENARIO_WORKBOOK, interval=RELOAD_SECONDS, cache_dir=PLAN_CACHE_DIR, shared=""):
+        self.plan = plan
+        self.path = path
+        self.interval = interval
+        self.cache_dir = cache_dir
+        # Awaited with (plan, diff) after every applied change
+        self.listeners = []
+        self.counters = {"checks": 0, "reloads": 0, "unchanged": 0, "failed": 0, "sheets_changed": 0}
+        self._stat = self.stat()
+        self._executor = None
+        self._pointer = attach_shared_memory(shared) if shared else None
+        self._shared_name = None
+
+    def stat(self):
+        try:
+            result = os.stat(self.path)
+        except OSError:
+            return None
+        return result.st_mtime_ns, result.st_size
+
+    async def check(self):
+        """
+        Reload the workbook if it changed since the last check.
+
+        Returns:
+            dict | None: The applied diff, or None if nothing was applied.
+        """
+        self.counters["checks"] += 1
+        if self._pointer is not None:
+            new_plan = self.load_shared()
+            return None if new_plan is None else await self.apply(new_plan)
+        stat = self.stat()
+        if stat is None or stat == self._stat:
+            return None
+        self._stat = stat
+
+        loop = asyncio.get_running_loop()
+        try:
+            digest = await loop.run_in_executor(None, workbook_hash, self.path)
+            if digest == self.plan.get("sha256"):
+                self.counters["unchanged"] += 1
+                return None
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+            new_plan = await loop.run_in_executor(self._executor, load_scenario_plan, self.path, self.cache_dir)
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                self._executor = None
+            # A half-saved or broken workbook keeps the running plan until the file changes again
+            self.counters["failed"] += 1
+            logger.warning(f"Could not reload {self.path}, keeping the running scenarios: {e}")
+            return None
+        return await self.apply(new_plan)
+
+    def load_shared(self):
+        """
+        Load the shared plan if the pointer names a block not seen before.
+
+        Returns:
+            dict | None: The new plan, or None if it did not change.
+        """
+        try:
+            name = shared_plan_name(self._pointer)
+            if name == self._shared_name:
+                return None
+            new_plan = read_shared_plan(name)
+        except (OSError, ValueError, pickle.UnpicklingError) as e:
+            # The pointer was being rewritten or the block replaced again; the next check reads it anew
+            self.counters["failed"] += 1
+            logger.warning(f"Could not load the shared scenario plan: {e}")
+            return None
+        self._shared_name = name
+        if new_plan.get("sha256") == self.plan.get("sha256"):
+            self.counters["unchanged"] += 1
+            return None
+        return new_plan
+
+    async def apply(self, new_plan):
+        """
+        Swap the changed sheets of a new plan into the running plan.
+
+        Parameters:
+            new_plan (dict): The plan compiled from the changed workbook.
+
+        Returns:
+            dict: The diff that was applied.
+        """
+        diff = diff_scenario_plans(self.plan, new_plan)
+        sheets = self.plan["sheets"]
+        for name in diff["removed"]:
+            del sheets[name]
+        for name in diff["added"] + list(diff["changed"]):
+            sheets[name] = new_plan["sheets"][name]
+        self.plan["sha256"] = new_plan["sha256"]
+        for listener in self.listeners:
+            await listener(self.plan, diff)
+
+        self.counters["reloads"] += 1
+        self.counters["sheets_changed"] += len(diff["added"]) + len(diff["removed"]) + len(diff["changed"])
+        changes = ", ".join(
+            f"'{name}' ({len(sheet_diff['nodes_added'])} nodes added, {len(sheet_diff['nodes_removed'])} removed, "
+            f"{len(sheet_diff['nodes_changed'])} changed, {sheet_diff['steps_changed']} steps changed, "
+            f"{sheet_diff['steps_added']} added, {sheet_diff['steps_removed']} removed)"
+            for name, sheet_diff in diff["changed"].items())
+        logger.info(f"Reloaded {self.path}: sheets added {diff['added'] or 'none'}, removed {diff['removed'] or 'none'}, "
+                    f"changed {changes or 'none'}",
+                    extra={"added": len(diff["added"]), "removed": len(diff["removed"]), "changed": len(diff["changed"])})
+        return diff
+
+    async def run(self):
+        """
+        Check the workbook every interval, forever.
+
+        Returns:
+            None
+        """
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                await self.check()
+        finally:
+            self.close()
+
+    def close(self):
+        """
+        Stop the compiler process and detach from the shared plan.
+
+        Returns:
+            None
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._pointer is not None:
+            self._pointer.close()
+            self._pointer = None
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import os
+from bisect import bisect_left
+
+from instrumentation import LATENCY_BUCKETS
+
+logger = logging.getLogger(__name__)
+
+# Playback timing; OPCUA_TIME_SCALE=10 plays scenarios ten times faster
+TIME_SCALE = float(os.getenv("OPCUA_TIME_SCALE", 1))
+STEP_SECONDS = float(os.getenv("OPCUA_STEP_SECONDS", 5))
+SCENARIO_PAUSE_SECONDS = float(os.getenv("OPCUA_SCENARIO_PAUSE_SECONDS", 15))
+
+# Scenario playlists played concurrently, e.g. "1;2" plays scenarios 1 and 2 side by side
+SCENARIO_TRACKS = os.getenv("OPCUA_SCENARIO_TRACKS", "default,1,default,2")
+
+# Split the track specification into playlists
+def parse_tracks(spec=SCENARIO_TRACKS):
+    """
+    Parse a track specification into one playlist per track.
+
+    Parameters:
+        spec (str): Tracks separated by ";", scenarios within a track by ",".
+
+    Returns:
+        list[list[str]]: The scenario sheet names of each track.
+    """
+    tracks = [[name.strip() for name in track.split(",") if name.strip()] for track in spec.split(";")]
+    return [track for track in tracks if track]
+
+# Durations of the steps of a sheet
+def step_durations(sheet, step_seconds=STEP_SECONDS):
+    """
+    Resolve the duration of every step of a compiled sheet.
+
+    Parameters:
+        sheet (dict): The compiled sheet.
+        step_seconds (float): The duration of steps without one in the workbook.
+
+    Returns:
+        list[float]: The duration of each step in scenario seconds.
+    """
+    return [step.get("duration") or step_seconds for step in sheet["steps"]]
+
+class Timeline:
+    """
+    Schedules playback against absolute deadlines.
+
+    The timeline keeps a cursor in scenario seconds. wait() sleeps until the
+    wall-clock deadline of the cursor and advance() moves the cursor, so the
+    time spent applying a step is absorbed by the next sleep instead of
+    adding up. Scenario seconds are divided by the time scale.
+    """
+
+    def __init__(self, time_scale=TIME_SCALE):
+        self.time_scale = time_scale
+        self.start = None
+        self.offset = 0.0
+
+    def deadline(self):
+        """
+        Event loop time at which the cursor is due.
+        """
+        loop = asyncio.get_running_loop()
+        if self.start is None:
+            self.start = loop.time()
+        return self.start + self.offset / self.time_scale
+
+    async def wait(self):
+        """
+        Sleep until the cursor is due.
+
+        Returns:
+            float: How late the wait returned, in wall-clock seconds.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = self.deadline()
+        delay = deadline - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return max(loop.time() - deadline, 0.0)
+
+    def advance(self, seconds):
+        """
+        Move the cursor by the given scenario seconds.
+
+        Parameters:
+            seconds (float): The duration of the step or pause just scheduled.
+
+        Returns:
+            None
+        """
+        self.offset += seconds
+
+class LatenessSummary:
+    """
+    Running summary of step lateness in constant memory.
+
+    Keeps the count, sum and maximum, and a histogram over the latency
+    buckets for percentiles, so a replay of a multi-week log does not keep
+    one value per slice.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def add(self, seconds):
+        self.bucket_counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.last = seconds
+
+    def percentile(self, fraction):
+        """
+        Estimate a percentile as the upper bound of the bucket it falls in.
+
+        Parameters:
+            fraction (float): The percentile as a fraction, e.g. 0.99.
+
+        Returns:
+            float: The estimate in seconds, at most the maximum; 0 without values.
+        """
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.bucket_counts):
+            seen += count
+            if seen >= rank and seen:
+                return min(bound, self.max)
+        return self.max
+
+# Summarize the lateness of the steps of a scenario
+def report_lateness(label, lateness):
+    """
+    Log the mean and maximum lateness of the steps of a scenario.
+
+    Parameters:
+        label (str): What the steps cover, e.g. "Scenario 1".
+        lateness (LatenessSummary): The lateness of the steps.
+
+    Returns:
+        None
+    """
+    if not lateness.count:
+        return
+    logger.info(f"{label}: {lateness.count} steps, lateness mean {lateness.total / lateness.count * 1000:.1f} ms, "
+                f"max {lateness.max * 1000:.1f} ms")
@@ -1,223 +1,283 @@
 import asyncio
-import pandas as pd
-from asyncua import Server, ua
+from asyncua import Server
+import logging
 import os
+import signal
+import time
+from address_space_pruning import PRUNE_ADDRESS_SPACE, init_pruned_address_space
+from address_space_snapshot import init_address_space
+from amqp_bridge import open_bridge
+from event_emitter import POINT_TURN_EVENT_TYPE, EventEmitter, is_event_specific
+from history_store import HISTORY_ENABLED, DiagnosticHistoryManager
+from instrumentation import (METRICS_PORT, REGISTRY, STEP_LATENESS_SECONDS, STEP_SECONDS, register_server_metrics,
+                             setup_logging, start_metrics_server)
+from instance_simulator import (INSTANCE_COUNT, INSTANCE_SCENARIO, INSTANCE_TEMPLATE, InstanceSimulator,
+                                clone_instances)
+from live_ingest import INGEST_SOCKET, INGEST_TCP_PORT, INGEST_UDP_PORT, LiveIngest
+from log_replay import REPLAY_LOG, LogReplay
+from node_writer import DataAccessViewWriter
+from scenario_plan import PLAN_SHARED_MEMORY, SCENARIO_WORKBOOK, load_scenario_plan, load_shared_plan
+from scenario_reload import RELOAD_SECONDS, ScenarioReloader
+from scenario_scheduler import (SCENARIO_PAUSE_SECONDS, SCENARIO_TRACKS, TIME_SCALE, Timeline, parse_tracks,
+                                LatenessSummary, report_lateness, step_durations)
+from supervisor import SERVER_WORKERS, supervise
+
+logger = logging.getLogger("server")
 
 # Start
-# Constants for event-specific node names
-EVENT_SPECIFIC_NODES = ["isEndpositionReached", "commandedPosition", "failureReason"]
-
-# Load node information from Excel file
-def load_node_info(file_path, sheet_name):
+# Update Data Access View nodes for a scenario step
+async def update_data_access_view(writer, nodes, values):
     """
-    Load node information from an Excel file.
+    Update Data Access View nodes with the values of a compiled sheet or step.
 
-    Parameters:
-        file_path (str): The path to the Excel file.
-        sheet_name (str): The name of the sheet to read from.
-
-    Returns:
-        list[dict]: A list of dictionaries containing node information.
-    """
-    df = pd.read_excel(file_path, sheet_name=sheet_name, engine='openpyxl')
-    if sheet_name == 'default':
-        return [
-            {
-                "name": row["Name"],
-                "datatype": row["DataType"].replace("(Enumeration)", "").strip(),
-                "ns": int(row["ns"]),
-                "i": int(row["i"]),
-                "value": row["Value"]
-            }
-            for _, row in df.iterrows()
-            if row["NodeClass"] == "Variable"
-        ]
-    else:
-        return [
-            {
-                "name": row["Name"],
-                "datatype": row["DataType"].replace("(Enumeration)", "").strip(),
-                "ns": int(row["ns"]),
-                "i": int(row["i"])
-            }
-            for _, row in df.iterrows()
-            if row["NodeClass"] == "Variable"
-        ]
-
-# Clean values from the Excel file
-def clean_value(value, datatype):
-    """
-    Clean and convert the value from the Excel file based on its datatype.
+    Only values that differ from the last value written to a node are sent,
+    as one bulk write through the writer. Every node of the step is a
+    candidate, so a node whose write failed or that another writer changed
+    is written again.
 
     Parameters:
-        value: The value to be cleaned.
-        datatype (str): The datatype of the value.
+        writer (DataAccessViewWriter): The bulk writer bound to the server.
+        nodes (list[dict]): The compiled node information of the sheet.
+        values (list[ua.Variant | None]): One Variant per node, None to skip it.
 
     Returns:
-        The cleaned value in its appropriate type or None if not applicable.
+        None
     """
-    if pd.isnull(value) or value == "Null":
-        return None
-
-    if "Enumeration" in datatype or "Int32" in datatype or "UInt16" in datatype or "UInt64" in datatype:
-        try:
-            return int(''.join(filter(str.isdigit, str(value).split()[0])))
-        except ValueError:
-            return None
-    elif "Boolean" in datatype:
-        return value.lower() == "true" if isinstance(value, str) else bool(value)
-    elif "Double" in datatype or "Real" in datatype:
-        return float(value)
-    elif "String" in datatype:
-        return str(value)
-    elif "DateTime" in datatype:
-        try:
-            dt = pd.to_datetime(value)
-            if dt.year < 1601:
-                return None
-            return dt
-        except (ValueError, OverflowError, pd.errors.OutOfBoundsDatetime):
-            return None
-    return value
-
-# Load scenario steps from Excel file
-def load_scenario_steps(file_path, sheet_name):
+    updates = [
+        (node_info, variant)
+        for node_info, variant in zip(nodes, values)
+        if not is_event_specific(node_info["name"]) and variant is not None
+    ]
+    written, results = await writer.write_changes(
+        [node_info["nodeid"] for node_info, _ in updates], [variant for _, variant in updates]
+    )
+
+    # Every write is logged at DEBUG only; the write metrics count them at any level
+    debug = logger.isEnabledFor(logging.DEBUG)
+    for position, status in zip(written, results):
+        node_info, variant = updates[position]
+        if not status.is_good():
+            logger.warning("Error writing to %s (ns=%s; i=%s): %s", node_info['name'], node_info['ns'], node_info['i'],
+                           status, extra={"node": node_info['nodeid'].to_string()})
+        elif debug:
+            logger.debug("Updated %s (ns=%s; i=%s) to %s", node_info['name'], node_info['ns'], node_info['i'],
+                         variant.Value, extra={"node": node_info['nodeid'].to_string()})
+
+# Report how many writes were sent and skipped since a counter snapshot
+def report_write_counters(label, writer, since):
     """
-    Load scenario steps from an Excel file.
+    Log the written and skipped write counts since a counter snapshot.
 
     Parameters:
-        file_path (str): The path to the Excel file.
-        sheet_name (str): The name of the sheet to read from.
+        label (str): What the counts cover, e.g. "Scenario 1".
+        writer (DataAccessViewWriter): The bulk writer.
+        since (dict): A copy of writer.counters taken at the start.
 
     Returns:
-        list[dict]: A list of dictionaries containing scenario step data.
+        None
     """
-    df = pd.read_excel(file_path, sheet_name=sheet_name, engine='openpyxl')
-    steps = []
-    for step_column in df.columns:
-        if step_column.startswith("Step"):
-            step_data = {row["Name"]: clean_value(row[step_column], row["DataType"]) for _, row in df.iterrows()}
-            steps.append(step_data)
-    return steps
-
-# Generate and trigger events for scenario
-async def generate_event(server, source_node, event_type_node, step_data):
+    written = writer.counters["written"] - since["written"]
+    skipped = writer.counters["skipped"] - since["skipped"]
+    failed = writer.counters["failed"] - since["failed"]
+    total = written + skipped + failed
+    saved = 100 * skipped / total if total else 0
+    logger.info(f"{label}: {written} writes, {skipped} skipped as unchanged, {failed} failed "
+                f"({saved:.0f}% fewer datachange notifications per subscriber)",
+                extra={"written": written, "skipped": skipped, "failed": failed})
+
+# Asynchronous input function
+async def async_input(prompt: str) -> str:
     """
-    Generate and trigger an event for the given scenario step data.
+    Asynchronous input function to handle user input.
 
     Parameters:
-        server (Server): The OPC UA server instance.
-        source_node (Node): The source node for the event.
-        event_type_node (Node): The event type node.
-        step_data (dict): The data for the current scenario step.
+        prompt (str): The prompt message to display.
 
     Returns:
-        None
+        str: The user input.
     """
-    event = await server.get_event_generator(event_type_node, source_node)
-    event.event.Severity = 5555
-    event.event.Message = ua.LocalizedText("Event triggered with scenario values")
-    
-    # Set event-specific node values
-    for attr in EVENT_SPECIFIC_NODES:
-        event.event.SetValue(attr, ua.Variant(step_data.get(attr, False), ua.VariantType.Boolean))
-
-    await event.trigger()
-    print(f"Scenario Event triggered: {step_data}")
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, input, prompt)
 
-# Update Data Access View nodes
-async def update_node_value(server, node_info, value):
+# Play scenario playlists against absolute deadlines
+async def play_scenarios(plan, scenarios, writer, emitter, event_fields, instance_objects, prefix="", track="1"):
     """
-    Update the value of a specific node on the server.
+    Loop over a playlist of scenarios, applying each step at its deadline.
+
+    Step deadlines come from a Timeline, so the time spent writing a step
+    does not delay the following steps. Steps last their workbook duration
+    (or STEP_SECONDS) and scenarios are separated by SCENARIO_PAUSE_SECONDS,
+    both divided by TIME_SCALE.
 
     Parameters:
-        server (Server): The OPC UA server instance.
-        node_info (dict): Information about the node to be updated.
-        value: The value to be written to the node.
+        plan (dict): The compiled scenario plan.
+        scenarios (list[str]): The sheet names to play in sequence.
+        writer (DataAccessViewWriter): The bulk writer of this track.
+        emitter (EventEmitter): The PointTurn event emitter.
+        event_fields (dict): The event field mapping of each sheet.
+        instance_objects (list[Node]): The instances emitting the events.
+        prefix (str): Prefix of the logged messages, e.g. "[Track 2] ".
+        track (str): The track label of the step metrics.
 
     Returns:
         None
     """
-    node = server.get_node(ua.NodeId(node_info["i"], node_info["ns"]))
-    try:
-        data_type = await node.read_data_type_as_variant_type()
-        cleaned_value = clean_value(value, data_type.name)
-        if cleaned_value is None and data_type != ua.VariantType.String:
-            print(f"Skipping node: {node_info['name']} due to None value and incompatible type.")
-            return
-
-        if isinstance(cleaned_value, pd.Timestamp):
-            cleaned_value = cleaned_value.to_pydatetime()
-
-        variant_value = ua.Variant(cleaned_value, data_type)
-        await node.write_value(variant_value)
-        print(f"Updated {node_info['name']} (ns={node_info['ns']}; i={node_info['i']}) to {cleaned_value}")
-    except Exception as e:
-        print(f"Error writing to {node_info['name']} (ns={node_info['ns']}; i={node_info['i']}): {e}")
-
-# Update Data Access View nodes for a scenario step
-async def update_data_access_view(server, nodes, scenario_step=None):
+    timeline = Timeline(TIME_SCALE)
+    missing = set()
+    while True:
+        """
+         ***TEMPORARY***
+         Loop scenario
+        """
+        loop_counters = dict(writer.counters)
+        for scenario_choice in scenarios:
+            # Sheets are looked up per scenario, so a reloaded workbook takes effect at the next scenario
+            sheet = plan["sheets"].get(scenario_choice)
+            if sheet is None:
+                if scenario_choice not in missing:
+                    missing.add(scenario_choice)
+                    logger.warning(f"{prefix}Scenario {scenario_choice} is not in the workbook, skipping it until it is added")
+                timeline.advance(SCENARIO_PAUSE_SECONDS)
+                await timeline.wait()
+                continue
+            missing.discard(scenario_choice)
+            logger.info(f"{prefix}Playing scenario: {scenario_choice}")
+            scenario_counters = dict(writer.counters)
+            nodes = sheet["nodes"]
+            # The event fields are captured with the sheet, so a reload mid-scenario cannot mix the two
+            fields = event_fields.get(scenario_choice)
+            if fields is None:
+                fields = await emitter.map_fields(nodes)
+            lateness = LatenessSummary()
+
+            if scenario_choice == "default":
+                lateness.add(await timeline.wait())
+                start = time.perf_counter()
+                await update_data_access_view(writer, nodes, sheet["values"])
+                STEP_SECONDS.observe(time.perf_counter() - start, track)
+                STEP_LATENESS_SECONDS.observe(lateness.last, track)
+            else:
+                durations = step_durations(sheet)
+                for step_index, step in enumerate(sheet["steps"]):
+                    lateness.add(await timeline.wait())
+                    start = time.perf_counter()
+                    logger.debug(f"{prefix}Step {step_index + 1}/{len(durations)} of scenario {scenario_choice} "
+                                 f"started {lateness.last * 1000:.1f} ms late")
+                    await update_data_access_view(writer, nodes, step["values"])
+                    field_values = emitter.field_values(fields, step["values"])
+                    await emitter.emit(instance_objects, [field_values] * len(instance_objects))
+                    STEP_SECONDS.observe(time.perf_counter() - start, track)
+                    STEP_LATENESS_SECONDS.observe(lateness.last, track)
+                    if field_values and logger.isEnabledFor(logging.DEBUG):
+                        logger.debug(f"{prefix}PointTurn event triggered with " + ", ".join(
+                            f"{attribute}={variant.Value}" for attribute, variant in field_values))
+                    timeline.advance(durations[step_index])
+            logger.info(f"{prefix}Scenario {scenario_choice} completed.")
+            report_write_counters(f"{prefix}Scenario {scenario_choice}", writer, scenario_counters)
+            report_lateness(f"{prefix}Scenario {scenario_choice}", lateness)
+            timeline.advance(SCENARIO_PAUSE_SECONDS)
+
+        logger.info(f"{prefix}Completed all scenarios, starting over...")
+        report_write_counters(f"{prefix}All scenarios", writer, loop_counters)
+
+# Bring the event fields, history and simulated instances up to date with a reloaded plan
+async def apply_scenario_reload(plan, diff, emitter, event_fields, history=None, simulator=None):
     """
-    Update Data Access View nodes for a given scenario step.
+    Apply the changed sheets of a reloaded scenario workbook to the running server.
+
+    Only the added and changed sheets are touched: their event fields are
+    mapped again, their new variables are historized, and the simulated
+    instances load their scenario sheet again if it changed. The address
+    space, sessions and subscriptions are left alone.
 
     Parameters:
-        server (Server): The OPC UA server instance.
-        nodes (list[dict]): A list of node information dictionaries.
-        scenario_step (dict, optional): The data for the current scenario step.
+        plan (dict): The running plan, with the new sheets already swapped in.
+        diff (dict): The diff_scenario_plans() of the reload.
+        emitter (EventEmitter): The PointTurn event emitter.
+        event_fields (dict): The event field mapping of each sheet, updated in place.
+        history (DiagnosticHistoryManager, optional): The history store.
+        simulator (InstanceSimulator, optional): The instance simulator.
 
     Returns:
         None
     """
-    for node_info in nodes:
-        if node_info["name"] in EVENT_SPECIFIC_NODES:
-            continue
-        value = scenario_step.get(node_info["name"], node_info.get("value")) if scenario_step else node_info.get("value")
-        if value is not None:
-            await update_node_value(server, node_info, value)
-
-# Asynchronous input function
-async def async_input(prompt: str) -> str:
+    updated = diff["added"] + list(diff["changed"])
+    if PRUNE_ADDRESS_SPACE:
+        # The pruned address space only holds the nodes of the plan it was started with
+        aspace = emitter.server.iserver.aspace
+        missing = {node["nodeid"] for name in updated for node in plan["sheets"][name]["nodes"]} - set(aspace.keys())
+        if missing:
+            logger.warning(f"{len(missing)} nodes of the reloaded workbook are not in the pruned address space; "
+                           f"restart the server to rebuild it")
+    for name in diff["removed"]:
+        event_fields.pop(name, None)
+    # The mapping and the simulator are updated before the first await, together with the swapped sheets
+    for name in updated:
+        event_fields[name] = await emitter.map_fields(plan["sheets"][name]["nodes"])
+    if simulator is not None and INSTANCE_SCENARIO in updated:
+        simulator.load_sheet(plan["sheets"][INSTANCE_SCENARIO], event_fields[INSTANCE_SCENARIO])
+        logger.info(f"Simulated instances now play the reloaded scenario '{INSTANCE_SCENARIO}'")
+    if history is not None:
+        nodeids = [node["nodeid"] for name in updated for node in plan["sheets"][name]["nodes"]
+                   if not is_event_specific(node["name"]) and node["nodeid"] not in history.storage.values]
+        if nodeids:
+            await history.historize(nodeids, load=False)
+            logger.info(f"Historizing {len(nodeids)} variables added by the reloaded workbook")
+
+# Replay a recorded client log over and over
+async def play_replay(replay):
     """
-    Asynchronous input function to handle user input.
+    Replay a recorded client log in a loop instead of the scenarios.
 
     Parameters:
-        prompt (str): The prompt message to display.
+        replay (LogReplay): The replay of the log, bound to a writer.
 
     Returns:
-        str: The user input.
+        None
     """
-    loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(None, input, prompt)
-
-# Trigger events for event-specific nodes
-async def trigger_event(server, event_type_node, instance, step_data, nodes):
+    while True:
+        logger.info(f"Replaying {replay.path} at {replay.speed:g}x")
+        write_counters = dict(replay.writer.counters)
+        replay_counters = dict(replay.counters)
+        lateness = await replay.play()
+        records = replay.counters["records"] - replay_counters["records"]
+        slices = replay.counters["slices"] - replay_counters["slices"]
+        coalesced = replay.counters["coalesced"] - replay_counters["coalesced"]
+        logger.info(f"Replay completed: {records} records in {slices} batched writes, {coalesced} coalesced",
+                    extra={"records": records, "slices": slices, "coalesced": coalesced})
+        report_write_counters("Replay", replay.writer, write_counters)
+        report_lateness("Replay", lateness)
+
+# Run a background task next to the scenarios, stopping the server if it fails
+def start_background_task(coroutine, name, tasks, failures):
     """
-    Trigger events for event-specific nodes.
+    Start a background task and watch it for failures.
+
+    A task that raises is logged and cancels the current (main) task, so the
+    server shuts down through its cleanup instead of running on without it.
 
     Parameters:
-        server (Server): The OPC UA server instance.
-        event_type_node (Node): The event type node.
-        instance (Node): The instance node.
-        step_data (dict): The data for the current scenario step.
-        nodes (list[dict]): A list of dictionaries containing node information from the Excel file.
+        coroutine (coroutine): The coroutine to run, e.g. simulator.run().
+        name (str): The name of the task in the log.
+        tasks (list[asyncio.Task]): The running background tasks, appended to.
+        failures (list[BaseException]): The exceptions of failed tasks, appended to.
 
     Returns:
-        None
+        asyncio.Task: The started task.
     """
-    event = await server.get_event_generator(event_type_node, instance)
-    event.event.Severity = 500
-    event.event.Message = ua.LocalizedText("Event triggered with scenario values")
-    
-    for node_info in nodes:
-        if node_info["name"] in EVENT_SPECIFIC_NODES:
-            value = step_data.get(node_info["name"], False if node_info["datatype"] == "Boolean" else 0)
-            variant_type = ua.VariantType.Boolean if node_info["datatype"] == "Boolean" else ua.VariantType.Int32
-            setattr(event.event, node_info["name"].capitalize(), ua.Variant(value, variant_type))
+    main_task = asyncio.current_task()
 
-            # Print the update in the desired format
-            print(f"Updated {node_info['name']} (ns={node_info['ns']}; i={node_info['i']}) to {value}")
+    def done(task):
+        if task.cancelled() or task.exception() is None:
+            return
+        failures.append(task.exception())
+        logger.error(f"{name} failed, stopping the server", exc_info=task.exception())
+        main_task.cancel()
 
-    await event.trigger()
+    task = asyncio.create_task(coroutine, name=name)
+    task.add_done_callback(done)
+    tasks.append(task)
+    return task
 
 # Main server setup and scenario handling
 async def main():
@@ -230,7 +290,18 @@ async def main():
     """
     
     server = Server()
-    await server.init()
+    # Serve HistoryRead from the in-memory (optionally SQLite-backed) history store
+    history = None
+    if HISTORY_ENABLED:
+        history = DiagnosticHistoryManager(server.iserver)
+        server.iserver.history_manager = history
+    # Compile the workbook once (or load the cached plan, or the supervisor's shared plan) instead of re-reading it every loop
+    plan = load_shared_plan(PLAN_SHARED_MEMORY) if PLAN_SHARED_MEMORY else load_scenario_plan(SCENARIO_WORKBOOK)
+    # Initialize from the address space snapshot, or import the nodesets if it is stale; pruned to what the plan needs if enabled
+    if PRUNE_ADDRESS_SPACE:
+        await init_pruned_address_space(server, plan)
+    else:
+        await init_address_space(server)
 
     # Use environment variables for the endpoint and server name
     server_name = os.getenv("OPCUA_SERVER_NAME", "BL4R3 SDI OPC UA")
@@ -240,84 +311,141 @@ async def main():
     server.set_endpoint(endpoint)
     server.set_server_name(server_name)
 
-    await server.import_xml("eulynx.generic.bl4r3.rev01.xml")
-    await server.import_xml("eulynx.manufacturer.example.bl4r3.rev01.xml")
-    await server.import_xml("mdm.rev01.xml")
-
-    point_turn_event_type_node = server.get_node("ns=2;i=1123")
     # Define S10 instance object 
     instance_objects = [server.get_node("ns=4;i=5057")]
 
-    print(f"OPC UA Server '{server_name}' is running on endpoint: {endpoint}")
-
-    # # Automatically play the default scenario at startup
-    # print("Automatically playing the 'default' scenario...")
-    # nodes = load_node_info("BL4R3-rev01-Diagnostic_NodeID_List-scenario.xlsx", sheet_name="default")
-    # await update_data_access_view(server, nodes)
-    # print("Default scenario completed. Waiting for scenario selection...")
+    logger.info(f"OPC UA Server '{server_name}' is running on endpoint: {endpoint}")
 
     """
     ***TEMPORARY***
-    Define the scenarios to run in sequence
+    Define the scenarios to run in sequence, one playlist per concurrent track
     """
-    scenarios = ["default", "1", "default", "2"]
-    
-    async with server:
-        while True:
-            """
-             ***TEMPORARY***
-             Loop scenario
-            """
-            for scenario_choice in scenarios:
-                print(f"Playing scenario: {scenario_choice}")
-                nodes = load_node_info("BL4R3-rev01-Diagnostic_NodeID_List-scenario.xlsx", sheet_name=scenario_choice)
-
-                if scenario_choice == "default":
-                    await update_data_access_view(server, nodes)
-                else:
-                    scenario_steps = load_scenario_steps("BL4R3-rev01-Diagnostic_NodeID_List-scenario.xlsx", sheet_name=scenario_choice)
-                    for step_data in scenario_steps:
-                        await update_data_access_view(server, nodes, step_data)
-                        for instance in instance_objects:
-                            await trigger_event(server, point_turn_event_type_node, instance, step_data, nodes)
-                        await asyncio.sleep(5)
-                print(f"Scenario {scenario_choice} completed.")
-                await asyncio.sleep(15)
-
-            print("Completed all scenarios, starting over...")
-            
-            
-            # scenario_choice = await async_input("Enter scenario sheet name ('default', '1', '2', 'exit' to shut down): ")
-            # if scenario_choice.lower() == "exit":
-            #     print("Shutting down the server...")
-            #     break
-            # elif scenario_choice in ["default", "1", "2"]:
-            #     print(f"Playing scenario: {scenario_choice}")
-            #     nodes = load_node_info("BL4R3-rev01-Diagnostic_NodeID_List-scenario.xlsx", sheet_name=scenario_choice)
-
-            #     if scenario_choice == "default":
-            #         await update_data_access_view(server, nodes)
-            #     else:
-            #         scenario_steps = load_scenario_steps("BL4R3-rev01-Diagnostic_NodeID_List-scenario.xlsx", sheet_name=scenario_choice)
-            #         for step_data in scenario_steps:
-            #             await update_data_access_view(server, nodes, step_data)
-            #             for instance in instance_objects:
-            #                 await trigger_event(server, point_turn_event_type_node, instance, step_data, nodes)
-            #             await asyncio.sleep(1)
-            #     print(f"Scenario {scenario_choice} completed.")
-
-            #     # Automatically run the default scenario after scenario 1 or 2
-            #     if scenario_choice in ["1", "2"]:
-            #         print("Running 'default' scenario after completing scenario:", scenario_choice)
-            #         nodes = load_node_info("BL4R3-rev01-Diagnostic_NodeID_List-scenario.xlsx", sheet_name="default")
-            #         await update_data_access_view(server, nodes)
-            #         print("Default scenario completed.")
-                    
-            # else:
-            #     print("Invalid choice. Please enter a valid scenario sheet name ('default', '1', '2', or 'exit').")
-
-    # print("Server stopped.")
-    # await server.stop()
+    tracks = parse_tracks(SCENARIO_TRACKS)
+
+    writer = DataAccessViewWriter(server)
+
+    # One PointTurn event generator per instance, and the event fields of each sheet, set up once
+    emitter = EventEmitter(server, POINT_TURN_EVENT_TYPE)
+    await emitter.prepare(instance_objects)
+    event_fields = {name: await emitter.map_fields(sheet["nodes"]) for name, sheet in plan["sheets"].items()}
+
+    # One writer per scenario track (and one for ingested samples), all recording into the history.
+    # They write the same S10 nodes, so they share the last written values the delta check compares against.
+    writers = [writer] + [DataAccessViewWriter(server, writer.last_values) for _ in tracks[1:]]
+    # Optionally accept field-element samples pushed over local sockets, with a writer of their own
+    ingest = None
+    if INGEST_TCP_PORT or INGEST_UDP_PORT or INGEST_SOCKET:
+        ingest = LiveIngest(plan, DataAccessViewWriter(server, writer.last_values))
+        writers.append(ingest.writer)
+    if history is not None:
+        nodeids = [node["nodeid"] for sheet in plan["sheets"].values() for node in sheet["nodes"]
+                   if not is_event_specific(node["name"])]
+        loaded = await history.historize(nodeids, [instance.nodeid for instance in instance_objects])
+        for track_writer in writers:
+            track_writer.recorders.append(history.storage)
+        emitter.recorders.append(history.storage)
+        logger.info(f"Historizing {len(history.storage.values)} variables and the PointTurn events of "
+                    f"{len(instance_objects)} instances ({loaded} entries reloaded)")
+
+    # Optionally simulate many point machines cloned from the S10 instance, with their own write counters
+    simulator = None
+    if INSTANCE_COUNT > 0:
+        clone_start = time.perf_counter()
+        names, paths, namespace_idx = await clone_instances(server, server.get_node(INSTANCE_TEMPLATE), INSTANCE_COUNT)
+        simulator = InstanceSimulator(DataAccessViewWriter(server), plan["sheets"][INSTANCE_SCENARIO], names, paths, namespace_idx,
+                                      emitter=emitter, event_fields=event_fields[INSTANCE_SCENARIO])
+        await emitter.prepare(simulator.sources)
+        await simulator.write_defaults(plan["sheets"]["default"])
+        logger.info(f"Simulating {INSTANCE_COUNT} instances of {INSTANCE_TEMPLATE} playing scenario '{INSTANCE_SCENARIO}' "
+                    f"(cloned in {time.perf_counter() - clone_start:.2f} s)")
+
+    # Optionally publish every write and PointTurn event to an AMQP broker in batched envelopes
+    bridge = open_bridge(server_name)
+    if bridge is not None:
+        for track_writer in writers + ([simulator.writer] if simulator is not None else []):
+            track_writer.recorders.append(bridge)
+        emitter.recorders.append(bridge)
+        bridge.start()
+        REGISTRY.counters("opcua_amqp", bridge.counters, "AMQP bridge {key} count")
+        logger.info(f"Publishing to AMQP in batches of up to {bridge.batch_size} records "
+                    f"every {bridge.linger_seconds:g} s ({bridge.compression or 'uncompressed'})")
+
+    # Prometheus metrics of the hot path, the sessions and the subscriptions
+    register_server_metrics(server)
+    if history is not None:
+        REGISTRY.counters("opcua_history", history.storage.counters, "History store {key} count")
+    if simulator is not None:
+        REGISTRY.counters("opcua_simulator", simulator.counters, "Instance simulator {key} count")
+    if ingest is not None:
+        REGISTRY.counters("opcua_ingest", ingest.counters, "Live ingest {key} count")
+
+    # Watch the workbook (or, under the supervisor, the plan it shares) and apply its changed sheets without restarting
+    reloader = None
+    if RELOAD_SECONDS > 0 and not REPLAY_LOG:
+        reloader = ScenarioReloader(plan, SCENARIO_WORKBOOK, shared=PLAN_SHARED_MEMORY)
+        reloader.listeners.append(
+            lambda plan, diff: apply_scenario_reload(plan, diff, emitter, event_fields, history, simulator))
+        REGISTRY.counters("opcua_scenario_reload", reloader.counters, "Scenario workbook reload {key} count")
+
+    # SIGTERM (docker stop, the supervisor) cancels main() like Ctrl+C, so the cleanup below runs
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    tasks, failures = [], []
+    try:
+        async with server:
+            if METRICS_PORT:
+                # A busy port, e.g. a second local server with the same OPCUA_METRICS_PORT, must not stop OPC UA
+                try:
+                    await start_metrics_server()
+                    logger.info(f"Serving metrics on port {METRICS_PORT} at /metrics")
+                except OSError as e:
+                    logger.warning(f"Could not serve metrics on port {METRICS_PORT}: {e}")
+            if simulator is not None:
+                start_background_task(simulator.run(), "Instance simulator", tasks, failures)
+            if ingest is not None:
+                endpoints = await ingest.start()
+                start_background_task(ingest.run(), "Live ingest", tasks, failures)
+                logger.info(f"Ingesting JSON-lines samples on {', '.join(endpoints)}, "
+                            f"coalesced over {ingest.interval:g} s")
+            if reloader is not None:
+                start_background_task(reloader.run(), "Scenario reloader", tasks, failures)
+                source = "the supervisor's scenario plan" if PLAN_SHARED_MEMORY else SCENARIO_WORKBOOK
+                logger.info(f"Reloading {source} when it changes (checked every {RELOAD_SECONDS:g} s)")
+
+            # Replay a recorded log, or play each track against its own timeline; tracks run concurrently
+            if REPLAY_LOG:
+                replay = LogReplay(REPLAY_LOG, writer)
+                REGISTRY.counters("opcua_replay", replay.counters, "Log replay {key} count")
+                await play_replay(replay)
+            await asyncio.gather(*(
+                play_scenarios(plan, scenarios, writers[index], emitter,
+                               event_fields, instance_objects, f"[Track {index + 1}] " if len(tracks) > 1 else "",
+                               str(index + 1))
+                for index, scenarios in enumerate(tracks)
+            ))
+            # Without scenario tracks (OPCUA_SCENARIO_TRACKS="") the server only serves ingested values
+            await asyncio.Event().wait()
+    finally:
+        # Stop the background tasks first, so nothing is recorded after the bridge is closed
+        if ingest is not None:
+            ingest.close()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Publish what the AMQP outbox still holds; close() joins the publisher thread, so off the loop
+        if bridge is not None:
+            await loop.run_in_executor(None, bridge.close)
+            logger.info(f"AMQP bridge closed: {bridge.counters['records']} records published, "
+                        f"{bridge.counters['failed']} failed", extra=dict(bridge.counters))
+        if failures:
+            # A failed background task stopped the server; exit with an error so it is restarted
+            raise SystemExit(1)
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    setup_logging()
+    # With OPCUA_WORKERS > 1 this process only supervises the server workers
+    try:
+        asyncio.run(supervise() if SERVER_WORKERS > 1 else main())
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        # Stopped by Ctrl+C or SIGTERM after the cleanup in main() ran
+        pass
@@ -0,0 +1,342 @@
+import asyncio
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+from address_space_pruning import PRUNE_ADDRESS_SPACE, build_pruned_snapshot, prune_seeds, read_fresh_pruned_header
+from address_space_snapshot import build_snapshot, read_fresh_snapshot_header
+from instance_simulator import INSTANCE_COUNT, INSTANCE_SEED
+from instrumentation import METRICS_PORT, Counter, Gauge, Registry, start_metrics_server
+from log_replay import REPLAY_LOG
+from scenario_plan import SCENARIO_WORKBOOK, SharedScenarioPlan, load_scenario_plan
+from scenario_reload import RELOAD_SECONDS, ScenarioReloader
+
+logger = logging.getLogger(__name__)
+
+# Server worker processes; OPCUA_WORKERS=1 runs the server in this process
+SERVER_WORKERS = int(os.getenv("OPCUA_WORKERS", 1))
+# Worker i listens on the configured port plus i * stride, and serves metrics on the metrics port plus (i + 1) * stride
+WORKER_PORT_STRIDE = int(os.getenv("OPCUA_WORKER_PORT_STRIDE", 1))
+# Metrics port the worker ports count from when the supervisor serves no metrics; the workers are scraped either way
+WORKER_METRICS_PORT = int(os.getenv("OPCUA_WORKER_METRICS_PORT", 9464))
+# Seconds between aggregate health reports, and before a crashed worker is restarted
+HEALTH_SECONDS = float(os.getenv("OPCUA_HEALTH_SECONDS", 30))
+RESTART_SECONDS = float(os.getenv("OPCUA_WORKER_RESTART_SECONDS", 5))
+# Consecutive failed health checks after which a running worker is restarted, 0 to never restart it
+UNHEALTHY_CHECKS = int(os.getenv("OPCUA_WORKER_UNHEALTHY_CHECKS", 3))
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+
+# Metrics of the workers summed into the supervisor's health
+AGGREGATED_METRICS = {
+    "opcua_connections": "Open client connections of all workers",
+    "opcua_sessions": "Activated client sessions of all workers",
+    "opcua_subscriptions": "Client subscriptions of all workers",
+    "opcua_monitored_items": "Monitored items of all workers",
+    "opcua_write_values_total": "Values written, skipped or failed by all workers",
+    "opcua_events_total": "Events triggered by all workers",
+}
+
+# Split the simulated instances across the workers
+def shard_counts(total, workers):
+    """
+    Split a number of instances into near-equal shards.
+
+    Parameters:
+        total (int): The number of simulated instances.
+        workers (int): The number of workers.
+
+    Returns:
+        list[int]: The instances of each worker; the first shards get the remainder.
+    """
+    return [total // workers + (1 if index < total % workers else 0) for index in range(workers)]
+
+# Sum the samples of a Prometheus exposition by metric name
+def sum_samples(text):
+    """
+    Sum the samples of each metric in a Prometheus text exposition over all labels.
+
+    Parameters:
+        text (str): The exposition.
+
+    Returns:
+        dict: The summed value per metric name, and the value of every
+        labelled sample under its full name, e.g. 'opcua_write_values_total{result="written"}'.
+    """
+    totals = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        sample, value = line.rsplit(" ", 1)
+        name = sample.split("{")[0]
+        totals[name] = totals.get(name, 0.0) + float(value)
+        if sample != name:
+            totals[sample] = float(value)
+    return totals
+
+class Supervisor:
+    """
+    Runs several server.py workers, each serving a shard of the simulated instances.
+
+    Worker i gets its own port and endpoint, metrics port, server name,
+    instance shard (named after the instances of the shards before it) and
+    seed. Every worker loads the compiled scenario plan from the same shared
+    memory instead of the workbook; with a reloader, the supervisor watches
+    the workbook and republishes the plan, compiled once, to the workers.
+    Crashed workers are restarted after RESTART_SECONDS. The health loop
+    scrapes the workers' /metrics, restarts workers that failed
+    UNHEALTHY_CHECKS scrapes in a row and keeps the sums for the
+    supervisor's own /metrics.
+    """
+
+    def __init__(self, workers=SERVER_WORKERS, shared_plan=None, environ=None, stride=WORKER_PORT_STRIDE,
+                 metrics_port=METRICS_PORT, reloader=None):
+        environ = dict(os.environ if environ is None else environ)
+        self.shared_plan = shared_plan
+        self.reloader = reloader
+        self.metrics_port = metrics_port
+        self.workers = []
+        port = int(environ.get("OPCUA_SERVER_PORT", 4840))
+        name = environ.get("OPCUA_SERVER_NAME", "BL4R3 SDI OPC UA")
+        endpoint = environ.get("OPCUA_ENDPOINT", f"opc.tcp://0.0.0.0:{port}/EULYNX")
+        offset = 0
+        for index, count in enumerate(shard_counts(INSTANCE_COUNT, workers)):
+            worker_port = port + index * stride
+            env = dict(environ,
+                       OPCUA_WORKERS="1",
+                       OPCUA_WORKER_INDEX=str(index),
+                       OPCUA_SERVER_PORT=str(worker_port),
+                       OPCUA_ENDPOINT=endpoint.replace(f":{port}", f":{worker_port}", 1),
+                       OPCUA_SERVER_NAME=f"{name} #{index + 1}",
+                       OPCUA_METRICS_PORT=str((metrics_port or WORKER_METRICS_PORT) + (index + 1) * stride),
+                       OPCUA_INSTANCES=str(count),
+                       OPCUA_INSTANCE_OFFSET=str(offset),
+                       OPCUA_INSTANCE_SEED=str(INSTANCE_SEED + index))
+            if shared_plan is not None:
+                env["OPCUA_PLAN_SHM"] = shared_plan.name
+            if environ.get("OPCUA_HISTORY_DB"):
+                env["OPCUA_HISTORY_DB"] = f"{environ['OPCUA_HISTORY_DB']}.{index}"
+            self.workers.append({"index": index, "env": env, "process": None, "exited": None, "metrics": {},
+                                 "failed_checks": 0})
+            offset += count
+        self.counters = {"starts": 0, "restarts": 0, "unhealthy": 0}
+
+        self.registry = Registry()
+        self.registry.register(Gauge("opcua_workers", "Configured server workers", callback=lambda: len(self.workers)))
+        self.registry.register(Gauge("opcua_workers_running", "Running server workers", callback=lambda: sum(
+            1 for worker in self.workers if worker["process"] is not None and worker["process"].poll() is None)))
+        self.registry.register(Gauge("opcua_workers_healthy", "Workers whose metrics were scraped at the last check",
+                                     callback=lambda: sum(1 for worker in self.workers if worker["metrics"])))
+        self.registry.counters("opcua_worker", self.counters, "Server worker {key} count")
+        if reloader is not None:
+            self.registry.counters("opcua_scenario_reload", reloader.counters, "Scenario workbook reload {key} count")
+        for metric_name, help_text in AGGREGATED_METRICS.items():
+            metric = Counter if metric_name.endswith("_total") else Gauge
+            self.registry.register(_AggregateMetric(metric, metric_name, help_text, self))
+
+    def start_worker(self, worker):
+        worker["process"] = subprocess.Popen([sys.executable, SERVER_SCRIPT], env=worker["env"],
+                                             cwd=os.path.dirname(SERVER_SCRIPT))
+        worker["exited"] = None
+        worker["failed_checks"] = 0
+        self.counters["starts"] += 1
+        env = worker["env"]
+        logger.info(f"Started worker {worker['index'] + 1} (pid {worker['process'].pid}) on {env['OPCUA_ENDPOINT']} "
+                    f"with {env['OPCUA_INSTANCES']} instances")
+
+    def check_workers(self):
+        """
+        Restart the workers that exited more than RESTART_SECONDS ago.
+
+        Returns:
+            None
+        """
+        now = time.monotonic()
+        for worker in self.workers:
+            process = worker["process"]
+            if process is None or process.poll() is None:
+                continue
+            if worker["exited"] is None:
+                worker["exited"] = now
+                worker["metrics"] = {}
+                logger.warning(f"Worker {worker['index'] + 1} exited with code {process.returncode}, "
+                               f"restarting in {RESTART_SECONDS:g} s")
+            elif now - worker["exited"] >= RESTART_SECONDS:
+                self.counters["restarts"] += 1
+                self.start_worker(worker)
+
+    def scrape(self, worker):
+        port = worker["env"]["OPCUA_METRICS_PORT"]
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+                return sum_samples(response.read().decode())
+        except OSError:
+            return {}
+
+    async def check_health(self):
+        """
+        Scrape every running worker and log the aggregate health.
+
+        A worker that answered none of the last UNHEALTHY_CHECKS scrapes is
+        terminated, and restarted by check_workers() like a crashed one.
+
+        Returns:
+            dict: The summed metrics of the healthy workers.
+        """
+        loop = asyncio.get_running_loop()
+        running = [worker for worker in self.workers if worker["process"] is not None and worker["process"].poll() is None]
+        results = await asyncio.gather(*(loop.run_in_executor(None, self.scrape, worker) for worker in running))
+        for worker, metrics in zip(running, results):
+            worker["metrics"] = metrics
+            worker["failed_checks"] = 0 if metrics else worker["failed_checks"] + 1
+            if UNHEALTHY_CHECKS and worker["failed_checks"] >= UNHEALTHY_CHECKS:
+                self.counters["unhealthy"] += 1
+                logger.warning(f"Worker {worker['index'] + 1} did not serve its metrics on port "
+                               f"{worker['env']['OPCUA_METRICS_PORT']} for {worker['failed_checks']} checks, restarting it")
+                # A worker that did not exit on the previous terminate() is killed
+                if worker["failed_checks"] > UNHEALTHY_CHECKS:
+                    worker["process"].kill()
+                else:
+                    worker["process"].terminate()
+        totals = self.totals()
+        written = sum(worker["metrics"].get('opcua_write_values_total{result="written"}', 0.0) for worker in self.workers)
+        healthy = sum(1 for worker in self.workers if worker["metrics"])
+        logger.info(f"Workers: {len(running)}/{len(self.workers)} running, {healthy} healthy, "
+                    f"{int(totals.get('opcua_sessions', 0))} sessions, "
+                    f"{int(totals.get('opcua_monitored_items', 0))} monitored items, "
+                    f"{int(written)} values written, "
+                    f"{self.counters['restarts']} restarts",
+                    extra={"running": len(running), "healthy": healthy, "restarts": self.counters["restarts"]})
+        return totals
+
+    def totals(self):
+        totals = {}
+        for worker in self.workers:
+            for metric_name in AGGREGATED_METRICS:
+                totals[metric_name] = totals.get(metric_name, 0.0) + worker["metrics"].get(metric_name, 0.0)
+        return totals
+
+    async def run(self, stop):
+        """
+        Start the workers and supervise them until stop is set.
+
+        Parameters:
+            stop (asyncio.Event): Set to shut the workers down.
+
+        Returns:
+            None
+        """
+        for worker in self.workers:
+            self.start_worker(worker)
+        reload_task = None
+        if self.reloader is not None:
+            reload_task = asyncio.create_task(self.reloader.run())
+            logger.info(f"Reloading {self.reloader.path} for the workers when it changes "
+                        f"(checked every {self.reloader.interval:g} s)")
+        if self.metrics_port:
+            try:
+                await start_metrics_server(self.registry, port=self.metrics_port)
+                logger.info(f"Serving aggregate worker health on port {self.metrics_port} at /metrics")
+            except OSError as e:
+                logger.warning(f"Could not serve aggregate worker health on port {self.metrics_port}: {e}")
+        last_health = time.monotonic()
+        try:
+            while not stop.is_set():
+                try:
+                    await asyncio.wait_for(stop.wait(), 1)
+                except asyncio.TimeoutError:
+                    pass
+                self.check_workers()
+                if time.monotonic() - last_health >= HEALTH_SECONDS:
+                    last_health = time.monotonic()
+                    await self.check_health()
+                if reload_task is not None and reload_task.done():
+                    # A failed reloader stops the supervision, like a failed task stops a server
+                    reload_task.result()
+        finally:
+            if reload_task is not None:
+                reload_task.cancel()
+                await asyncio.gather(reload_task, return_exceptions=True)
+            self.stop()
+
+    def stop(self, timeout=10):
+        """
+        Terminate the workers and release the shared plan.
+
+        Returns:
+            None
+        """
+        for worker in self.workers:
+            if worker["process"] is not None and worker["process"].poll() is None:
+                worker["process"].terminate()
+        for worker in self.workers:
+            if worker["process"] is not None:
+                try:
+                    worker["process"].wait(timeout)
+                except subprocess.TimeoutExpired:
+                    worker["process"].kill()
+        if self.shared_plan is not None:
+            self.shared_plan.close()
+            self.shared_plan = None
+
+class _AggregateMetric:
+    """
+    A worker metric summed over the last scrape of every worker.
+    """
+
+    def __init__(self, metric_class, name, help_text, supervisor):
+        self.name = name
+        self.help_text = help_text
+        self.kind = metric_class.kind
+        self.supervisor = supervisor
+
+    def samples(self):
+        yield self.name, "", self.supervisor.totals()[self.name]
+
+# Run the server as a supervisor of several workers
+async def supervise(workers=SERVER_WORKERS):
+    """
+    Prepare the shared inputs once and supervise the server workers until SIGTERM or SIGINT.
+
+    The address space snapshot (or the pruned one, if pruning is enabled) is
+    built if it is missing or stale, so the workers do not each import the
+    nodesets, and the compiled scenario plan is published in shared memory.
+    Changes to the workbook are compiled here and republished to the workers.
+
+    Parameters:
+        workers (int): The number of workers.
+
+    Returns:
+        None
+    """
+    plan = load_scenario_plan(SCENARIO_WORKBOOK)
+    if PRUNE_ADDRESS_SPACE:
+        nodes, subtrees = prune_seeds(plan)
+        if read_fresh_pruned_header(nodes, subtrees) is None:
+            logger.info("Building the pruned address space snapshot for the workers")
+            await build_pruned_snapshot(nodes, subtrees)
+    elif read_fresh_snapshot_header() is None:
+        logger.info("Building the address space snapshot for the workers")
+        await build_snapshot()
+    shared_plan = SharedScenarioPlan(plan)
+    logger.info(f"Scenario plan shared with {workers} workers in {shared_plan.block.name} "
+                f"({shared_plan.block.size} bytes)")
+    reloader = None
+    if RELOAD_SECONDS > 0 and not REPLAY_LOG:
+        reloader = ScenarioReloader(plan, SCENARIO_WORKBOOK)
+
+        async def republish(plan, diff):
+            block = shared_plan.publish(plan)
+            logger.info(f"Reloaded scenario plan shared with the workers in {block.name} ({block.size} bytes)")
+
+        reloader.listeners.append(republish)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signal_number, stop.set)
+    await Supervisor(workers, shared_plan, reloader=reloader).run(stop)